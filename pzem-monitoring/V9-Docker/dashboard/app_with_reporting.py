@@ -4,9 +4,8 @@ PZEM 3-Phase Energy Monitoring Dashboard with Report Integration
 Enhanced version with improved code structure and error handling
 """
 
-from flask import Flask, render_template, jsonify, request
-from flask_socketio import SocketIO, emit
-import psycopg2
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from psycopg2.extras import RealDictCursor
 import json
 from datetime import datetime, timedelta
@@ -15,7 +14,8 @@ import time
 import logging
 from decimal import Decimal
 import os
-from psycopg2.pool import SimpleConnectionPool
+import re
+import numpy as np
 import pytz
 
 # Timezone Jakarta
@@ -23,6 +23,15 @@ JAKARTA_TZ = pytz.timezone('Asia/Jakarta')
 
 # Import report modules
 from report_routes import report_bp
+from report_jobs import job_manager
+from ingest_listener import IngestListener
+from live_protocol import DeltaTracker
+from db_pool import DatabasePool, install_green_psycopg
+from cache import TTLCache
+from energy_analytics import analyze_rollup_rows, to_float_array, to_seconds
+from downsampling import DOWNSAMPLE_MODES, downsample_indices
+from data_export import (EXPORT_FORMATS, ExportError, export_stream, parquet_available,
+                         resolve_time_range)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_secret_key_here'
@@ -32,6 +41,17 @@ socketio = SocketIO(app, cors_allowed_origins="*", logger=False)
 # Register report blueprint
 app.register_blueprint(report_bp)
 
+# Report job: progress dipompa dari greenlet Socket.IO, event dikirim ke room job
+job_manager.configure(start_background=socketio.start_background_task, sleep=socketio.sleep)
+
+def report_job_room(job_id):
+    return f"report:{job_id}"
+
+def push_report_job_event(event, job):
+    socketio.emit(event, job, to=report_job_room(job['job_id']))
+
+job_manager.add_listener(push_report_job_event)
+
 # Setup logging with Windows compatibility
 logging.basicConfig(
     level=logging.INFO,
@@ -43,6 +63,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Di bawah gunicorn -k eventlet: query psycopg2 harus yield ke hub, sebelum koneksi pertama dibuat
+install_green_psycopg()
+
 DB_CONFIG = {
     'host': os.getenv('DB_HOST', 'localhost'),
     'database': os.getenv('DB_NAME', 'pzem_monitoring'),
@@ -50,58 +73,82 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASS', 'Admin123')
 }
 
+# Push penuh berkala (status online/offline, device yang hilang); data baru dikirim via NOTIFY
+LIVE_HEARTBEAT_SECONDS = int(os.getenv('LIVE_HEARTBEAT_SECONDS', '60'))
+CHART_MAX_POINTS = int(os.getenv('CHART_MAX_POINTS', '2000'))  # batas ?points= di /api/chart
+
 
 
 class DatabaseManager:
     def __init__(self):
-        self.connection = None
         self.jakarta_tz = pytz.timezone('Asia/Jakarta')
-        self.pool = SimpleConnectionPool(
-            minconn=1,
-            maxconn=10,
-            **DB_CONFIG
-        )
-        self.connect()
-        
-        # Optimization: Simple in-memory cache with TTL
-        self._cache = {}
+        # Semua query memakai pool; greenlet eventlet berjalan bersamaan berkat install_green_psycopg()
+        self.pool = DatabasePool(DB_CONFIG)
+        
+        # Cache query: TTL per key, LRU, single-flight (lihat cache.py)
+        self.cache = TTLCache()
+        # key -> (ttl detik, stale-while-revalidate detik)
+        # Entry dibuang saat NOTIFY ingest masuk (invalidate_ingest_cache); TTL hanya
+        # jaring pengaman (NOTIFY hilang) dan untuk nilai berbasis NOW() seperti status online
         self._cache_ttl = {
-            'system_status': 10,  # 10 seconds
-            'devices': 30,  # 30 seconds
-            'three_phase_summary': 15,  # 15 seconds
-            'all_latest': 5  # 5 seconds (most frequently updated)
+            'system_status': (30, 0),
+            'devices': (60, 30),
+            'three_phase_summary': (60, 0),
+            'all_latest': (30, 0),
+            'device_index': (60, 0)
         }
+        # Device di device_index terakhir; device yang belum dikenal di NOTIFY memaksa index di-load ulang
+        self._known_devices = frozenset()
+    
+    # Family entry cache per device: key (family, ..., device_address)
+    PER_DEVICE_CACHE_FAMILIES = ('latest', 'devices')
+    
+    def _cached(self, key, loader, ttl_key=None):
+        """Ambil dari cache atau jalankan loader (sekali untuk request yang bersamaan)"""
+        ttl, stale_ttl = self._cache_ttl.get(ttl_key or key, (10, 0))
+        return self.cache.get_or_load(key, loader, ttl=ttl, stale_ttl=stale_ttl)
+    
+    def _cached_per_device(self, family, load_devices, ttl_key):
+        """{device: nilai} untuk semua device, satu entry cache per device
+        
+        Hanya device yang tidak ada di cache yang di-query, dalam satu panggilan
+        load_devices(list device) -> {device: nilai}; device tanpa nilai tidak ikut di hasil.
+        """
+        devices = self._cached('device_index', self._load_device_index)
+        ttl, stale_ttl = self._cache_ttl[ttl_key]
+        keys = [family + (device,) for device in devices]
+        values = self.cache.get_many_or_load(
+            keys,
+            lambda missing: {family + (device,): value
+                             for device, value in load_devices([key[-1] for key in missing]).items()},
+            ttl=ttl, stale_ttl=stale_ttl)
+        return {key[-1]: values[key] for key in keys if values.get(key) is not None}
     
-    def _get_cache_key(self, key, *args):
-        """Generate cache key"""
-        return f"{key}_{hash(str(args))}"
-    
-    def _is_cache_valid(self, cache_key, ttl_seconds):
-        """Check if cache entry is still valid"""
-        if cache_key not in self._cache:
-            return False
-        
-        cache_time, _ = self._cache[cache_key]
-        age = (datetime.now() - cache_time).total_seconds()
-        return age < ttl_seconds
-    
-    def _get_cached(self, cache_key):
-        """Get value from cache if valid"""
-        if cache_key in self._cache:
-            _, value = self._cache[cache_key]
-            return value
-        return None
-    
-    def _set_cache(self, cache_key, value):
-        """Store value in cache"""
-        self._cache[cache_key] = (datetime.now(), value)
-        
-        # Clean old cache entries (keep only last 100 entries)
-        if len(self._cache) > 100:
-            # Remove oldest entries
-            sorted_cache = sorted(self._cache.items(), key=lambda x: x[1][0])
-            for key, _ in sorted_cache[:-100]:
-                del self._cache[key]
+    def _load_device_index(self):
+        """Daftar device (urut) dari pzem_latest, dasar entry cache per device"""
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT device_address FROM pzem_latest ORDER BY device_address")
+            devices = [row[0] for row in cursor.fetchall()]
+        self._known_devices = frozenset(devices)
+        return devices
+    
+    def invalidate_ingest_cache(self, device_addresses=None):
+        """Buang cache yang terpengaruh batch ingest baru
+        
+        Entry per device hanya dibuang untuk device di payload NOTIFY; ringkasan seluruh
+        sistem (system_status, three_phase_summary) selalu ikut berubah. None = device
+        tidak diketahui (payload terlalu besar), buang semua.
+        """
+        if device_addresses is None:
+            self.cache.invalidate_where(lambda key: True)
+            return
+        devices = set(device_addresses)
+        self.cache.invalidate('system_status', 'three_phase_summary')
+        if not devices <= self._known_devices:
+            self.cache.invalidate('device_index')
+        self.cache.invalidate_where(
+            lambda key: (isinstance(key, tuple) and key[0] in self.PER_DEVICE_CACHE_FAMILIES
+                         and key[-1] in devices))
     
     def get_jakarta_time(self):
         """Get current Jakarta time"""
@@ -119,18 +166,6 @@ class DatabaseManager:
         # Convert to Jakarta timezone
         return utc_datetime.astimezone(self.jakarta_tz)
 
-    def connect(self):
-        try:
-            self.connection = psycopg2.connect(**DB_CONFIG)
-            logger.info("[SUCCESS] Connected to PostgreSQL database")
-        except Exception as e:
-            logger.error(f"[ERROR] Database connection error: {e}")
-    
-    def get_connection(self):
-        if self.connection is None or self.connection.closed:
-            self.connect()
-        return self.connection
-    
     def serialize_data(self, data):
         """Convert datetime objects and Decimals to JSON serializable formats"""
         if isinstance(data, list):
@@ -150,63 +185,8 @@ class DatabaseManager:
     
     def get_system_status(self):
         """Status sistem dengan perhitungan online yang akurat (with caching)"""
-        cache_key = self._get_cache_key('system_status')
-        ttl = self._cache_ttl.get('system_status', 10)
-        
-        # Check cache first
-        if self._is_cache_valid(cache_key, ttl):
-            logger.debug("Returning cached system_status")
-            return self._get_cached(cache_key)
-        
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Total devices
-            cursor.execute("SELECT COUNT(DISTINCT device_address) as total FROM pzem_data")
-            total_devices = cursor.fetchone()['total'] or 0
-            
-            # Online devices dengan perhitungan yang akurat
-            cursor.execute("""
-                WITH latest_per_device AS (
-                    SELECT DISTINCT ON (device_address) 
-                        device_address, 
-                        created_at,
-                        COALESCE(power, 0) as power,
-                        COALESCE(energy, 0) as energy
-                    FROM pzem_data 
-                    ORDER BY device_address, created_at DESC
-                ),
-                online_devices AS (
-                    SELECT *,
-                        CASE WHEN created_at >= NOW() - INTERVAL '10 minutes' 
-                             THEN 1 ELSE 0 END as is_online
-                    FROM latest_per_device
-                )
-                SELECT 
-                    COUNT(*) as total_devices,
-                    SUM(is_online) as online_devices,
-                    SUM(CASE WHEN is_online = 1 THEN power ELSE 0 END) as total_power,
-                    SUM(CASE WHEN is_online = 1 THEN energy ELSE 0 END) as total_energy
-                FROM online_devices
-            """)
-            
-            stats = cursor.fetchone()
-            cursor.close()
-            
-            result = {
-                'total_devices': int(stats['total_devices'] or 0),
-                'online_devices': int(stats['online_devices'] or 0),
-                'total_active_power': float(stats['total_power'] or 0),
-                'total_energy': float(stats['total_energy'] or 0),
-                'jakarta_time': datetime.now(self.jakarta_tz).isoformat(),
-                'timezone': 'Asia/Jakarta'
-            }
-            
-            # Cache the result
-            self._set_cache(cache_key, result)
-            return result
-            
+            return self._cached('system_status', self._load_system_status)
         except Exception as e:
             logger.error(f"Error getting system status: {e}")
             error_result = {
@@ -220,60 +200,118 @@ class DatabaseManager:
             # Don't cache errors
             return error_result
     
-    def get_devices(self):
-        """Ambil daftar semua device dengan enhanced info – aman untuk banyak request paralel (with caching)"""
-        cache_key = self._get_cache_key('devices')
-        ttl = self._cache_ttl.get('devices', 30)
+    def _load_system_status(self):
+        """Query status sistem dari pzem_latest"""
+        with self.pool.connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                # Online devices dari pzem_latest (satu baris per device, diupdate saat ingest)
+                cursor.execute("""
+                    WITH online_devices AS (
+                        SELECT 
+                            COALESCE(power, 0) as power,
+                            COALESCE(energy, 0) as energy,
+                            CASE WHEN created_at >= NOW() - INTERVAL '10 minutes' 
+                                 THEN 1 ELSE 0 END as is_online
+                        FROM pzem_latest
+                    )
+                    SELECT 
+                        COUNT(*) as total_devices,
+                        SUM(is_online) as online_devices,
+                        SUM(CASE WHEN is_online = 1 THEN power ELSE 0 END) as total_power,
+                        SUM(CASE WHEN is_online = 1 THEN energy ELSE 0 END) as total_energy
+                    FROM online_devices
+                """)
+        
+                stats = cursor.fetchone()
         
-        # Check cache first
-        if self._is_cache_valid(cache_key, ttl):
-            logger.debug("Returning cached devices list")
-            return self._get_cached(cache_key)
+        result = {
+            'total_devices': int(stats['total_devices'] or 0),
+            'online_devices': int(stats['online_devices'] or 0),
+            'total_active_power': float(stats['total_power'] or 0),
+            'total_energy': float(stats['total_energy'] or 0),
+            'jakarta_time': datetime.now(self.jakarta_tz).isoformat(),
+            'timezone': 'Asia/Jakarta'
+        }
         
-        conn = None
+        return result
+    
+    def get_devices(self, hours=None):
+        """Ambil daftar semua device dengan enhanced info – aman untuk banyak request paralel (with caching)
+        
+        Tanpa `hours`: statistik sepanjang waktu dari pzem_device_stats (O(jumlah device)).
+        Dengan `hours`: statistik N jam terakhir dari tabel rollup (resolusi bucket).
+        """
         try:
-            conn = self.pool.getconn()   # ← ambil koneksi dari pool
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                query = """
-                SELECT 
-                    d.device_address,
-                    COALESCE(dm.device_name, 'Phase ' || d.device_address) as device_name,
-                    COALESCE(dm.location, 'Unknown') as location,
-                    COUNT(d.id) as data_count,
-                    MAX(d.created_at) as last_seen,
-                    AVG(d.power) as avg_power,
-                    AVG(d.voltage) as avg_voltage,
-                    AVG(d.current) as avg_current,
-                    AVG(d.power_factor) as avg_power_factor,
-                    MAX(d.energy) as total_energy,
-                    MIN(d.voltage) as min_voltage,
-                    MAX(d.voltage) as max_voltage,
-                    COALESCE(dm.status, 'active') as device_status
-                FROM pzem_data d
-                LEFT JOIN pzem_devices dm ON d.device_address = dm.device_address
-                GROUP BY d.device_address, dm.device_name, dm.location, dm.status
-                ORDER BY d.device_address
-                """
-                cursor.execute(query)
-                devices = cursor.fetchall()
-            result = [self.serialize_data(dict(device)) for device in devices]
-            
-            # Cache the result
-            self._set_cache(cache_key, result)
-            return result
+            if hours:
+                devices = self._cached_per_device(
+                    ('devices', hours), lambda addresses: self._load_devices_window(hours, addresses), 'devices')
+            else:
+                devices = self._cached_per_device(('devices',), self._load_devices, 'devices')
+            return list(devices.values())
         except Exception as e:
             logger.error(f"[ERROR] Error getting devices: {e}")
             return []
-        finally:
-            if conn:
-                self.pool.putconn(conn)  # ← kembalikan koneksi ke pool
+    
+    def _load_devices(self, device_addresses):
+        """Query device dari statistik berjalan (diupdate MQTT listener saat ingest) -> {device: row}"""
+        with self.pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            query = """
+            SELECT 
+                s.device_address,
+                COALESCE(dm.device_name, 'Phase ' || s.device_address) as device_name,
+                COALESCE(dm.location, 'Unknown') as location,
+                s.sample_count as data_count,
+                s.last_seen,
+                s.sum_power / NULLIF(s.sample_count, 0) as avg_power,
+                s.sum_voltage / NULLIF(s.sample_count, 0) as avg_voltage,
+                s.sum_current / NULLIF(s.sample_count, 0) as avg_current,
+                s.sum_power_factor / NULLIF(s.sample_count, 0) as avg_power_factor,
+                s.max_energy as total_energy,
+                s.min_voltage,
+                s.max_voltage,
+                COALESCE(dm.status, 'active') as device_status
+            FROM pzem_device_stats s
+            LEFT JOIN pzem_devices dm ON s.device_address = dm.device_address
+            WHERE s.device_address = ANY(%s)
+            ORDER BY s.device_address
+            """
+            cursor.execute(query, (list(device_addresses),))
+            devices = cursor.fetchall()
+        return {device['device_address']: self.serialize_data(dict(device)) for device in devices}
+    
+    def _load_devices_window(self, hours, device_addresses):
+        """Query device untuk N jam terakhir dari rollup 1 menit (<= 24 jam) atau 1 jam -> {device: row}"""
+        table = 'pzem_rollup_1m' if hours <= 24 else 'pzem_rollup_1h'
+        with self.pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            query = f"""
+            SELECT 
+                r.device_address,
+                COALESCE(dm.device_name, 'Phase ' || r.device_address) as device_name,
+                COALESCE(dm.location, 'Unknown') as location,
+                SUM(r.sample_count) as data_count,
+                MAX(r.last_at) as last_seen,
+                SUM(r.sum_power) / NULLIF(SUM(r.count_power), 0) as avg_power,
+                SUM(r.sum_voltage) / NULLIF(SUM(r.count_voltage), 0) as avg_voltage,
+                SUM(r.sum_current) / NULLIF(SUM(r.count_current), 0) as avg_current,
+                SUM(r.sum_power_factor) / NULLIF(SUM(r.count_power_factor), 0) as avg_power_factor,
+                MAX(r.max_energy) as total_energy,
+                MIN(r.min_voltage) as min_voltage,
+                MAX(r.max_voltage) as max_voltage,
+                COALESCE(dm.status, 'active') as device_status
+            FROM {table} r
+            LEFT JOIN pzem_devices dm ON r.device_address = dm.device_address
+            WHERE r.bucket >= NOW() - make_interval(hours => %s)
+            AND r.device_address = ANY(%s)
+            GROUP BY r.device_address, dm.device_name, dm.location, dm.status
+            ORDER BY r.device_address
+            """
+            cursor.execute(query, (hours, list(device_addresses)))
+            devices = cursor.fetchall()
+        return {device['device_address']: self.serialize_data(dict(device)) for device in devices}
     
     def get_device_data(self, device_address, period='hour', limit=100):
         """Ambil data device berdasarkan periode"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
             period_config = {
                 'hour': {'interval': '1 hour', 'limit': 60},
                 'day': {'interval': '1 day', 'limit': 144},
@@ -297,9 +335,10 @@ class DatabaseManager:
             LIMIT %s
             """
             
-            cursor.execute(query, (device_address, limit or default_limit))
-            data = cursor.fetchall()
-            cursor.close()
+            with self.pool.connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute(query, (device_address, limit or default_limit))
+                    data = cursor.fetchall()
             
             return [self.serialize_data(dict(row)) for row in data]
             
@@ -307,67 +346,62 @@ class DatabaseManager:
             logger.error(f"[ERROR] Error getting device data: {e}")
             return []
     
-    def get_aggregated_data(self, device_address, period='hour'):
-        """Data agregat dengan downsampling untuk performa yang lebih baik"""
+    # Rollup yang tersedia (tabel, lebar bucket dalam detik), dari yang paling halus
+    ROLLUP_TABLES = (
+        ('pzem_rollup_1m', 60),
+        ('pzem_rollup_15m', 900),
+        ('pzem_rollup_1h', 3600),
+        ('pzem_rollup_1d', 86400),
+    )
+    
+    # Rentang chart per periode dan jumlah titik default
+    CHART_PERIODS = {
+        'hour': {'interval': '1 hour', 'seconds': 3600, 'max_points': 60},  # 1 point per minute
+        'day': {'interval': '1 day', 'seconds': 86400, 'max_points': 96},  # 1 point per 15 minutes (24*4)
+        'week': {'interval': '1 week', 'seconds': 7 * 86400, 'max_points': 168},  # 1 point per hour (7*24)
+        'month': {'interval': '1 month', 'seconds': 30 * 86400, 'max_points': 120},  # 1 point per 6 hours (30*4)
+    }
+    
+    def _chart_rollup_table(self, period_seconds, points):
+        """Rollup paling kasar yang masih memberi minimal `points` bucket (transfer DB sekecil mungkin)"""
+        table = self.ROLLUP_TABLES[0][0]
+        for name, bucket_seconds in self.ROLLUP_TABLES:
+            if period_seconds // bucket_seconds >= points:
+                table = name
+        return table
+    
+    def get_aggregated_data(self, device_address, period='hour', points=None, mode='lttb'):
+        """Data chart dari tabel rollup (dikelola MQTT listener saat ingest)
+        
+        Di-downsample ke tepat `points` titik (default per periode) dengan mode 'lttb' atau
+        'minmax' sehingga lonjakan tetap terlihat.
+        """
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Konfigurasi dengan downsampling untuk performa
-            period_configs = {
-                'hour': {
-                    'interval': '1 hour',
-                    'group_by': "DATE_TRUNC('minute', created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jakarta')",
-                    'max_points': 60  # 1 point per minute
-                },
-                'day': {
-                    'interval': '1 day', 
-                    'group_by': "DATE_TRUNC('15 minutes', created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jakarta')",
-                    'max_points': 96  # 1 point per 15 minutes (24*4)
-                },
-                'week': {
-                    'interval': '1 week',
-                    'group_by': "DATE_TRUNC('hour', created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jakarta')", 
-                    'max_points': 168  # 1 point per hour (7*24)
-                },
-                'month': {
-                    'interval': '1 month',
-                    'group_by': "DATE_TRUNC('6 hours', created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jakarta')",
-                    'max_points': 120  # 1 point per 6 hours (30*4)
-                }
-            }
-            
-            config = period_configs.get(period, period_configs['hour'])
+            config = self.CHART_PERIODS.get(period, self.CHART_PERIODS['hour'])
+            points = min(max(int(points or config['max_points']), 2), CHART_MAX_POINTS)
+            if mode not in DOWNSAMPLE_MODES:
+                raise ValueError(f"Unknown downsampling mode: {mode}")
+            table = self._chart_rollup_table(config['seconds'], points)
             
+            # Baris per bucket (waktu dalam Jakarta timezone); energi reset-aware dan downsampling
+            # dihitung dengan NumPy
             query = f"""
-            SELECT 
-                {config['group_by']} as time_period,
-                AVG(voltage) as voltage,
-                AVG(current) as current,
-                AVG(power) as power,
-                AVG(voltage * current) as apparent_power,
-                MAX(energy) - MIN(energy) as energy_consumed,
-                AVG(frequency) as frequency,
-                AVG(power_factor) as power_factor,
-                COUNT(*) as sample_count
-            FROM pzem_data 
+            SELECT {self.CHART_ROLLUP_COLUMNS}
+            FROM {table}
             WHERE device_address = %s 
-            AND created_at >= NOW() - INTERVAL '{config['interval']}'
-            GROUP BY time_period
-            HAVING COUNT(*) > 0
-            ORDER BY time_period ASC
+            AND bucket >= NOW() - INTERVAL '{config['interval']}'
+            AND sample_count > 0
+            ORDER BY bucket ASC
             """
             
-            cursor.execute(query, (device_address,))
-            data = cursor.fetchall()
-            cursor.close()
+            with self.pool.connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute(query, (device_address,))
+                    rows = cursor.fetchall()
             
-            # Downsampling tambahan jika masih terlalu banyak points
-            if len(data) > config['max_points']:
-                # Ambil sample setiap N points
-                step = max(1, len(data) // config['max_points'])
-                data = data[::step][:config['max_points']]
-                logger.info(f"Downsampled {device_address} {period} data from {len(data)*step} to {len(data)} points")
+            data = self._rollup_chart_points(rows, points, mode)
+            if len(rows) > len(data):
+                logger.info(f"Downsampled {device_address} {period} data from {len(rows)} to {len(data)} points ({mode})")
             
             # Convert time periods untuk frontend
             result = []
@@ -379,188 +413,258 @@ class DatabaseManager:
                 
                 result.append(self.serialize_data(row_dict))
             
-            logger.info(f"Returning {len(result)} aggregated data points for {device_address} ({period})")
+            logger.info(f"Returning {len(result)} aggregated data points for {device_address} ({period}, {table})")
             return result
             
         except Exception as e:
             logger.error(f"Error getting aggregated data: {e}")
             return []
     
-    def get_all_latest_data(self):
-        """Ambil data terbaru dengan timestamp yang benar - FIXED VERSION (with caching)"""
-        cache_key = self._get_cache_key('all_latest')
-        ttl = self._cache_ttl.get('all_latest', 5)
+    # Kolom rollup untuk _rollup_chart_points (waktu bucket dalam Jakarta timezone)
+    CHART_ROLLUP_COLUMNS = """
+                bucket AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jakarta' as time_period,
+                sample_count, sum_voltage, sum_current, sum_power, sum_apparent_power,
+                sum_frequency, sum_power_factor,
+                count_voltage, count_current, count_power, count_apparent_power,
+                count_frequency, count_power_factor,
+                first_at, last_at, first_power, last_power, first_energy, last_energy, max_energy"""
+    
+    ROLLUP_MEAN_FIELDS = ('voltage', 'current', 'power', 'apparent_power', 'frequency', 'power_factor')
+    
+    def _rollup_chart_points(self, rows, points, mode):
+        """Bucket rollup -> titik chart: rata-rata tertimbang per bucket, lalu downsampling
+        
+        Nilai rata-rata diambil dari bucket terpilih (lonjakan tetap utuh); energi dan jumlah
+        sampel dijumlahkan atas semua bucket sejak titik sebelumnya agar total tidak hilang.
+        """
+        if not rows:
+            return []
+        profile = analyze_rollup_rows(rows)
+        counts = np.array([row['sample_count'] for row in rows], dtype=np.float64)
+        means = {}
+        for field in self.ROLLUP_MEAN_FIELDS:
+            values = to_float_array(row[f'sum_{field}'] for row in rows)
+            field_counts = np.array([row[f'count_{field}'] for row in rows], dtype=np.float64)
+            # Dibagi jumlah sampel yang nilainya tidak NULL; NaN jika semua sampel bucket NULL
+            means[field] = np.divide(values, field_counts, out=np.full_like(values, np.nan),
+                                     where=field_counts > 0)
+        
+        selected = np.arange(len(rows))
+        if len(rows) > points:
+            times = to_seconds([row['time_period'] for row in rows])
+            selected = downsample_indices(times, means['power'], points, mode)
+        owned_starts = np.concatenate(([0], selected[:-1] + 1))
+        energy = np.add.reduceat(profile.segment_kwh, owned_starts)
+        sample_counts = np.add.reduceat(counts, owned_starts)
         
-        # Check cache first (short TTL for latest data)
-        if self._is_cache_valid(cache_key, ttl):
-            logger.debug("Returning cached all_latest_data")
-            return self._get_cached(cache_key)
+        data = []
+        for i, index in enumerate(selected):
+            point = {'time_period': rows[index]['time_period']}
+            for field in self.ROLLUP_MEAN_FIELDS:
+                value = means[field][index]
+                point[field] = None if np.isnan(value) else float(value)
+            point['energy_consumed'] = float(energy[i])
+            point['sample_count'] = int(sample_counts[i])
+            data.append(point)
+        return data
+    
+    def get_latest_chart_point(self, device_address):
+        """Bucket 1 menit terakhir (bentuk sama dengan get_aggregated_data period 'hour')
         
+        Bucket sebelumnya ikut dibaca agar energi dihitung sama seperti di chart: langkah
+        counter antar bucket, reset dan wrap ditangani energy_analytics.
+        """
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Query dengan konversi timezone yang benar
-            query = """
-            SELECT DISTINCT ON (device_address) 
-                device_address,
-                COALESCE(voltage, 0) as voltage,
-                COALESCE(current, 0) as current,
-                COALESCE(power, 0) as power,
-                COALESCE(energy, 0) as energy,
-                COALESCE(frequency, 50.0) as frequency,
-                COALESCE(power_factor, 1.0) as power_factor,
-                wifi_rssi,
-                device_timestamp,
-                device_status,
-                data_quality,
-                timestamp_utc,
-                created_at,
-                -- Konversi timezone untuk Jakarta
-                created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jakarta' as created_at_jakarta,
-                CASE 
-                    WHEN timestamp_utc IS NOT NULL 
-                    THEN timestamp_utc AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jakarta'
-                    ELSE created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jakarta'
-                END as timestamp_jakarta,
-                -- Hitung apakah device online (data dalam 10 menit terakhir)
-                CASE 
-                    WHEN created_at >= NOW() - INTERVAL '10 minutes' THEN true
-                    ELSE false
-                END as is_online,
-                -- Hitung selisih waktu dalam menit
-                EXTRACT(EPOCH FROM (NOW() - created_at))/60 as minutes_since_last_data
-            FROM pzem_data 
-            WHERE created_at >= NOW() - INTERVAL '24 hours'
-            ORDER BY device_address, created_at DESC
-            """
-            
-            cursor.execute(query)
-            data = cursor.fetchall()
-            cursor.close()
-            
-            logger.info(f"Retrieved {len(data)} devices from database")
-            
-            result = {}
-            for row in data:
-                try:
-                    device_data = dict(row)
-                    device_address = row['device_address']
-                    
-                    # Format timestamps untuk frontend
-                    if device_data['created_at_jakarta']:
-                        device_data['created_at_jakarta'] = device_data['created_at_jakarta'].isoformat()
-                    
-                    if device_data['timestamp_jakarta']:
-                        device_data['timestamp_jakarta'] = device_data['timestamp_jakarta'].isoformat()
-                    
-                    if device_data['created_at']:
-                        device_data['created_at'] = device_data['created_at'].isoformat()
-                    
-                    if device_data['timestamp_utc']:
-                        device_data['timestamp_utc'] = device_data['timestamp_utc'].isoformat()
-                    
-                    # Add alias fields for backward compatibility
-                    device_data['avg_power'] = device_data['power']
-                    device_data['avg_voltage'] = device_data['voltage']
-                    device_data['avg_current'] = device_data['current']
-                    device_data['total_energy'] = device_data['energy']
-                    
-                    # Status informasi
-                    device_data['online_status'] = device_data['is_online']
-                    device_data['last_seen_minutes'] = float(device_data['minutes_since_last_data'] or 0)
-                    
-                    # Serialize data
-                    serialized_data = self.serialize_data(device_data)
-                    result[device_address] = serialized_data
-                    
-                    logger.debug(f"Device {device_address}: online={device_data['is_online']}, last_seen={device_data['last_seen_minutes']:.1f}min ago")
-                    
-                except Exception as device_error:
-                    logger.error(f"Error processing device {row.get('device_address', 'unknown')}: {device_error}")
-                    continue
-            
-            logger.info(f"Final result contains {len(result)} devices")
-            
-            # Cache the result
-            self._set_cache(cache_key, result)
-            return result
-            
+            with self.pool.connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute(f"""
+                    SELECT {self.CHART_ROLLUP_COLUMNS}
+                    FROM pzem_rollup_1m
+                    WHERE device_address = %s
+                    AND sample_count > 0
+                    ORDER BY bucket DESC
+                    LIMIT 2
+                    """, (device_address,))
+                    rows = cursor.fetchall()
+            if not rows:
+                return None
+            rows.reverse()
+            point = self._rollup_chart_points(rows, len(rows), 'lttb')[-1]
+            point['time_period'] = point['time_period'].isoformat()
+            return self.serialize_data(point)
+        except Exception as e:
+            logger.error(f"Error getting latest chart point for {device_address}: {e}")
+            return None
+    
+    # Query pzem_latest dengan konversi timezone yang benar (satu baris per device)
+    LATEST_DATA_QUERY = """
+    SELECT 
+        device_address,
+        COALESCE(voltage, 0) as voltage,
+        COALESCE(current, 0) as current,
+        COALESCE(power, 0) as power,
+        COALESCE(energy, 0) as energy,
+        COALESCE(frequency, 50.0) as frequency,
+        COALESCE(power_factor, 1.0) as power_factor,
+        wifi_rssi,
+        device_timestamp,
+        device_status,
+        data_quality,
+        timestamp_utc,
+        created_at,
+        -- Konversi timezone untuk Jakarta
+        created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jakarta' as created_at_jakarta,
+        CASE 
+            WHEN timestamp_utc IS NOT NULL 
+            THEN timestamp_utc AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jakarta'
+            ELSE created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jakarta'
+        END as timestamp_jakarta,
+        -- Hitung apakah device online (data dalam 10 menit terakhir)
+        CASE 
+            WHEN created_at >= NOW() - INTERVAL '10 minutes' THEN true
+            ELSE false
+        END as is_online,
+        -- Hitung selisih waktu dalam menit
+        EXTRACT(EPOCH FROM (NOW() - created_at))/60 as minutes_since_last_data
+    FROM pzem_latest 
+    WHERE created_at >= NOW() - INTERVAL '24 hours'
+    {device_filter}
+    ORDER BY device_address
+    """
+    
+    def _format_latest_rows(self, data):
+        """Format baris pzem_latest untuk frontend (dict per device_address)"""
+        result = {}
+        for row in data:
+            try:
+                device_data = dict(row)
+                device_address = row['device_address']
+                
+                # Format timestamps untuk frontend
+                if device_data['created_at_jakarta']:
+                    device_data['created_at_jakarta'] = device_data['created_at_jakarta'].isoformat()
+                
+                if device_data['timestamp_jakarta']:
+                    device_data['timestamp_jakarta'] = device_data['timestamp_jakarta'].isoformat()
+                
+                if device_data['created_at']:
+                    device_data['created_at'] = device_data['created_at'].isoformat()
+                
+                if device_data['timestamp_utc']:
+                    device_data['timestamp_utc'] = device_data['timestamp_utc'].isoformat()
+                
+                # Add alias fields for backward compatibility
+                device_data['avg_power'] = device_data['power']
+                device_data['avg_voltage'] = device_data['voltage']
+                device_data['avg_current'] = device_data['current']
+                device_data['total_energy'] = device_data['energy']
+                
+                # Status informasi
+                device_data['online_status'] = device_data['is_online']
+                device_data['last_seen_minutes'] = float(device_data['minutes_since_last_data'] or 0)
+                
+                # Serialize data
+                serialized_data = self.serialize_data(device_data)
+                result[device_address] = serialized_data
+                
+                logger.debug(f"Device {device_address}: online={device_data['is_online']}, last_seen={device_data['last_seen_minutes']:.1f}min ago")
+                
+            except Exception as device_error:
+                logger.error(f"Error processing device {row.get('device_address', 'unknown')}: {device_error}")
+                continue
+        return result
+    
+    def get_all_latest_data(self):
+        """Ambil data terbaru dengan timestamp yang benar - FIXED VERSION (with caching)"""
+        try:
+            return self._cached_per_device(('latest',), self._load_latest, 'all_latest')
         except Exception as e:
             logger.error(f"Error getting all latest data: {e}")
             return {}
+    
+    def _load_latest(self, device_addresses):
+        """Query data terbaru device tertentu -> {device: data}"""
+        with self.pool.connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(
+                    self.LATEST_DATA_QUERY.format(device_filter='AND device_address = ANY(%s)'),
+                    (sorted(device_addresses),)
+                )
+                data = cursor.fetchall()
+        
+        logger.debug(f"Retrieved latest data for {len(data)}/{len(device_addresses)} devices from database")
+        return self._format_latest_rows(data)
+    
+    def get_latest_for_devices(self, device_addresses):
+        """Data terbaru hanya untuk device tertentu (dipakai push NOTIFY, tanpa cache)"""
+        if not device_addresses:
+            return {}
+        try:
+            return self._load_latest(device_addresses)
+        except Exception as e:
+            logger.error(f"Error getting latest data for devices {sorted(device_addresses)}: {e}")
+            return {}
 
     def get_three_phase_summary(self):
         """Get 3-phase system summary for quick overview (with caching)"""
-        cache_key = self._get_cache_key('three_phase_summary')
-        ttl = self._cache_ttl.get('three_phase_summary', 15)
+        try:
+            return self._cached('three_phase_summary', self._load_three_phase_summary)
+        except Exception as e:
+            logger.error(f"[ERROR] Error getting 3-phase summary: {e}")
+            return {}
+    
+    def _load_three_phase_summary(self):
+        """Query ringkasan 3 fase dari pzem_latest"""
+        with self.pool.connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                # Get latest data from last hour for stability
+                query = """
+                WITH latest_data AS (
+                    SELECT device_address, power, voltage, current, power_factor, energy
+                    FROM pzem_latest 
+                    WHERE created_at >= NOW() - INTERVAL '1 hour'
+                )
+                SELECT 
+                    COUNT(*) as total_phases,
+                    SUM(power) as total_active_power,
+                    SUM(voltage * current) as total_apparent_power,
+                    AVG(voltage) as avg_voltage,
+                    SUM(current) as total_current,
+                    SUM(energy) as total_energy,
+                    STDDEV(power) as power_stddev,
+                    STDDEV(voltage) as voltage_stddev,
+                    STDDEV(current) as current_stddev
+                FROM latest_data
+                WHERE power IS NOT NULL AND voltage IS NOT NULL AND current IS NOT NULL
+                """
         
-        # Check cache first
-        if self._is_cache_valid(cache_key, ttl):
-            logger.debug("Returning cached three_phase_summary")
-            return self._get_cached(cache_key)
+                cursor.execute(query)
+                result = cursor.fetchone()
         
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
+        if result:
+            total_active = float(result['total_active_power'] or 0)
+            total_apparent = float(result['total_apparent_power'] or 0)
+            avg_power = total_active / max(result['total_phases'] or 1, 1)
             
-            # Get latest data from last hour for stability
-            query = """
-            WITH latest_data AS (
-                SELECT DISTINCT ON (device_address) 
-                    device_address, power, voltage, current, power_factor, energy
-                FROM pzem_data 
-                WHERE created_at >= NOW() - INTERVAL '1 hour'
-                ORDER BY device_address, created_at DESC
-            )
-            SELECT 
-                COUNT(*) as total_phases,
-                SUM(power) as total_active_power,
-                SUM(voltage * current) as total_apparent_power,
-                AVG(voltage) as avg_voltage,
-                SUM(current) as total_current,
-                SUM(energy) as total_energy,
-                STDDEV(power) as power_stddev,
-                STDDEV(voltage) as voltage_stddev,
-                STDDEV(current) as current_stddev
-            FROM latest_data
-            WHERE power IS NOT NULL AND voltage IS NOT NULL AND current IS NOT NULL
-            """
+            # Calculate imbalances
+            power_imbalance = 0
+            if avg_power > 0 and result['power_stddev']:
+                power_imbalance = (float(result['power_stddev']) / avg_power) * 100
             
-            cursor.execute(query)
-            result = cursor.fetchone()
-            cursor.close()
+            result_data = {
+                'total_phases': result['total_phases'] or 0,
+                'total_active_power': round(total_active, 2),
+                'total_apparent_power': round(total_apparent, 2),
+                'overall_power_factor': round(total_active / total_apparent, 3) if total_apparent > 0 else 0,
+                'avg_voltage': round(float(result['avg_voltage'] or 0), 1),
+                'total_current': round(float(result['total_current'] or 0), 2),
+                'total_energy': round(float(result['total_energy'] or 0), 3),
+                'power_imbalance_percent': round(power_imbalance, 1),
+                'system_efficiency': round((total_active / total_apparent * 100), 1) if total_apparent > 0 else 0
+            }
             
-            if result:
-                total_active = float(result['total_active_power'] or 0)
-                total_apparent = float(result['total_apparent_power'] or 0)
-                avg_power = total_active / max(result['total_phases'] or 1, 1)
-                
-                # Calculate imbalances
-                power_imbalance = 0
-                if avg_power > 0 and result['power_stddev']:
-                    power_imbalance = (float(result['power_stddev']) / avg_power) * 100
-                
-                result_data = {
-                    'total_phases': result['total_phases'] or 0,
-                    'total_active_power': round(total_active, 2),
-                    'total_apparent_power': round(total_apparent, 2),
-                    'overall_power_factor': round(total_active / total_apparent, 3) if total_apparent > 0 else 0,
-                    'avg_voltage': round(float(result['avg_voltage'] or 0), 1),
-                    'total_current': round(float(result['total_current'] or 0), 2),
-                    'total_energy': round(float(result['total_energy'] or 0), 3),
-                    'power_imbalance_percent': round(power_imbalance, 1),
-                    'system_efficiency': round((total_active / total_apparent * 100), 1) if total_apparent > 0 else 0
-                }
-                
-                # Cache the result
-                self._set_cache(cache_key, result_data)
-                return result_data
-            else:
-                return {}
-                
-        except Exception as e:
-            logger.error(f"[ERROR] Error getting 3-phase summary: {e}")
+            return result_data
+        else:
             return {}
 
 # Inisialisasi database manager
@@ -627,7 +731,11 @@ def api_three_phase_summary():
 def api_devices():
     """API untuk daftar semua device"""
     try:
-        devices = db_manager.get_devices()
+        # ?hours=N: statistik N jam terakhir (dari rollup), default sepanjang waktu
+        hours = request.args.get('hours', type=int)
+        if hours is not None and not 1 <= hours <= 24 * 400:
+            return jsonify({'error': 'hours must be between 1 and 9600'}), 400
+        devices = db_manager.get_devices(hours)
         return jsonify(devices)
     except Exception as e:
         logger.error(f"[ERROR] Error in devices API: {e}")
@@ -657,10 +765,19 @@ def api_device_data(device_address):
 
 @app.route('/api/chart/<device_address>')
 def api_chart_data(device_address):
-    """API chart data dengan debugging"""
+    """API chart data dengan debugging
+    
+    Query: period=hour|day|week|month, points=N (jumlah titik), mode=lttb|minmax
+    """
     try:
         period = request.args.get('period', 'hour')
-        data = db_manager.get_aggregated_data(device_address, period)
+        mode = request.args.get('mode', 'lttb')
+        points = request.args.get('points', type=int)
+        if mode not in DOWNSAMPLE_MODES:
+            return jsonify({'error': f"Invalid mode '{mode}', expected one of: {', '.join(DOWNSAMPLE_MODES)}"}), 400
+        if points is not None and not 2 <= points <= CHART_MAX_POINTS:
+            return jsonify({'error': f"points must be between 2 and {CHART_MAX_POINTS}"}), 400
+        data = db_manager.get_aggregated_data(device_address, period, points=points, mode=mode)
         
         logger.info(f"Chart data for {device_address} ({period}): {len(data)} points")
         
@@ -680,26 +797,24 @@ def api_chart_data(device_address):
 def api_debug_latest_raw():
     """Debug endpoint untuk melihat raw data"""
     try:
-        conn = db_manager.get_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        query = """
-        SELECT DISTINCT ON (device_address) 
-            device_address,
-            voltage, current, power, energy,
-            created_at,
-            created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jakarta' as jakarta_time,
-            EXTRACT(EPOCH FROM (NOW() - created_at))/60 as minutes_ago,
-            CASE WHEN created_at >= NOW() - INTERVAL '10 minutes' THEN 'ONLINE' ELSE 'OFFLINE' END as status
-        FROM pzem_data 
-        WHERE created_at >= NOW() - INTERVAL '24 hours'
-        ORDER BY device_address, created_at DESC
-        LIMIT 10
-        """
+        with db_manager.pool.connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                query = """
+                SELECT 
+                    device_address,
+                    voltage, current, power, energy,
+                    created_at,
+                    created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jakarta' as jakarta_time,
+                    EXTRACT(EPOCH FROM (NOW() - created_at))/60 as minutes_ago,
+                    CASE WHEN created_at >= NOW() - INTERVAL '10 minutes' THEN 'ONLINE' ELSE 'OFFLINE' END as status
+                FROM pzem_latest 
+                WHERE created_at >= NOW() - INTERVAL '24 hours'
+                ORDER BY device_address
+                LIMIT 10
+                """
         
-        cursor.execute(query)
-        raw_data = cursor.fetchall()
-        cursor.close()
+                cursor.execute(query)
+                raw_data = cursor.fetchall()
         
         result = []
         for row in raw_data:
@@ -746,63 +861,138 @@ def api_all_latest():
 
 @app.route('/api/export/<device_address>')
 def api_export_data(device_address):
-    """API untuk export data device"""
+    """API untuk export data device (streaming, memori konstan)
+    
+    Query: format=json|ndjson|csv|parquet, start/end (ISO, tanpa timezone = WIB)
+    atau period=hour|day|week|month, gzip=1 untuk kompresi gzip.
+    """
     try:
+        fmt = request.args.get('format', 'json').lower()
+        if fmt not in EXPORT_FORMATS:
+            raise ExportError(f"Invalid format '{fmt}', expected one of {', '.join(EXPORT_FORMATS)}")
         period = request.args.get('period', 'day')
-        data = db_manager.get_device_data(device_address, period, 1000)
-        
-        return jsonify({
-            'device_address': device_address,
-            'period': period,
-            'total_records': len(data),
-            'export_timestamp': datetime.now().isoformat(),
-            'data': data
-        })
-    except Exception as e:
-        logger.error(f"[ERROR] Error in export API: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        start, end = resolve_time_range(request.args.get('start'), request.args.get('end'), period)
+        compress = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    except ExportError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if fmt == 'parquet' and not parquet_available():
+        return jsonify({'error': 'Parquet export requires pyarrow on the server'}), 501
+    
+    envelope = {
+        'device_address': device_address,
+        'period': period,
+        'start_utc': start.isoformat(),
+        'end_utc': end.isoformat(),
+        'export_timestamp': datetime.now().isoformat()
+    }
+    
+    def generate():
+        try:
+            yield from export_stream(db_manager.pool, device_address, fmt, start, end,
+                                     compress=compress, envelope=envelope)
+        except Exception as e:
+            # Header sudah terkirim; hanya bisa dicatat dan stream dihentikan
+            logger.error(f"[ERROR] Export of {device_address} failed mid-stream: {e}")
+    
+    headers = {}
+    if fmt != 'json' or compress:
+        safe_name = re.sub(r'[^A-Za-z0-9_-]', '_', device_address)
+        filename = f"pzem_{safe_name}_{start:%Y%m%d%H%M}_{end:%Y%m%d%H%M}.{fmt}" + ('.gz' if compress else '')
+        headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    mimetype = 'application/gzip' if compress else EXPORT_FORMATS[fmt]
+    logger.info(f"[EXPORT] Streaming {device_address} {start} .. {end} as {fmt}{' (gzip)' if compress else ''}")
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers=headers)
 
 # Enhanced WebSocket events with 3-phase data
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
+    global connected_clients
+    connected_clients += 1
     logger.info('[WEBSOCKET] Client connected')
+    start_background_tasks()
     emit('connected', {'data': 'Connected to PZEM 3-Phase Dashboard'})
     
-    # Send initial data with 3-phase summary
+    # Send initial snapshot with 3-phase summary (delta berikutnya dimulai dari seq ini)
     try:
-        latest_data = db_manager.get_all_latest_data()
-        three_phase_summary = db_manager.get_three_phase_summary()
-        
-        emit('data_update', {
-            'devices': latest_data,
-            'summary': three_phase_summary
-        })
-        logger.debug(f"[WEBSOCKET] Sent initial data for {len(latest_data)} devices")
+        refresh_live_state()
     except Exception as e:
-        logger.error(f"[ERROR] Error sending initial data: {e}")
-        emit('data_update', {'devices': {}, 'summary': {}})
+        logger.error(f"[ERROR] Error refreshing initial data: {e}")
+    emit_snapshot()
+
+@socketio.on('request_snapshot')
+def handle_request_snapshot():
+    """Client mendeteksi gap pada seq delta dan meminta snapshot ulang"""
+    logger.debug('[WEBSOCKET] Client requested snapshot resync')
+    emit_snapshot()
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
+    global connected_clients
+    connected_clients = max(0, connected_clients - 1)
+    # Room Socket.IO dibersihkan otomatis; index subscriber dibersihkan di sini
+    for device_address in list(device_subscribers):
+        _remove_subscriber(device_address, request.sid)
     logger.info('[WEBSOCKET] Client disconnected')
 
+def device_room(device_address):
+    return f"device:{device_address}"
+
+def _remove_subscriber(device_address, sid):
+    sids = device_subscribers.get(device_address)
+    if sids is None:
+        return
+    sids.discard(sid)
+    if not sids:
+        del device_subscribers[device_address]
+
 @socketio.on('subscribe_device')
 def handle_subscribe_device(data):
-    """Handle subscription to specific device updates"""
-    device_address = data.get('device_address')
+    """Join room device: stream detail (reading + chart point) hanya untuk device ini"""
+    device_address = (data or {}).get('device_address')
+    if not device_address:
+        return
+    join_room(device_room(device_address))
+    device_subscribers.setdefault(device_address, set()).add(request.sid)
     logger.info(f'[WEBSOCKET] Client subscribed to device: {device_address}')
 
+@socketio.on('unsubscribe_device')
+def handle_unsubscribe_device(data):
+    """Leave room device"""
+    device_address = (data or {}).get('device_address')
+    if not device_address:
+        return
+    leave_room(device_room(device_address))
+    _remove_subscriber(device_address, request.sid)
+    logger.info(f'[WEBSOCKET] Client unsubscribed from device: {device_address}')
+
+@socketio.on('watch_report_job')
+def handle_watch_report_job(data):
+    """Join room report job; status saat ini dikirim langsung agar tidak ada event yang terlewat"""
+    job_id = (data or {}).get('job_id')
+    job = job_manager.get(job_id) if job_id else None
+    if job is None:
+        return
+    join_room(report_job_room(job_id))
+    if job['status'] in ('done', 'failed'):
+        emit('report_complete', job)
+    else:
+        emit('report_progress', job)
+
 @socketio.on('request_chart_update')
 def handle_chart_update_request(data):
     """Handle request for chart data update"""
     try:
         device_address = data.get('device_address')
         period = data.get('period', 'hour')
+        mode = data.get('mode', 'lttb')
         
         if device_address:
-            chart_data = db_manager.get_aggregated_data(device_address, period)
+            chart_data = db_manager.get_aggregated_data(device_address, period,
+                                                        points=data.get('points'),
+                                                        mode=mode if mode in DOWNSAMPLE_MODES else 'lttb')
             emit('chart_update', {
                 'device_address': device_address,
                 'period': period,
@@ -817,78 +1007,112 @@ def handle_chart_update_request(data):
         })
 
 # Enhanced background task dengan 3-phase calculations
+connected_clients = 0
+_background_started = False
+_background_lock = threading.Lock()
+live_tracker = DeltaTracker()
+device_subscribers = {}  # device_address -> set(sid) yang join room device
+
+def start_background_tasks():
+    """Start background push sekali per proses (gunicorn tidak menjalankan __main__)"""
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    socketio.start_background_task(background_thread)
+
+def emit_snapshot():
+    """Kirim snapshot lengkap (protocol + seq) ke client yang sedang ditangani"""
+    jakarta_now = datetime.now(JAKARTA_TZ)
+    snapshot = live_tracker.snapshot()
+    snapshot.update({
+        'timestamp': jakarta_now.isoformat(),
+        'timezone': 'Asia/Jakarta',
+        'server_time': jakarta_now.strftime('%H:%M:%S WIB')
+    })
+    emit('data_update', snapshot)
+    logger.debug(f"[WEBSOCKET] Sent snapshot seq={snapshot['seq']} for {len(snapshot['devices'])} devices")
+
+def refresh_live_state():
+    """Query semua device, broadcast delta jika ada perubahan"""
+    latest_data = db_manager.get_all_latest_data()
+    three_phase_summary = db_manager.get_three_phase_summary()
+    
+    # Hasil kosong bisa berarti query gagal: jangan hapus device dari client
+    delta = live_tracker.apply(latest_data, three_phase_summary, full=bool(latest_data))
+    if delta:
+        socketio.emit('data_delta', delta)
+    return delta
+
+def push_full_update():
+    """Heartbeat: refresh semua device, hanya field yang berubah yang dikirim"""
+    delta = refresh_live_state()
+    if delta:
+        logger.debug(f"[BACKGROUND] Pushed delta seq={delta['seq']} "
+                     f"({len(delta['devices'])} changed, {len(delta.get('removed', []))} removed)")
+    else:
+        logger.debug("[BACKGROUND] No changes to push")
+
+def push_device_updates(device_addresses):
+    """Kirim delta hanya untuk device yang berubah (dari NOTIFY)"""
+    latest_data = db_manager.get_latest_for_devices(device_addresses)
+    if not latest_data:
+        return
+    delta = live_tracker.apply(latest_data, db_manager.get_three_phase_summary())
+    if delta:
+        socketio.emit('data_delta', delta)
+        logger.debug(f"[BACKGROUND] Pushed delta seq={delta['seq']} for {len(delta['devices'])} devices")
+    push_device_streams(latest_data)
+
+def push_device_streams(latest_data):
+    """Stream detail per device, hanya ke room yang punya subscriber"""
+    for device_address, reading in latest_data.items():
+        if not device_subscribers.get(device_address):
+            continue
+        socketio.emit('device_reading', {
+            'device_address': device_address,
+            'reading': reading,
+            'chart_point': db_manager.get_latest_chart_point(device_address)
+        }, room=device_room(device_address))
+
 def background_thread():
-    """Background task dengan debugging yang lebih baik"""
-    logger.info("[BACKGROUND] Starting enhanced background data push thread (Jakarta timezone)")
+    """Push data ke client saat ada NOTIFY dari MQTT listener, plus heartbeat penuh berkala"""
+    logger.info(f"[BACKGROUND] Starting live push thread (LISTEN/NOTIFY, heartbeat {LIVE_HEARTBEAT_SECONDS}s, Jakarta timezone)")
+    listener = IngestListener(DB_CONFIG)
+    last_full_push = 0.0
     
     while True:
         try:
-            jakarta_now = datetime.now(JAKARTA_TZ)
-            logger.debug(f"[BACKGROUND] Fetching data at {jakarta_now.strftime('%Y-%m-%d %H:%M:%S')} WIB")
+            if connected_clients <= 0:
+                timeout = LIVE_HEARTBEAT_SECONDS
+            else:
+                timeout = max(0.0, last_full_push + LIVE_HEARTBEAT_SECONDS - time.monotonic())
+            changed = listener.wait(timeout)
             
-            # Ambil data terbaru dengan timestamp yang sudah diperbaiki
-            latest_data = db_manager.get_all_latest_data()
-            three_phase_summary = db_manager.get_three_phase_summary() if hasattr(db_manager, 'get_three_phase_summary') else {}
+            # Cache diinvalidasi oleh ingest, juga saat tidak ada client Socket.IO
+            if changed is None or changed:
+                db_manager.invalidate_ingest_cache(changed)
             
-            if latest_data or three_phase_summary:
-                combined_data = {
-                    'devices': latest_data,
-                    'summary': three_phase_summary,
-                    'timestamp': jakarta_now.isoformat(),
-                    'timezone': 'Asia/Jakarta',
-                    'server_time': jakarta_now.strftime('%H:%M:%S WIB')
-                }
-                
-                # Debug informasi
-                online_count = sum(1 for device in latest_data.values() 
-                                 if device.get('is_online') or device.get('online_status'))
-                
-                logger.debug(f"[BACKGROUND] Retrieved data for {len(latest_data)} devices, {online_count} online")
-                
-                # Test JSON serialization sebelum emit
-                try:
-                    import json
-                    json_test = json.dumps(combined_data, default=str)
-                    logger.debug(f"[BACKGROUND] JSON test passed ({len(json_test)} chars)")
-                except Exception as json_error:
-                    logger.error(f"[ERROR] JSON serialization failed: {json_error}")
-                    # Emit data kosong jika serialization gagal
-                    socketio.emit('data_update', {
-                        'devices': {}, 
-                        'summary': {},
-                        'timestamp': jakarta_now.isoformat(),
-                        'error': 'serialization_failed'
-                    })
-                    continue
-                
-                # Emit data yang sudah diperbaiki
-                socketio.emit('data_update', combined_data)
-                logger.debug(f"[BACKGROUND] Successfully pushed data at {jakarta_now.strftime('%H:%M:%S')} WIB")
-                
-            else:
-                logger.debug("[BACKGROUND] No data to push")
-                socketio.emit('data_update', {
-                    'devices': {}, 
-                    'summary': {},
-                    'timestamp': jakarta_now.isoformat(),
-                    'timezone': 'Asia/Jakarta'
-                })
+            if connected_clients <= 0:
+                # Tidak ada client: jangan query apa pun
+                continue
+            
+            if changed is None or time.monotonic() - last_full_push >= LIVE_HEARTBEAT_SECONDS:
+                push_full_update()
+                last_full_push = time.monotonic()
+            elif changed:
+                push_device_updates(changed)
             
         except Exception as e:
+            # Client tetap memegang state terakhir; heartbeat berikutnya mengirim perubahan
             logger.error(f"[ERROR] Error in background thread: {e}")
-            try:
-                error_time = datetime.now(JAKARTA_TZ)
-                socketio.emit('data_update', {
-                    'devices': {}, 
-                    'summary': {},
-                    'timestamp': error_time.isoformat(),
-                    'timezone': 'Asia/Jakarta',
-                    'error': str(e)
-                })
-            except Exception as emit_error:
-                logger.error(f"[ERROR] Failed to emit error recovery data: {emit_error}")
-        
-        time.sleep(30)  # Update setiap 30 detik
+            last_full_push = time.monotonic()
+
+@app.before_request
+def ensure_background_tasks():
+    # Listener NOTIFY juga dibutuhkan untuk invalidasi cache API tanpa client Socket.IO
+    start_background_tasks()
 
 # Error handlers
 @app.errorhandler(404)
@@ -915,6 +1139,8 @@ def health_check():
             'version': '3.0-three-phase-enhanced',
             'system_info': system_status,
             'three_phase_summary': summary,
+            'db_pool': db_manager.pool.get_stats(),
+            'cache': db_manager.cache.get_stats(),
             'features': [
                 'real_time_monitoring',
                 'three_phase_calculations', 
@@ -931,10 +1157,8 @@ def health_check():
         }), 500
 
 if __name__ == '__main__':
-    # Mulai background thread
-    thread = threading.Thread(target=background_thread)
-    thread.daemon = True
-    thread.start()
+    # Mulai background push (juga dimulai otomatis saat client pertama connect)
+    start_background_tasks()
     
     logger.info("[STARTING] PZEM 3-Phase Dashboard Server (Enhanced with Reporting)")
     logger.info("[WEBSOCKET] Listening for connections on port 5000")
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+In-memory TTL + LRU cache for dashboard queries
+Single-flight loading (N concurrent misses run one query) and optional stale-while-revalidate;
+get_many_or_load loads all missing keys of a request (e.g. one entry per device) in one query
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Entry per device (data terbaru + statistik per window) -> perlu beberapa entry per device
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1024'))
+
+
+class _Entry:
+    __slots__ = ('value', 'expires_at', 'stale_until')
+
+    def __init__(self, value, expires_at, stale_until):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+
+
+class _Flight:
+    """Satu load yang sedang berjalan; request lain untuk key yang sama menunggu hasilnya"""
+    __slots__ = ('done', 'value', 'error', 'generation')
+
+    def __init__(self, generation):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.generation = generation
+
+
+class TTLCache:
+    """Cache LRU (OrderedDict, eviction O(1)) dengan TTL per key"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, default_ttl=10):
+        self.max_entries = max(1, max_entries)
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._flights = {}
+        self._generations = {}  # naik setiap invalidate; load yang lebih lama tidak disimpan
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.loads = 0
+        self.load_errors = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def _store(self, key, value, ttl, stale_ttl):
+        # Dipanggil dengan _lock dipegang
+        now = time.monotonic()
+        ttl = self.default_ttl if ttl is None else ttl
+        self._data[key] = _Entry(value, now + ttl, now + ttl + max(0, stale_ttl or 0))
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def set(self, key, value, ttl=None, stale_ttl=0):
+        with self._lock:
+            self._store(key, value, ttl, stale_ttl)
+
+    def get(self, key, default=None):
+        """Nilai yang masih fresh, atau default"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry.expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry.value
+            self.misses += 1
+            return default
+
+    def _invalidate_locked(self, key):
+        self._data.pop(key, None)
+        self._flights.pop(key, None)
+        self._generations[key] = self._generations.get(key, 0) + 1
+        self.invalidations += 1
+
+    def invalidate(self, *keys):
+        """Buang entry; load yang sedang berjalan untuk key ini hasilnya tidak di-cache"""
+        with self._lock:
+            for key in keys:
+                self._invalidate_locked(key)
+
+    def invalidate_where(self, predicate):
+        """Invalidate semua key (tersimpan atau sedang di-load) yang cocok dengan predicate"""
+        with self._lock:
+            for key in {key for key in list(self._data) + list(self._flights) if predicate(key)}:
+                self._invalidate_locked(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_or_load(self, key, loader, ttl=None, stale_ttl=0):
+        """Ambil dari cache atau jalankan loader sekali untuk semua request yang bersamaan.
+
+        Dengan stale_ttl > 0, entry yang baru kedaluwarsa (kurang dari stale_ttl
+        detik) langsung dikembalikan sementara loader berjalan di background.
+        Exception dari loader diteruskan ke semua yang menunggu dan tidak di-cache.
+        """
+        with self._lock:
+            now = time.monotonic()
+            entry = self._data.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry.value
+
+            flight = self._flights.get(key)
+            if entry is not None and entry.stale_until > now:
+                self.stale_hits += 1
+                if flight is None:
+                    flight = self._flights[key] = _Flight(self._generations.get(key, 0))
+                    threading.Thread(target=self._load, args=(key, loader, ttl, stale_ttl, flight),
+                                     name='cache-revalidate', daemon=True).start()
+                return entry.value
+
+            self.misses += 1
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight(self._generations.get(key, 0))
+                leader = True
+
+        if leader:
+            self._load(key, loader, ttl, stale_ttl, flight)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def get_many_or_load(self, keys, loader, ttl=None, stale_ttl=0):
+        """get_or_load untuk banyak key: semua key yang tidak ada di cache di-load dengan satu
+        panggilan loader(missing_keys) -> {key: value}; key yang tidak dikembalikan bernilai None.
+
+        Key yang sedang di-load request lain ditunggu (tidak di-load ulang); entry stale
+        dikembalikan dan di-load ulang bersama-sama di background. Return {key: value}.
+        """
+        values = {}
+        waiting = {}
+        own = []
+        revalidate = []
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is not None and entry.expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    values[key] = entry.value
+                    continue
+                flight = self._flights.get(key)
+                if entry is not None and entry.stale_until > now:
+                    self.stale_hits += 1
+                    values[key] = entry.value
+                    if flight is None:
+                        revalidate.append(key)
+                    continue
+                self.misses += 1
+                if flight is not None:
+                    self.coalesced += 1
+                    waiting[key] = flight
+                else:
+                    own.append(key)
+            flights = {}
+            for key in own + revalidate:
+                flights[key] = self._flights[key] = _Flight(self._generations.get(key, 0))
+
+        if revalidate:
+            threading.Thread(target=self._load_many,
+                             args=(loader, ttl, stale_ttl, {key: flights[key] for key in revalidate}),
+                             name='cache-revalidate', daemon=True).start()
+        if own:
+            own_flights = {key: flights[key] for key in own}
+            self._load_many(loader, ttl, stale_ttl, own_flights)
+            waiting.update(own_flights)
+        for key, flight in waiting.items():
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            values[key] = flight.value
+        return values
+
+    def _load(self, key, loader, ttl, stale_ttl, flight):
+        self._load_many(lambda keys: {key: loader()}, ttl, stale_ttl, {key: flight})
+
+    def _load_many(self, loader, ttl, stale_ttl, flights):
+        """Jalankan loader sekali untuk semua flight; hasil hanya disimpan jika key belum diinvalidasi"""
+        loaded, error = {}, None
+        try:
+            loaded = loader(list(flights))
+        except Exception as e:
+            error = e
+            logger.debug(f"[CACHE] Loader for {list(flights)!r} failed: {e}")
+        with self._lock:
+            if error is not None:
+                self.load_errors += 1
+            else:
+                self.loads += 1
+            for key, flight in flights.items():
+                flight.error = error
+                flight.value = loaded.get(key)
+                if error is None and flight.generation == self._generations.get(key, 0):
+                    self._store(key, flight.value, ttl, stale_ttl)
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+        for flight in flights.values():
+            flight.done.set()
+
+    def get_stats(self):
+        """Counter hit/miss/eviction untuk /health"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.stale_hits
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+                'coalesced': self.coalesced,
+                'loads': self.loads,
+                'load_errors': self.load_errors,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'in_flight': len(self._flights),
+            }
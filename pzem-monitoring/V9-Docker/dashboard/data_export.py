@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Streaming export of pzem_data for one device
+Rows are read through a server-side (named) cursor and written out chunk by chunk
+as CSV, NDJSON, Parquet or the JSON envelope used by /api/export
+"""
+
+import csv
+import io
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '5000'))
+
+JAKARTA_TZ = pytz.timezone('Asia/Jakarta')
+
+EXPORT_COLUMNS = (
+    'device_address', 'voltage', 'current', 'power', 'energy', 'frequency',
+    'power_factor', 'wifi_rssi', 'device_timestamp', 'sample_interval',
+    'device_status', 'data_quality', 'timestamp_utc', 'created_at'
+)
+
+EXPORT_QUERY = f"""
+SELECT {', '.join(EXPORT_COLUMNS)}
+FROM pzem_data
+WHERE device_address = %s
+AND created_at >= %s AND created_at < %s
+ORDER BY created_at ASC
+"""
+
+PERIOD_DELTAS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+    'month': timedelta(days=30),
+}
+
+EXPORT_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(ValueError):
+    """Parameter export tidak valid (dikembalikan sebagai HTTP 400)"""
+
+
+def parse_export_time(value):
+    """ISO datetime dari query string -> UTC naive (tanpa timezone dianggap WIB)"""
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"Invalid datetime '{value}', expected ISO 8601 (e.g. 2025-01-31T00:00:00)")
+    if dt.tzinfo is None:
+        dt = JAKARTA_TZ.localize(dt)
+    return dt.astimezone(pytz.UTC).replace(tzinfo=None)
+
+
+def resolve_time_range(start=None, end=None, period='day', now=None):
+    """Range [start, end) dalam UTC naive; tanpa start dipakai `period` terakhir sebelum end"""
+    now = now or datetime.utcnow()
+    end_utc = parse_export_time(end) if end else now
+    if start:
+        start_utc = parse_export_time(start)
+    else:
+        if period not in PERIOD_DELTAS:
+            raise ExportError(f"Invalid period '{period}', expected one of {', '.join(PERIOD_DELTAS)}")
+        start_utc = end_utc - PERIOD_DELTAS[period]
+    if start_utc >= end_utc:
+        raise ExportError("start must be before end")
+    return start_utc, end_utc
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def iter_export_rows(pool, device_address, start, end, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield list baris (tuple) per chunk dari named cursor; memori konstan per chunk"""
+    with pool.connection() as conn:
+        with conn.cursor(name='pzem_export') as cursor:
+            cursor.itersize = chunk_rows
+            cursor.execute(EXPORT_QUERY, (device_address, start, end))
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield [tuple(_plain(value) for value in row) for row in rows]
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _row_dict(row):
+    return dict(zip(EXPORT_COLUMNS, row))
+
+
+def encode_ndjson(chunks):
+    for rows in chunks:
+        yield ''.join(json.dumps(_row_dict(row), default=_json_default) + '\n' for row in rows).encode('utf-8')
+
+
+def encode_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        for row in rows:
+            writer.writerow(value.isoformat() if isinstance(value, datetime) else value for value in row)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def encode_json(chunks, envelope):
+    """Envelope JSON lama ({..., "data": [...]}) ditulis bertahap; total_records di akhir"""
+    head = json.dumps(envelope)[:-1]
+    yield (head + (', ' if envelope else '') + '"data": [').encode('utf-8')
+    total = 0
+    for rows in chunks:
+        parts = [json.dumps(_row_dict(row), default=_json_default) for row in rows]
+        yield ((', ' if total else '') + ', '.join(parts)).encode('utf-8')
+        total += len(rows)
+    yield f'], "total_records": {total}}}'.encode('utf-8')
+
+
+class _ChunkSink:
+    """File-like tulis-saja untuk ParquetWriter; isi diambil setelah tiap row group"""
+
+    def __init__(self):
+        self._parts = []
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def encode_parquet(chunks):
+    """Satu row group per chunk (butuh pyarrow); Decimal sudah jadi float di iter_export_rows"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('device_address', pa.string()),
+        ('voltage', pa.float64()), ('current', pa.float64()), ('power', pa.float64()),
+        ('energy', pa.float64()), ('frequency', pa.float64()), ('power_factor', pa.float64()),
+        ('wifi_rssi', pa.int32()), ('device_timestamp', pa.int64()), ('sample_interval', pa.int32()),
+        ('device_status', pa.string()), ('data_quality', pa.string()),
+        ('timestamp_utc', pa.timestamp('us')), ('created_at', pa.timestamp('us')),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='snappy')
+    try:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            table = pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            )
+            writer.write_table(table)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def gzip_stream(parts):
+    """Kompres stream bytes ke format gzip (zlib wbits=31) tanpa buffer penuh"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for part in parts:
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(pool, device_address, fmt, start, end, compress=False, envelope=None):
+    """Generator bytes untuk response export"""
+    chunks = iter_export_rows(pool, device_address, start, end)
+    if fmt == 'csv':
+        parts = encode_csv(chunks)
+    elif fmt == 'ndjson':
+        parts = encode_ndjson(chunks)
+    elif fmt == 'parquet':
+        parts = encode_parquet(chunks)
+    else:
+        parts = encode_json(chunks, envelope or {})
+    return gzip_stream(parts) if compress else parts
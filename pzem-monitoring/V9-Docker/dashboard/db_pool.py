@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Thread/greenlet-safe PostgreSQL connection pool for the dashboard
+Wraps psycopg2 ThreadedConnectionPool with blocking checkout and usage metrics;
+under eventlet, install_green_psycopg() makes queries cooperative
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Pool configuration (override via environment)
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))  # detik menunggu koneksi bebas
+
+
+def install_green_psycopg():
+    """Pasang wait callback psycogreen jika proses berjalan di bawah eventlet (gunicorn -k eventlet)
+
+    psycopg2 adalah C extension: tanpa callback ini setiap query memblokir hub eventlet dan
+    semua request berjalan satu per satu, sehingga pool tidak memberi konkurensi.
+    Harus dipanggil sebelum koneksi pertama dibuat. Mengembalikan True jika terpasang.
+    """
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return False
+    if not patcher.is_monkey_patched('socket'):
+        return False
+    try:
+        from psycogreen.eventlet import patch_psycopg
+    except ImportError:
+        logger.warning("[POOL] psycogreen not installed: database queries will block the eventlet hub")
+        return False
+    patch_psycopg()
+    logger.info("[POOL] psycopg2 wait callback installed (queries yield to other greenlets)")
+    return True
+
+
+class PoolTimeout(Exception):
+    """Tidak ada koneksi bebas dalam DB_POOL_TIMEOUT detik"""
+
+
+class DatabasePool:
+    """Pool koneksi dengan context manager; checkout menunggu (bukan error) saat pool penuh"""
+
+    def __init__(self, db_config, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT):
+        self.db_config = db_config
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.timeout = timeout
+        self._pool = None
+        self._init_lock = threading.Lock()
+        # Semaphore membatasi checkout ke maxconn sehingga getconn() tidak pernah PoolError
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def _get_pool(self):
+        # Dibuat saat checkout pertama agar dashboard tetap start walau database belum siap
+        if self._pool is None:
+            with self._init_lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, **self.db_config)
+                    logger.info(f"[POOL] Connection pool ready (min={self.minconn}, max={self.maxconn})")
+        return self._pool
+
+    @contextmanager
+    def connection(self):
+        """Pinjam satu koneksi: commit jika sukses, rollback jika error, lalu dikembalikan ke pool"""
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._stats_lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"No database connection available within {self.timeout}s "
+                              f"(pool max {self.maxconn})")
+        wait_ms = (time.perf_counter() - start) * 1000
+
+        conn = None
+        discard = False
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            if conn.closed:
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+
+            with self._stats_lock:
+                self.checkouts += 1
+                self.in_use += 1
+                self.max_in_use = max(self.max_in_use, self.in_use)
+                self.total_wait_ms += wait_ms
+                self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+            try:
+                yield conn
+                conn.commit()
+            except Exception as e:
+                # Koneksi yang putus dibuang; selain itu cukup rollback transaksi
+                discard = conn.closed or isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+                if not conn.closed:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        discard = True
+                raise
+            finally:
+                with self._stats_lock:
+                    self.in_use -= 1
+        finally:
+            if conn is not None:
+                if discard:
+                    with self._stats_lock:
+                        self.discarded += 1
+                self._pool.putconn(conn, close=discard)
+            self._slots.release()
+
+    def closeall(self):
+        if self._pool is not None:
+            self._pool.closeall()
+
+    def get_stats(self):
+        """Snapshot metrik pool (checkout, wait time, koneksi aktif)"""
+        with self._stats_lock:
+            return {
+                'min_connections': self.minconn,
+                'max_connections': self.maxconn,
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'discarded': self.discarded,
+                'avg_wait_ms': round(self.total_wait_ms / self.checkouts, 2) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait_ms, 2),
+            }
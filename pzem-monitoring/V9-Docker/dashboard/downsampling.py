@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Time-series downsampling for charts
+Largest-Triangle-Three-Buckets (LTTB) keeps the visual shape of a series, min/max envelope
+keeps every bucket's extremes; both return exactly n_out strictly increasing indices into
+the input that include the first and last point (or all of them when the series is already
+short enough). n_out < 2 cannot keep both ends and is rejected with ValueError.
+"""
+
+import numpy as np
+
+DOWNSAMPLE_MODES = ('lttb', 'minmax')
+
+
+def _check_n_out(n_out):
+    if n_out < 2:
+        raise ValueError(f"Downsampling needs at least 2 output points (first and last), got {n_out}")
+
+
+def lttb_indices(x, y, n_out):
+    """Indeks titik terpilih (terurut) menurut LTTB; x harus naik, NaN di y dianggap 0"""
+    _check_n_out(n_out)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out == 2:
+        return np.array([0, n - 1])
+
+    # Titik pertama dan terakhir selalu dipakai; sisanya dibagi rata ke n_out - 2 bucket
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Titik acuan: rata-rata bucket berikutnya (atau titik terakhir)
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            avg_x = x[next_start:next_end].mean()
+            avg_y = y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        # Luas segitiga (titik terpilih sebelumnya, kandidat, rata-rata bucket berikutnya)
+        area = np.abs((x[prev] - avg_x) * (y[start:end] - y[prev])
+                      - (x[prev] - x[start:end]) * (avg_y - y[prev]))
+        prev = start + int(area.argmax())
+        selected[i + 1] = prev
+    return selected
+
+
+def minmax_indices(y, n_out):
+    """Indeks titik pertama, terakhir, dan min/max tiap bucket di antaranya (urut posisi)"""
+    _check_n_out(n_out)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+
+    # Titik pertama dan terakhir selalu dipakai; n_out - 2 titik dari bucket di antaranya.
+    # Setiap bucket berisi >= 2 titik; n_out ganjil -> bucket terakhir hanya menyumbang
+    # ekstrem yang paling jauh dari rata-rata bucket
+    inner = n_out - 2
+    buckets = (inner + 1) // 2
+    edges = 1 + np.linspace(0, n - 2, buckets + 1).astype(np.int64)
+    selected = [0]
+    for b, (start, end) in enumerate(zip(edges[:-1], edges[1:])):
+        values = y[start:end]
+        lo = start + int(values.argmin())
+        hi = start + int(values.argmax())
+        if inner % 2 and b == buckets - 1:
+            mean = values.mean()
+            selected.append(lo if mean - y[lo] > y[hi] - mean else hi)
+            continue
+        if lo == hi:
+            # Bucket datar: ambil ujung bucket agar jumlah titik tetap n_out
+            lo, hi = start, end - 1
+        selected.extend(sorted((lo, hi)))
+    selected.append(n - 1)
+    return np.array(selected, dtype=np.int64)
+
+
+def downsample_indices(x, y, n_out, mode='lttb'):
+    if mode == 'lttb':
+        return lttb_indices(x, y, n_out)
+    if mode == 'minmax':
+        return minmax_indices(y, n_out)
+    raise ValueError(f"Unknown downsampling mode: {mode} (expected one of {', '.join(DOWNSAMPLE_MODES)})")
+
+
+def _x_values(points, x_key):
+    x = [p[x_key] for p in points]
+    if hasattr(x[0], 'timestamp'):
+        return np.array(x, dtype='datetime64[us]').astype(np.int64) / 1e6
+    return x
+
+
+def downsample(points, n_out, x_key, y_key, mode='lttb'):
+    """Downsample list dict (mis. baris time series); x_key berisi datetime atau angka"""
+    _check_n_out(n_out)
+    if len(points) <= n_out:
+        return list(points)
+    y = [float(p[y_key] or 0) for p in points]
+    return [points[i] for i in downsample_indices(_x_values(points, x_key), y, n_out, mode)]
+
+
+def lttb(points, n_out, x_key, y_key):
+    """LTTB untuk list dict (mis. baris time series); x_key berisi datetime atau angka"""
+    return downsample(points, n_out, x_key, y_key, mode='lttb')
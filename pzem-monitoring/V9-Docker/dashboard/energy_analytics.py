@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Vectorized energy analytics
+Reset-aware consumption from the PZEM energy counter, trapezoidal power integration
+and gap statistics over per-device NumPy arrays, computed in one pass
+
+Input is a sequence of time-ordered segments: a rollup bucket (first/last sample of the
+bucket plus its mean power) or a raw sample (first == last).
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+# PZEM-004T: counter energi 0 .. 9999.99 kWh lalu kembali ke 0
+PZEM_ENERGY_WRAP_KWH = float(os.getenv('PZEM_ENERGY_WRAP_KWH', '10000'))
+# Batas fisik per fasa (100 A x 260 V); kenaikan counter di atas ini dianggap glitch
+ENERGY_MAX_POWER_W = float(os.getenv('ENERGY_MAX_POWER_W', '26000'))
+# Selang antar sampel lebih lama dari ini dihitung sebagai gap (tidak diintegrasi dari daya)
+ENERGY_GAP_SECONDS = float(os.getenv('ENERGY_GAP_SECONDS', '900'))
+COUNTER_RESOLUTION_KWH = 0.01
+
+WS_PER_KWH = 3600.0 * 1000.0
+
+
+@dataclass
+class EnergyProfile:
+    """Hasil analisa energi satu device"""
+    consumed_kwh: float  # nilai yang dipakai (sesuai method)
+    method: str  # 'counter', 'power' atau 'average'
+    counter_kwh: Optional[float]  # None jika counter tidak tersedia
+    integrated_kwh: float
+    resets: int
+    wraps: int
+    glitches: int
+    gap_count: int
+    gap_seconds: float
+    max_gap_seconds: float
+    coverage: float  # fraksi rentang waktu tanpa gap (0..1)
+    segment_kwh: np.ndarray  # konsumsi per segmen (method yang sama), untuk agregasi per periode
+
+
+def to_seconds(timestamps):
+    """List datetime (naive) -> array detik (float64)"""
+    return np.array(timestamps, dtype='datetime64[us]').astype(np.int64) / 1e6
+
+
+def to_float_array(values, fill=np.nan):
+    """List angka/Decimal/None -> array float64 (None jadi fill)"""
+    return np.array([fill if v is None else float(v) for v in values], dtype=np.float64)
+
+
+def _plausible_kwh(seconds):
+    return ENERGY_MAX_POWER_W * seconds / WS_PER_KWH + COUNTER_RESOLUTION_KWH
+
+
+def _counter_steps(delta, new_value, prev_value, seconds, fallback_kwh):
+    """Konsumsi per langkah counter: normal, reset (mulai dari 0), wrap, atau glitch (pakai fallback)"""
+    plausible = _plausible_kwh(seconds)
+    down = delta < -COUNTER_RESOLUTION_KWH
+    wrapped_kwh = PZEM_ENERGY_WRAP_KWH - prev_value + new_value
+    is_wrap = down & (wrapped_kwh <= plausible)
+    is_reset = down & ~is_wrap & (new_value <= plausible)
+    is_glitch = (down & ~is_wrap & ~is_reset) | (~down & (delta > plausible))
+
+    steps = np.maximum(delta, 0.0)
+    steps = np.where(is_wrap, wrapped_kwh, steps)
+    # Reset: counter mulai lagi dari 0; energi sebelum reset di langkah ini diperkirakan dari daya
+    steps = np.where(is_reset, np.maximum(new_value, fallback_kwh), steps)
+    steps = np.where(is_glitch, fallback_kwh, steps)
+    return steps, int(is_reset.sum()), int(is_wrap.sum()), int(is_glitch.sum())
+
+
+def analyze_segments(first_at, last_at, first_power, last_power, mean_power,
+                     first_energy, last_energy, max_energy, gap_seconds=ENERGY_GAP_SECONDS):
+    """Analisa satu device dari array segmen yang terurut waktu
+
+    Waktu dalam detik, daya dalam W (NaN = 0), energi counter dalam kWh (NaN = tidak ada).
+    """
+    t0 = np.asarray(first_at, dtype=np.float64)
+    t1 = np.asarray(last_at, dtype=np.float64)
+    p0 = np.nan_to_num(np.asarray(first_power, dtype=np.float64))
+    p1 = np.nan_to_num(np.asarray(last_power, dtype=np.float64))
+    pm = np.nan_to_num(np.asarray(mean_power, dtype=np.float64))
+    e0 = np.asarray(first_energy, dtype=np.float64)
+    e1 = np.asarray(last_energy, dtype=np.float64)
+    emax = np.asarray(max_energy, dtype=np.float64)
+    n = len(t0)
+    if n == 0:
+        return EnergyProfile(0.0, 'average', None, 0.0, 0, 0, 0, 0, 0.0, 0.0, 0.0, np.zeros(0))
+
+    # Integrasi daya: rata-rata di dalam segmen + trapezoid antar segmen (kecuali melewati gap)
+    inside_seconds = np.maximum(t1 - t0, 0.0)
+    inside_power_kwh = pm * inside_seconds / WS_PER_KWH
+    bridge_seconds = np.maximum(t0[1:] - t1[:-1], 0.0)
+    is_gap = bridge_seconds > gap_seconds
+    bridge_power_kwh = np.where(is_gap, 0.0, (p1[:-1] + p0[1:]) / 2.0 * bridge_seconds / WS_PER_KWH)
+    power_kwh = inside_power_kwh.copy()
+    power_kwh[1:] += bridge_power_kwh
+
+    # Counter energi: hanya segmen yang punya nilai counter
+    counter_kwh = None
+    resets = wraps = glitches = 0
+    counter_segment_kwh = np.zeros(n)
+    idx = np.flatnonzero(~np.isnan(e0) & ~np.isnan(e1))
+    if len(idx) >= 2 or (len(idx) == 1 and inside_seconds[idx[0]] > 0):
+        emax_valid = np.where(np.isnan(emax[idx]), np.maximum(e0[idx], e1[idx]), emax[idx])
+        # Di dalam segmen (rollup): counter turun berarti reset di tengah bucket
+        inside_delta = e1[idx] - e0[idx]
+        inside_reset = inside_delta < -COUNTER_RESOLUTION_KWH
+        inside_kwh = np.where(inside_reset, emax_valid - e0[idx] + e1[idx], np.maximum(inside_delta, 0.0))
+        inside_bad = inside_kwh > _plausible_kwh(inside_seconds[idx])
+        inside_kwh = np.where(inside_bad, inside_power_kwh[idx], inside_kwh)
+        resets += int((inside_reset & ~inside_bad).sum())
+        glitches += int(inside_bad.sum())
+
+        # Antar segmen: counter tetap valid melewati gap (device tetap menghitung saat offline)
+        prev, nxt = idx[:-1], idx[1:]
+        seconds = np.maximum(t0[nxt] - t1[prev], 0.0)
+        fallback = (p1[prev] + p0[nxt]) / 2.0 * seconds / WS_PER_KWH
+        steps, step_resets, step_wraps, step_glitches = _counter_steps(
+            e0[nxt] - e1[prev], e0[nxt], e1[prev], seconds, fallback)
+        resets += step_resets
+        wraps += step_wraps
+        glitches += step_glitches
+
+        counter_segment_kwh[idx] = inside_kwh
+        counter_segment_kwh[nxt] += steps
+        counter_kwh = float(counter_segment_kwh.sum())
+
+    integrated_kwh = float(power_kwh.sum())
+    span = float(t1[-1] - t0[0])
+    total_gap = float(bridge_seconds[is_gap].sum())
+    if counter_kwh is not None:
+        method, consumed, segment_kwh = 'counter', counter_kwh, counter_segment_kwh
+    elif integrated_kwh > 0:
+        method, consumed, segment_kwh = 'power', integrated_kwh, power_kwh
+    else:
+        # Rata-rata daya x durasi (paling kasar)
+        method = 'average'
+        consumed = max(0.0, float(pm.mean()) * span / WS_PER_KWH)
+        segment_kwh = np.zeros(n)
+        segment_kwh[-1] = consumed
+
+    return EnergyProfile(
+        consumed_kwh=max(0.0, consumed),
+        method=method,
+        counter_kwh=counter_kwh,
+        integrated_kwh=integrated_kwh,
+        resets=resets,
+        wraps=wraps,
+        glitches=glitches,
+        gap_count=int(is_gap.sum()),
+        gap_seconds=total_gap,
+        max_gap_seconds=float(bridge_seconds.max()) if n > 1 else 0.0,
+        coverage=(1.0 - total_gap / span) if span > 0 else 1.0,
+        segment_kwh=segment_kwh,
+    )
+
+
+def analyze_samples(timestamps, power, energy, gap_seconds=ENERGY_GAP_SECONDS):
+    """Analisa sampel mentah pzem_data (timestamps dalam detik)"""
+    return analyze_segments(timestamps, timestamps, power, power, power,
+                            energy, energy, energy, gap_seconds=gap_seconds)
+
+
+def analyze_rollup_rows(rows, gap_seconds=ENERGY_GAP_SECONDS):
+    """Analisa baris rollup (dict dengan kolom tabel pzem_rollup_*) yang terurut per bucket"""
+    counts = np.array([row['count_power'] for row in rows], dtype=np.float64)
+    sum_power = to_float_array((row['sum_power'] for row in rows), fill=0.0)
+    return analyze_segments(
+        to_seconds([row['first_at'] for row in rows]),
+        to_seconds([row['last_at'] for row in rows]),
+        to_float_array(row['first_power'] for row in rows),
+        to_float_array(row['last_power'] for row in rows),
+        np.divide(sum_power, counts, out=np.zeros_like(sum_power), where=counts > 0),
+        to_float_array(row['first_energy'] for row in rows),
+        to_float_array(row['last_energy'] for row in rows),
+        to_float_array(row['max_energy'] for row in rows),
+        gap_seconds=gap_seconds,
+    )
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+PostgreSQL LISTEN client for ingest notifications
+The MQTT listener sends pg_notify('pzem_ingest', ...) in every committed batch
+"""
+
+import json
+import logging
+import os
+import select
+import time
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+logger = logging.getLogger(__name__)
+
+# Live update configuration (override via environment)
+INGEST_NOTIFY_CHANNEL = os.getenv('INGEST_NOTIFY_CHANNEL', 'pzem_ingest')
+LIVE_DEBOUNCE_SECONDS = float(os.getenv('LIVE_DEBOUNCE_SECONDS', '0.2'))  # gabungkan notifikasi beruntun
+LIVE_RECONNECT_DELAY = float(os.getenv('LIVE_RECONNECT_DELAY', '5'))
+
+
+class IngestListener:
+    """Koneksi autocommit khusus LISTEN; wait() mengembalikan device yang berubah"""
+
+    def __init__(self, db_config, channel=INGEST_NOTIFY_CHANNEL, debounce=LIVE_DEBOUNCE_SECONDS):
+        self.db_config = db_config
+        self.channel = channel
+        self.debounce = max(0.0, debounce)
+        self.connection = None
+        self.notifications = 0
+
+    def connect(self):
+        conn = psycopg2.connect(**self.db_config)
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = conn.cursor()
+        cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+        cursor.close()
+        self.connection = conn
+        logger.info(f"[LIVE] Listening for ingest notifications on channel '{self.channel}'")
+
+    def close(self):
+        if self.connection is not None and not self.connection.closed:
+            self.connection.close()
+        self.connection = None
+
+    def _poll(self, timeout):
+        """Tunggu notifikasi sampai timeout; return list payload"""
+        if select.select([self.connection], [], [], max(0.0, timeout)) == ([], [], []):
+            return []
+        self.connection.poll()
+        payloads = []
+        while self.connection.notifies:
+            payloads.append(self.connection.notifies.pop(0).payload)
+        return payloads
+
+    def wait(self, timeout):
+        """Tunggu perubahan data.
+
+        Return set device_address yang berubah (kosong jika timeout), atau
+        None jika device tidak diketahui (payload terlalu besar / koneksi
+        LISTEN terputus) sehingga caller perlu refresh semua device.
+        """
+        try:
+            if self.connection is None or self.connection.closed:
+                self.connect()
+                # Notifikasi selama koneksi putus hilang: minta refresh penuh
+                return None
+
+            payloads = self._poll(timeout)
+            if payloads and self.debounce:
+                # Batch berikutnya biasanya menyusul dalam hitungan milidetik
+                deadline = time.monotonic() + self.debounce
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    more = self._poll(remaining)
+                    if not more:
+                        break
+                    payloads.extend(more)
+        except Exception as e:
+            logger.warning(f"[LIVE] LISTEN connection failed ({e}), retrying in {LIVE_RECONNECT_DELAY:.0f}s")
+            self.close()
+            time.sleep(LIVE_RECONNECT_DELAY)
+            return None
+
+        self.notifications += len(payloads)
+        changed = set()
+        for payload in payloads:
+            try:
+                devices = json.loads(payload).get('devices')
+            except (ValueError, AttributeError):
+                devices = None
+            if devices is None:
+                return None
+            changed.update(devices)
+        return changed
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Versioned delta protocol for live dashboard updates
+Clients receive one snapshot (data_update) and then numbered field deltas (data_delta)
+"""
+
+import copy
+import threading
+
+PROTOCOL_VERSION = 2
+
+# Field alias yang bisa dibangun ulang di client dari field aslinya
+ALIAS_FIELDS = {
+    'avg_power': 'power',
+    'avg_voltage': 'voltage',
+    'avg_current': 'current',
+    'total_energy': 'energy',
+    'online_status': 'is_online',
+}
+
+# Berubah di setiap query (dihitung dari NOW()), tidak dikirim sebagai delta
+VOLATILE_FIELDS = ('minutes_since_last_data', 'last_seen_minutes')
+
+
+def compact_device(device_data):
+    """Field device tanpa alias dan field volatile (bentuk yang dibandingkan/dikirim)"""
+    return {
+        key: value for key, value in device_data.items()
+        if key not in ALIAS_FIELDS and key not in VOLATILE_FIELDS
+    }
+
+
+class DeltaTracker:
+    """State terakhir yang dikirim ke client + nomor urut delta"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seq = 0
+        self.devices = {}
+        self.summary = {}
+
+    def snapshot(self):
+        """Snapshot lengkap untuk client baru atau client yang resync"""
+        with self._lock:
+            return {
+                'protocol': PROTOCOL_VERSION,
+                'seq': self.seq,
+                'devices': copy.deepcopy(self.devices),
+                'summary': copy.deepcopy(self.summary),
+            }
+
+    def apply(self, devices, summary=None, full=False):
+        """Gabungkan data baru ke state; return delta berikutnya atau None jika tidak ada perubahan.
+
+        full=True berarti `devices` adalah daftar lengkap, device yang tidak ada
+        dianggap hilang (masuk `removed`).
+        """
+        with self._lock:
+            changed = {}
+            for device_address, device_data in devices.items():
+                current = compact_device(device_data)
+                previous = self.devices.get(device_address)
+                previous = compact_device(previous) if previous is not None else {}
+                diff = {key: value for key, value in current.items() if previous.get(key) != value}
+                if diff:
+                    changed[device_address] = diff
+                self.devices[device_address] = device_data
+
+            removed = []
+            if full:
+                removed = sorted(address for address in self.devices if address not in devices)
+                for address in removed:
+                    del self.devices[address]
+
+            summary_changed = summary is not None and summary != self.summary
+            if summary_changed:
+                self.summary = summary
+
+            if not changed and not removed and not summary_changed:
+                return None
+
+            self.seq += 1
+            delta = {'protocol': PROTOCOL_VERSION, 'seq': self.seq, 'devices': changed}
+            if removed:
+                delta['removed'] = removed
+            if summary_changed:
+                delta['summary'] = summary
+            return delta
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache for generated PDF reports
+The key covers period, normalized range, tariff settings and a data-version watermark,
+so an identical request reuses the existing PDF instead of rendering it again
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Naikkan jika layout/perhitungan report berubah agar PDF lama tidak dipakai lagi
+REPORT_CACHE_VERSION = 4
+
+REPORT_CACHE_ENABLED = os.getenv('REPORT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+REPORT_RANGE_ALIGN_SECONDS = int(os.getenv('REPORT_RANGE_ALIGN_SECONDS', '300'))  # pembulatan "sekarang"
+REPORT_CLOSED_GRACE_SECONDS = int(os.getenv('REPORT_CLOSED_GRACE_SECONDS', '3600'))  # data telat (spool)
+REPORT_OPEN_TTL_HOURS = int(os.getenv('REPORT_OPEN_TTL_HOURS', '24'))  # report periode berjalan
+REPORT_LEGACY_KEEP_DAYS = int(os.getenv('REPORT_LEGACY_KEEP_DAYS', '30'))  # PDF tanpa metadata cache
+# Versi lama untuk range yang sama disimpan sekian detik setelah versi baru dibuat
+REPORT_SUPERSEDED_GRACE_SECONDS = int(os.getenv('REPORT_SUPERSEDED_GRACE_SECONDS', '3600'))
+
+TARIFF_ENV_VARS = ('PLN_TARIFF_CLASS', 'PLN_PPN_PERCENT')
+
+META_SUFFIX = '.meta.json'
+PART_SUFFIX = '.part'
+
+
+def reports_dir():
+    return os.path.join(os.getcwd(), 'reports')
+
+
+def align_end(now=None, align_seconds=REPORT_RANGE_ALIGN_SECONDS):
+    """Bulatkan 'sekarang' ke bawah agar request berdekatan menghasilkan range (dan key) yang sama"""
+    now = (now or datetime.now()).replace(microsecond=0)
+    if align_seconds <= 1:
+        return now
+    epoch = datetime(1970, 1, 1)
+    seconds = int((now - epoch).total_seconds())
+    return epoch + timedelta(seconds=seconds - seconds % align_seconds)
+
+
+def tariff_settings():
+    return {name: os.getenv(name) for name in TARIFF_ENV_VARS}
+
+
+class ReportCache:
+    """PDF per key di direktori reports + file metadata (.meta.json) di sebelahnya"""
+
+    def __init__(self, directory=None, enabled=REPORT_CACHE_ENABLED):
+        self.directory = directory or reports_dir()
+        self.enabled = enabled
+
+    @staticmethod
+    def make_key(period_type, start_date, end_date, watermark, tariff=None):
+        payload = {
+            'version': REPORT_CACHE_VERSION,
+            'period_type': period_type,
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat(),
+            'tariff': tariff if tariff is not None else tariff_settings(),
+            'watermark': watermark,
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()[:24]
+
+    @staticmethod
+    def is_closed(end_date, now=None):
+        """Periode yang sudah lewat (plus grace untuk data telat) tidak akan berubah lagi"""
+        now = now or datetime.now()
+        return end_date <= now - timedelta(seconds=REPORT_CLOSED_GRACE_SECONDS)
+
+    def filename_for(self, key, period_type, start_date, end_date):
+        return f"PZEM_Report_{period_type}_{start_date:%Y%m%d%H%M}-{end_date:%Y%m%d%H%M}_{key[:12]}.pdf"
+
+    def _meta_path(self, filename):
+        return os.path.join(self.directory, filename + META_SUFFIX)
+
+    def lookup(self, filename):
+        """Path PDF yang sudah ada untuk filename (key) ini, atau None"""
+        if not self.enabled:
+            return None
+        path = os.path.join(self.directory, filename)
+        if os.path.exists(path) and os.path.exists(self._meta_path(filename)):
+            os.utime(self._meta_path(filename))  # last access untuk eviction
+            return path
+        return None
+
+    def temp_path(self, filename):
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{filename}.{os.getpid()}{PART_SUFFIX}")
+
+    def publish(self, temp_path, filename, key, period_type, start_date, end_date, watermark):
+        """Pindahkan PDF selesai ke nama final secara atomik lalu tulis metadata"""
+        path = os.path.join(self.directory, filename)
+        os.replace(temp_path, path)
+        # Versi lama untuk range yang sama tidak dihapus di sini (link download yang baru dibagikan
+        # masih dipakai); evict() menghapusnya setelah REPORT_SUPERSEDED_GRACE_SECONDS
+        meta = {
+            'key': key,
+            'period_type': period_type,
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat(),
+            'watermark': watermark,
+            'closed': self.is_closed(end_date),
+            'created_at': datetime.now().isoformat(),
+        }
+        meta_tmp = self._meta_path(filename) + PART_SUFFIX
+        with open(meta_tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, default=str)
+        os.replace(meta_tmp, self._meta_path(filename))
+        return path
+
+    @staticmethod
+    def _range_prefix(filename):
+        # PZEM_Report_<period>_<start>-<end>_<key>.pdf -> bagian sebelum key (sama untuk semua versi range)
+        return filename[:-len('.pdf')].rsplit('_', 1)[0]
+
+    def _load_meta(self, filename):
+        with open(self._meta_path(filename), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        meta['created_ts'] = datetime.fromisoformat(meta['created_at']).timestamp()
+        return meta
+
+    def evict(self, open_ttl_hours=REPORT_OPEN_TTL_HOURS, legacy_keep_days=REPORT_LEGACY_KEEP_DAYS,
+              superseded_grace_seconds=REPORT_SUPERSEDED_GRACE_SECONDS):
+        """Hapus report periode berjalan yang kedaluwarsa, versi lama yang sudah tergantikan
+        dan PDF lama tanpa metadata
+
+        Report terbaru untuk periode yang sudah tertutup disimpan permanen. Versi lama untuk
+        range yang sama baru dihapus setelah versi penggantinya berumur superseded_grace_seconds.
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        now = time.time()
+        removed = 0
+        metas = {}
+        newest = {}  # range prefix -> created_ts versi terbaru
+        for name in os.listdir(self.directory):
+            if name.endswith('.pdf') and os.path.exists(self._meta_path(name)):
+                try:
+                    meta = metas[name] = self._load_meta(name)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"[REPORT] Unreadable report metadata for {name}: {e}")
+                    continue
+                prefix = self._range_prefix(name)
+                newest[prefix] = max(newest.get(prefix, 0), meta['created_ts'])
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(PART_SUFFIX):
+                    # Sisa render yang terputus
+                    if os.path.getmtime(path) < now - 3600:
+                        os.unlink(path)
+                        removed += 1
+                    continue
+                if not name.endswith('.pdf'):
+                    continue
+                meta_path = self._meta_path(name)
+                if name in metas:
+                    meta = metas[name]
+                    replaced_at = newest[self._range_prefix(name)]
+                    superseded = (replaced_at > meta['created_ts']
+                                  and replaced_at < now - superseded_grace_seconds)
+                    if not superseded and (meta.get('closed')
+                                           or os.path.getmtime(meta_path) >= now - open_ttl_hours * 3600):
+                        continue
+                    os.unlink(meta_path)
+                elif os.path.exists(meta_path):
+                    continue  # metadata rusak: biarkan, jangan dianggap PDF legacy
+                elif os.path.getctime(path) >= now - legacy_keep_days * 86400:
+                    continue
+                os.unlink(path)
+                removed += 1
+                logger.info(f"[REPORT] Evicted cached report: {name}")
+            except (OSError, ValueError) as e:
+                logger.warning(f"[REPORT] Failed to evict {name}: {e}")
+        return removed
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Chart rendering for PDF reports
+Object-oriented Matplotlib (Figure + Agg canvas, no pyplot global state) into in-memory PNGs;
+charts render sequentially inside the report worker process (report_jobs supplies the parallelism)
+"""
+
+import io
+import logging
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+logger = logging.getLogger(__name__)
+
+CHART_DPI = 150
+
+TREND_COLORS = ['#2E86AB', '#A23B72', '#F18F01', '#C73E1D', '#6A994E']
+PIE_COLORS = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FECA57']
+MAX_LEGEND_DEVICES = 12  # fleet besar: legend/label dibatasi agar chart tetap terbaca
+MAX_PIE_SLICES = 8  # sisanya digabung menjadi "Others"
+
+
+def _draw_power_trend(ax, data):
+    """Power trend line chart per phase"""
+    devices = {}
+    for row in data.get('time_series', []):
+        device = row['device_address']
+        if device not in devices:
+            devices[device] = {'times': [], 'powers': []}
+        devices[device]['times'].append(row['time_period'])
+        devices[device]['powers'].append(float(row['power'] or 0))
+
+    if not devices:
+        ax.text(0.5, 0.5, 'No Data Available', ha='center', va='center',
+                transform=ax.transAxes, fontsize=14)
+        ax.set_title('Power Consumption Trend - No Data')
+        return
+
+    many = len(devices) > MAX_LEGEND_DEVICES
+    for i, (device, values) in enumerate(devices.items()):
+        if values['times'] and values['powers']:
+            ax.plot(values['times'], values['powers'],
+                    label=f'Phase {device}',
+                    color=TREND_COLORS[i % len(TREND_COLORS)],
+                    linewidth=1 if many else 2, marker=None if many else 'o', markersize=4)
+
+    ax.set_title('Power Consumption Trend - All Phases', fontsize=14, fontweight='bold')
+    ax.set_xlabel('Time', fontsize=12)
+    ax.set_ylabel('Power (W)', fontsize=12)
+    if not many:
+        ax.legend()
+    ax.grid(True, alpha=0.3)
+    ax.tick_params(axis='x', labelrotation=45)
+
+
+def _draw_phase_distribution(ax, data):
+    """Phase power distribution pie chart"""
+    phases = []
+    powers = []
+
+    ranked = data.get('phase_data', [])
+    if len(ranked) > MAX_PIE_SLICES:
+        ranked = sorted(ranked, key=lambda p: float(p.get('avg_power', 0) or 0), reverse=True)
+    for phase in ranked[:MAX_PIE_SLICES]:
+        phases.append(f"Phase {phase['device_address']}")
+        power = float(phase.get('avg_power', 0) or 0)
+        powers.append(max(0.01, power))  # Minimum 0.01 for visibility
+    others = sum(float(p.get('avg_power', 0) or 0) for p in ranked[MAX_PIE_SLICES:])
+    if others > 0:
+        phases.append(f"Others ({len(ranked) - MAX_PIE_SLICES})")
+        powers.append(others)
+
+    if not phases or sum(powers) <= 0:
+        ax.text(0.5, 0.5, 'No Power Data Available', ha='center', va='center',
+                transform=ax.transAxes, fontsize=14)
+        ax.set_title('Power Distribution by Phase - No Data')
+        return
+
+    ax.pie(powers, labels=phases, autopct='%1.1f%%',
+           colors=[PIE_COLORS[i % len(PIE_COLORS)] for i in range(len(powers))], startangle=90)
+    ax.set_title('Power Distribution by Phase', fontsize=14, fontweight='bold')
+
+
+CHART_DRAWERS = {
+    'power_trend': _draw_power_trend,
+    'phase_distribution': _draw_phase_distribution,
+}
+
+
+def render_chart_png(chart_type, data):
+    """Render satu chart ke bytes PNG (Figure lokal, tanpa state global pyplot)"""
+    drawer = CHART_DRAWERS.get(chart_type)
+    if drawer is None:
+        raise ValueError(f"Unknown chart type: {chart_type}")
+
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    drawer(fig.add_subplot(), data)
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=CHART_DPI, bbox_inches='tight',
+                facecolor='white', edgecolor='none')
+    return buffer.getvalue()
+
+
+def render_charts(chart_types, data):
+    """Render beberapa chart berurutan -> {chart_type: png bytes atau None jika gagal}"""
+    charts = {}
+    for chart_type in chart_types:
+        try:
+            charts[chart_type] = render_chart_png(chart_type, data)
+        except Exception as e:
+            logger.error(f"Error creating {chart_type} chart: {e}")
+            charts[chart_type] = None
+    return charts
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Single-pass report data engine
+Streams hourly rollup buckets for whole hours plus raw pzem_data rows for the partial
+hours at the range edges, ordered per device, and computes per-device statistics
+and the hourly series in one pass; energy comes from energy_analytics
+
+Each device is finished as soon as the stream moves to the next one, so memory stays
+bounded by one device regardless of fleet size; its hourly series is downsampled with
+LTTB to REPORT_CHART_POINTS points instead of being truncated.
+"""
+
+import logging
+import os
+from datetime import timedelta
+
+from downsampling import lttb
+from energy_analytics import analyze_segments, to_float_array, to_seconds
+
+logger = logging.getLogger(__name__)
+
+REPORT_FETCH_ROWS = int(os.getenv('REPORT_FETCH_ROWS', '5000'))
+REPORT_CHART_POINTS = int(os.getenv('REPORT_CHART_POINTS', '240'))  # titik time series per device
+
+MEAN_FIELDS = ('voltage', 'current', 'power', 'frequency', 'power_factor')
+
+# Kolom: device, ts, sample_count, sum_voltage, sum_current, sum_power, sum_frequency,
+# sum_power_factor, min_energy, max_energy, first_at, last_at, first_power, last_power,
+# first_energy, last_energy, count_voltage, count_current, count_power, count_frequency,
+# count_power_factor (jumlah sampel yang nilainya tidak NULL, pembagi rata-rata)
+REPORT_STREAM_QUERY = """
+SELECT device_address, bucket AS ts, sample_count,
+       sum_voltage, sum_current, sum_power, sum_frequency, sum_power_factor,
+       min_energy, max_energy, first_at, last_at, first_power, last_power,
+       first_energy, last_energy,
+       count_voltage, count_current, count_power, count_frequency, count_power_factor
+FROM pzem_rollup_1h
+WHERE bucket >= %(full_start)s AND bucket < %(full_end)s
+UNION ALL
+SELECT device_address, created_at, 1,
+       COALESCE(voltage, 0), COALESCE(current, 0), COALESCE(power, 0),
+       COALESCE(frequency, 0), COALESCE(power_factor, 0),
+       energy, energy, created_at, created_at, power, power,
+       energy, energy,
+       (voltage IS NOT NULL)::int, (current IS NOT NULL)::int, (power IS NOT NULL)::int,
+       (frequency IS NOT NULL)::int, (power_factor IS NOT NULL)::int
+FROM pzem_data
+WHERE created_at >= %(start)s AND created_at <= %(end)s
+AND (created_at < %(full_start)s OR created_at >= %(full_end)s)
+ORDER BY device_address, ts
+"""
+
+
+def _ceil_hour(ts):
+    floored = ts.replace(minute=0, second=0, microsecond=0)
+    return floored if floored == ts else floored + timedelta(hours=1)
+
+
+def _floor_hour(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_window(start_date, end_date):
+    """Jam penuh [full_start, full_end) di dalam range yang dibaca dari pzem_rollup_1h"""
+    full_start = _ceil_hour(start_date)
+    # Bucket terakhir harus selesai sebelum end (end inklusif, jadi bucket yang berakhir tepat di end boleh)
+    full_end = _floor_hour(end_date)
+    if full_end <= full_start:
+        full_start = full_end = start_date
+    return full_start, full_end
+
+
+def _f(value, default=0.0):
+    return float(value) if value is not None else default
+
+
+def _mean(total, count):
+    return total / count if count else None
+
+
+class _DeviceStats:
+    """Akumulator per device; baris datang terurut waktu, segmen disimpan untuk analisa energi"""
+    __slots__ = ('device_address', 'count', 'sums', 'counts', 'min_energy', 'max_energy',
+                 'first_at', 'last_at', 'segments')
+
+    def __init__(self, device_address):
+        self.device_address = device_address
+        self.count = 0
+        # Per field: jumlah nilai dan jumlah sampel yang nilainya tidak NULL
+        self.sums = dict.fromkeys(MEAN_FIELDS, 0.0)
+        self.counts = dict.fromkeys(MEAN_FIELDS, 0)
+        self.min_energy = self.max_energy = None
+        self.first_at = self.last_at = None
+        # (first_at, last_at, first_power, last_power, mean_power, first_energy, last_energy, max_energy)
+        self.segments = []
+
+    def add(self, row):
+        count = int(row[2])
+        if count <= 0:
+            return
+        (min_energy, max_energy, first_at, last_at, first_power, last_power,
+         first_energy, last_energy) = row[8:16]
+        self.count += count
+        for field, total, field_count in zip(MEAN_FIELDS, row[3:8], row[16:21]):
+            self.sums[field] += _f(total)
+            self.counts[field] += int(field_count or 0)
+        if min_energy is not None:
+            min_energy, max_energy = float(min_energy), float(max_energy)
+            self.min_energy = min_energy if self.min_energy is None else min(self.min_energy, min_energy)
+            self.max_energy = max_energy if self.max_energy is None else max(self.max_energy, max_energy)
+        if self.first_at is None:
+            self.first_at = first_at
+        self.last_at = last_at
+        power_count = int(row[18] or 0)
+        mean_power = _f(row[5]) / power_count if power_count else None
+        self.segments.append((first_at, last_at, first_power, last_power, mean_power,
+                              first_energy, last_energy, max_energy))
+
+    def energy_profile(self):
+        first_at, last_at, first_power, last_power, mean_power, first_energy, last_energy, max_energy = \
+            zip(*self.segments)
+        return analyze_segments(
+            to_seconds(first_at), to_seconds(last_at),
+            to_float_array(first_power), to_float_array(last_power), to_float_array(mean_power),
+            to_float_array(first_energy), to_float_array(last_energy), to_float_array(max_energy),
+        )
+
+    def to_phase(self):
+        profile = self.energy_profile()
+        return {
+            'device_address': self.device_address,
+            'total_records': self.count,
+            'avg_voltage': _mean(self.sums['voltage'], self.counts['voltage']),
+            'avg_current': _mean(self.sums['current'], self.counts['current']),
+            'avg_power': _mean(self.sums['power'], self.counts['power']),
+            'avg_frequency': _mean(self.sums['frequency'], self.counts['frequency']),
+            'avg_power_factor': _mean(self.sums['power_factor'], self.counts['power_factor']),
+            'energy_consumed': profile.consumed_kwh,
+            'energy_method': profile.method,
+            'counter_resets': profile.resets + profile.wraps,
+            'data_gaps': profile.gap_count,
+            'data_coverage': profile.coverage,
+            'period_start': self.first_at,
+            'period_end': self.last_at,
+            'max_energy': self.max_energy if self.max_energy is not None else 0.0,
+            'min_energy': self.min_energy if self.min_energy is not None else 0.0,
+        }
+
+
+def _hourly_series(device_address, hourly, chart_points):
+    series = []
+    for time_period, (count, sums, counts) in hourly.items():
+        series.append({
+            'time_period': time_period,
+            'device_address': device_address,
+            'power': _mean(sums[2], counts[2]),
+            'voltage': _mean(sums[0], counts[0]),
+            'current': _mean(sums[1], counts[1]),
+            'sample_count': count,
+        })
+    if chart_points and len(series) > chart_points:
+        series = lttb(series, chart_points, 'time_period', 'power')
+    return series
+
+
+def build_report_data(rows, chart_points=REPORT_CHART_POINTS):
+    """Satu pass atas baris terurut (device, ts) -> (phase_data, time_series)
+
+    Semua device masuk phase_data; time_series berisi seri per jam tiap device (naik menurut
+    waktu), di-downsample dengan LTTB jika lebih dari chart_points titik.
+    """
+    phase_data = []
+    time_series = []
+    stats = None
+    # jam -> [count, sums, counts] (voltage, current, power) untuk device yang sedang diproses
+    hourly = {}
+
+    def finish_device():
+        if stats is not None and stats.count > 0:
+            phase_data.append(stats.to_phase())
+            time_series.extend(_hourly_series(stats.device_address, hourly, chart_points))
+
+    for row in rows:
+        if stats is None or row[0] != stats.device_address:
+            finish_device()
+            stats = _DeviceStats(row[0])
+            hourly = {}
+        stats.add(row)
+
+        count = int(row[2])
+        if count <= 0:
+            continue
+        key = _floor_hour(row[1])
+        bucket = hourly.get(key)
+        if bucket is None:
+            bucket = hourly[key] = [0, [0.0, 0.0, 0.0], [0, 0, 0]]
+        bucket[0] += count
+        for i in range(3):
+            bucket[1][i] += _f(row[3 + i])
+            bucket[2][i] += int(row[16 + i] or 0)
+    finish_device()
+    return phase_data, time_series
+
+
+def stream_report_rows(conn, start_date, end_date, fetch_rows=REPORT_FETCH_ROWS):
+    """Yield baris REPORT_STREAM_QUERY lewat named cursor (memori per batch)"""
+    full_start, full_end = rollup_window(start_date, end_date)
+    params = {'start': start_date, 'end': end_date, 'full_start': full_start, 'full_end': full_end}
+    logger.info(f"Streaming report rows: rollup hours {full_start} .. {full_end}, raw edges outside")
+    with conn.cursor(name='report_stream') as cursor:
+        cursor.itersize = fetch_rows
+        cursor.execute(REPORT_STREAM_QUERY, params)
+        while True:
+            rows = cursor.fetchmany(fetch_rows)
+            if not rows:
+                break
+            yield from rows
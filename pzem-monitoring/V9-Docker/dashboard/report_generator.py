@@ -5,23 +5,23 @@ Enhanced version with better error handling and clean code structure
 """
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
 from reportlab.platypus import Image as RLImage
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 from datetime import datetime, timedelta
-import tempfile
+import io
 import os
 import numpy as np
 import math
 import logging
 import pytz
 from pln_calculator import PLNTariffCalculator, calculate_pln_bill
+from report_cache import ReportCache, align_end
+from report_charts import render_charts
+from report_data import build_report_data, rollup_window, stream_report_rows
 
 # Database config - PASTIKAN SAMA dengan mqtt_client.py
 DB_CONFIG = {
@@ -174,6 +174,18 @@ class ThreePhaseCalculator:
         
         return calculate_pln_bill(total_energy_kwh, tariff_class=tariff_class, ppn_percent=ppn_percent)
 
+def resolve_report_period(period_type='daily', start_date=None, end_date=None):
+    """Range report ter-normalisasi: tanpa end dipakai 'sekarang' yang dibulatkan (lihat report_cache)"""
+    end_date = end_date.replace(microsecond=0) if end_date else align_end()
+    if not start_date:
+        if period_type == 'weekly':
+            start_date = end_date - timedelta(weeks=1)
+        elif period_type == 'monthly':
+            start_date = end_date - timedelta(days=30)
+        else:
+            start_date = end_date - timedelta(days=1)
+    return start_date.replace(microsecond=0), end_date
+
 class DatabaseManager:
     def __init__(self):
         self.connection = None
@@ -242,18 +254,50 @@ class DatabaseManager:
             if conn:
                 self.close_connection(conn)
     
-    def get_report_data(self, period_type='daily', start_date=None, end_date=None):
-        """Get data for report generation with simplified queries to avoid hanging"""
+    def get_data_watermark(self, start_date, end_date):
+        """Versi data dalam range (jumlah sampel + data terakhir) dari rollup per jam dan data mentah di tepi range
+        
+        Berubah setiap ada data baru/terlambat di range tersebut; None jika tidak bisa dibaca
+        (report tetap dibuat, hanya tidak di-cache).
+        """
         conn = None
         try:
-            logger.info("Starting simplified report data query")
-            
+            # Pembagian sama dengan report_data: jam penuh dari rollup, sisa jam dari data mentah;
+            # bucket jam yang masih berjalan tidak ikut sehingga key stabil setelah `end` lewat
+            full_start, full_end = rollup_window(start_date, end_date)
             conn = self.get_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Set connection timeout
-            cursor.execute("SET statement_timeout = '30s'")
-            
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT COALESCE(SUM(samples), 0), MAX(last_at)
+                FROM (
+                    SELECT sample_count AS samples, last_at
+                    FROM pzem_rollup_1h
+                    WHERE bucket >= %(full_start)s AND bucket < %(full_end)s
+                    UNION ALL
+                    SELECT COUNT(*), MAX(created_at)
+                    FROM pzem_data
+                    WHERE created_at >= %(start)s AND created_at <= %(end)s
+                    AND (created_at < %(full_start)s OR created_at >= %(full_end)s)
+                ) watermark
+            """, {'start': start_date, 'end': end_date, 'full_start': full_start, 'full_end': full_end})
+            samples, last_at = cursor.fetchone()
+            cursor.close()
+            return f"{samples}:{last_at.isoformat() if last_at else '-'}"
+        except Exception as e:
+            logger.warning(f"Could not read report data watermark: {e}")
+            return None
+        finally:
+            if conn:
+                self.close_connection(conn)
+    
+    def get_report_data(self, period_type='daily', start_date=None, end_date=None):
+        """Get data for report generation in one streaming pass
+        
+        Jam penuh dibaca dari pzem_rollup_1h, sisa jam di awal/akhir range dari pzem_data;
+        statistik per fasa, energi (trapezoid) dan time series dihitung sekaligus (report_data).
+        """
+        conn = None
+        try:
             # Determine period if not provided
             if not end_date:
                 end_date = datetime.now()
@@ -268,157 +312,48 @@ class DatabaseManager:
             
             logger.info(f"Querying data from {start_date} to {end_date}")
             
-            # Simple check for data availability
-            cursor.execute("SELECT COUNT(*) as total FROM pzem_data LIMIT 1")
-            total_records = cursor.fetchone()['total']
-            logger.info(f"Total records in database: {total_records}")
-            
-            if total_records == 0:
-                logger.warning("No data found in database")
-                return {
-                    'period_type': period_type,
-                    'start_date': start_date,
-                    'end_date': end_date,
-                    'phase_data': [],
-                    'time_series': []
-                }
-            
-            # Phase data query with accurate energy calculation
-            # Energy calculation: 
-            # 1. Primary: Use energy counter difference (MAX - MIN) if valid
-            # 2. Fallback: Calculate from power using time-weighted integration
-            simple_query = """
-            WITH energy_data AS (
-                SELECT 
-                    device_address,
-                    created_at,
-                    COALESCE(power, 0) as power,
-                    COALESCE(energy, 0) as energy,
-                    LAG(created_at) OVER (PARTITION BY device_address ORDER BY created_at) as prev_time,
-                    LAG(COALESCE(power, 0)) OVER (PARTITION BY device_address ORDER BY created_at) as prev_power
-                FROM pzem_data 
-                WHERE created_at >= %s AND created_at <= %s
-            ),
-            energy_calc AS (
-                SELECT 
-                    device_address,
-                    -- Calculate energy from power using trapezoidal integration
-                    SUM(
-                        CASE 
-                            WHEN prev_time IS NOT NULL AND prev_time < created_at
-                            THEN (
-                                (power + prev_power) / 2.0 * 
-                                EXTRACT(EPOCH FROM (created_at - prev_time)) / 3600.0 / 1000.0
-                            )
-                            ELSE 0
-                        END
-                    ) as energy_from_power
-                FROM energy_data
-                GROUP BY device_address
-            )
-            SELECT 
-                p.device_address,
-                COUNT(*) as total_records,
-                AVG(COALESCE(p.voltage, 220)) as avg_voltage,
-                AVG(COALESCE(p.current, 0)) as avg_current,
-                AVG(COALESCE(p.power, 0)) as avg_power,
-                AVG(COALESCE(p.frequency, 50)) as avg_frequency,
-                AVG(COALESCE(p.power_factor, 1)) as avg_power_factor,
-                CASE 
-                    -- Method 1: Use energy counter if available and valid (most accurate)
-                    -- Check if energy counter is valid (not reset, reasonable value)
-                    WHEN MAX(p.energy) IS NOT NULL AND MIN(p.energy) IS NOT NULL 
-                         AND MAX(p.energy) >= MIN(p.energy)
-                         AND (MAX(p.energy) - MIN(p.energy)) >= 0
-                         AND (MAX(p.energy) - MIN(p.energy)) < 10000  -- Sanity check: energy diff < 10000 kWh
-                         AND COUNT(*) > 1  -- Need at least 2 records for valid calculation
-                    THEN GREATEST(0, MAX(p.energy) - MIN(p.energy))
-                    -- Method 2: Use calculated energy from power integration (more accurate than simple average)
-                    WHEN ec.energy_from_power IS NOT NULL AND ec.energy_from_power > 0
-                    THEN ec.energy_from_power
-                    -- Method 3: Fallback to average power * duration (least accurate)
-                    ELSE (
-                        GREATEST(0, AVG(COALESCE(p.power, 0)) * 
-                        EXTRACT(EPOCH FROM (MAX(p.created_at) - MIN(p.created_at))) / 3600.0 / 1000.0)
-                    )
-                END as energy_consumed,
-                MIN(p.created_at) as period_start,
-                MAX(p.created_at) as period_end,
-                MAX(COALESCE(p.energy, 0)) as max_energy,
-                MIN(COALESCE(p.energy, 0)) as min_energy
-            FROM pzem_data p
-            LEFT JOIN energy_calc ec ON p.device_address = ec.device_address
-            WHERE p.created_at >= %s AND p.created_at <= %s
-            GROUP BY p.device_address, ec.energy_from_power
-            ORDER BY p.device_address
-            LIMIT 10
-            """
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            # Set connection timeout
+            cursor.execute("SET statement_timeout = '30s'")
+            cursor.close()
             
-            logger.info("Executing phase data query with improved energy calculation...")
-            cursor.execute(simple_query, (start_date, end_date, start_date, end_date))
-            phase_data = cursor.fetchall()
+            rows = stream_report_rows(conn, start_date, end_date)
+            phase_data, time_series_data = build_report_data(rows)
             
-            logger.info(f"Found {len(phase_data)} devices/phases")
+            logger.info(f"Found {len(phase_data)} devices/phases, {len(time_series_data)} time series points")
             # Log energy calculation details for debugging
             for phase in phase_data:
-                device = phase.get('device_address', 'Unknown')
-                energy = phase.get('energy_consumed', 0)
-                max_e = phase.get('max_energy', 0)
-                min_e = phase.get('min_energy', 0)
-                logger.debug(f"Device {device}: Energy={energy:.3f} kWh (counter: {min_e:.3f}->{max_e:.3f})")
-            
-            # Simplified time series query - just get recent points
-            time_series_query = """
-            SELECT 
-                DATE_TRUNC('hour', created_at) as time_period,
-                device_address,
-                AVG(COALESCE(power, 0)) as power,
-                AVG(COALESCE(voltage, 220)) as voltage,
-                AVG(COALESCE(current, 0)) as current,
-                COUNT(*) as sample_count
-            FROM pzem_data 
-            WHERE created_at >= %s AND created_at <= %s
-            GROUP BY time_period, device_address
-            ORDER BY time_period DESC, device_address
-            LIMIT 100
-            """
+                logger.debug(f"Device {phase['device_address']}: Energy={phase['energy_consumed']:.3f} kWh "
+                             f"({phase['energy_method']}, resets={phase['counter_resets']}, "
+                             f"gaps={phase['data_gaps']}, coverage={phase['data_coverage']:.1%})")
             
-            logger.info("Executing time series query...")
-            cursor.execute(time_series_query, (start_date, end_date))
-            time_series_data = cursor.fetchall()
+            if not phase_data:
+                logger.warning("No data found for report period")
             
-            logger.info(f"Found {len(time_series_data)} time series points")
-            
-            cursor.close()
-            
-            result = {
+            return {
                 'period_type': period_type,
                 'start_date': start_date,
                 'end_date': end_date,
-                'phase_data': [dict(row) for row in phase_data],
-                'time_series': [dict(row) for row in time_series_data]
+                'phase_data': phase_data,
+                'time_series': time_series_data
             }
             
-            logger.info("Successfully retrieved simplified report data")
-            return result
-            
         except Exception as e:
+            # Jangan kembalikan data kosong: report "no data" dari error sementara (mis. statement
+            # timeout) akan di-cache permanen untuk periode yang sudah tertutup
             logger.error(f"Error getting report data: {e}")
-            # Return empty data structure instead of None
-            return {
-                'period_type': period_type,
-                'start_date': start_date or datetime.now() - timedelta(days=1),
-                'end_date': end_date or datetime.now(),
-                'phase_data': [],
-                'time_series': []
-            }
+            raise
         finally:
             if conn:
                 self.close_connection(conn)
 
 class ReportGenerator:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, progress_callback=None, report_cache=None):
         self.db_manager = db_manager
+        self.report_cache = report_cache or ReportCache()
+        # progress_callback(percent, stage) dipanggil di setiap tahap (dipakai report job queue)
+        self.progress_callback = progress_callback
         self.styles = getSampleStyleSheet()
         
         # Custom styles
@@ -446,91 +381,45 @@ class ReportGenerator:
             spaceAfter=6
         )
     
-    def create_chart_image(self, data, chart_type='power_trend', filename=None):
-        """Create charts and save as images with better error handling"""
-        if not filename:
-            filename = tempfile.mktemp(suffix='.png')
-        
+    def report_progress(self, percent, stage):
+        """Laporkan progress ke callback (error di callback tidak menggagalkan report)"""
+        if self.progress_callback is None:
+            return
         try:
-            plt.figure(figsize=(10, 6))
-            plt.style.use('default')
-            
-            if chart_type == 'power_trend':
-                self._create_power_trend_chart(data)
-            elif chart_type == 'phase_distribution':
-                self._create_phase_distribution_chart(data)
-            else:
-                raise ValueError(f"Unknown chart type: {chart_type}")
-            
-            plt.tight_layout()
-            plt.savefig(filename, dpi=150, bbox_inches='tight', 
-                       facecolor='white', edgecolor='none')
-            plt.close()
-            
-            return filename
-            
+            self.progress_callback(percent, stage)
         except Exception as e:
-            logger.error(f"Error creating {chart_type} chart: {e}")
-            plt.close()  # Ensure plot is closed even on error
-            return None
+            logger.debug(f"Progress callback failed: {e}")
     
-    def _create_power_trend_chart(self, data):
-        """Create power trend line chart"""
-        devices = {}
-        for row in data.get('time_series', []):
-            device = row['device_address']
-            if device not in devices:
-                devices[device] = {'times': [], 'powers': []}
-            devices[device]['times'].append(row['time_period'])
-            devices[device]['powers'].append(float(row['power'] or 0))
-        
-        if not devices:
-            plt.text(0.5, 0.5, 'No Data Available', ha='center', va='center', 
-                    transform=plt.gca().transAxes, fontsize=14)
-            plt.title('Power Consumption Trend - No Data')
-        else:
-            colors = ['#2E86AB', '#A23B72', '#F18F01', '#C73E1D', '#6A994E']
-            for i, (device, values) in enumerate(devices.items()):
-                if values['times'] and values['powers']:
-                    plt.plot(values['times'], values['powers'], 
-                           label=f'Phase {device}', 
-                           color=colors[i % len(colors)],
-                           linewidth=2, marker='o', markersize=4)
-            
-            plt.title('Power Consumption Trend - All Phases', fontsize=14, fontweight='bold')
-            plt.xlabel('Time', fontsize=12)
-            plt.ylabel('Power (W)', fontsize=12)
-            plt.legend()
-            plt.grid(True, alpha=0.3)
-            plt.xticks(rotation=45)
-    
-    def _create_phase_distribution_chart(self, data):
-        """Create phase power distribution pie chart"""
-        phases = []
-        powers = []
-        
-        for phase in data.get('phase_data', []):
-            phases.append(f"Phase {phase['device_address']}")
-            power = float(phase.get('avg_power', 0) or 0)
-            powers.append(max(0.01, power))  # Minimum 0.01 for visibility
-        
-        if not phases or sum(powers) <= 0:
-            plt.text(0.5, 0.5, 'No Power Data Available', ha='center', va='center',
-                    fontsize=14)
-            plt.title('Power Distribution by Phase - No Data')
-        else:
-            colors_pie = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FECA57']
-            plt.pie(powers, labels=phases, autopct='%1.1f%%', 
-                   colors=colors_pie[:len(powers)], startangle=90)
-            plt.title('Power Distribution by Phase', fontsize=14, fontweight='bold')
+    def create_chart_image(self, data, chart_type='power_trend'):
+        """Render satu chart ke PNG di memori (bytes), None jika gagal"""
+        return render_charts([chart_type], data)[chart_type]
     
     def generate_report(self, period_type='daily', start_date=None, end_date=None, output_file=None):
-        """Generate comprehensive PDF report with enhanced error handling"""
-        chart_files = []  # Track temporary files for cleanup
+        """Generate comprehensive PDF report with enhanced error handling
+        
+        Tanpa output_file, report disimpan di cache report: request dengan periode, range,
+        tarif dan versi data yang sama memakai PDF yang sudah ada.
+        """
+        cache_entry = None
         
         try:
+            start_date, end_date = resolve_report_period(period_type, start_date, end_date)
+            if not output_file and self.report_cache.enabled:
+                watermark = self.db_manager.get_data_watermark(start_date, end_date)
+                if watermark is not None:
+                    key = ReportCache.make_key(period_type, start_date, end_date, watermark)
+                    filename = self.report_cache.filename_for(key, period_type, start_date, end_date)
+                    cached = self.report_cache.lookup(filename)
+                    if cached:
+                        logger.info(f"Serving cached report: {filename}")
+                        self.report_progress(100, 'Served from report cache')
+                        return cached
+                    output_file = self.report_cache.temp_path(filename)
+                    cache_entry = (key, filename, watermark)
+            
             # Get data from database
             logger.info(f"Fetching report data for period: {period_type}")
+            self.report_progress(5, 'Fetching report data')
             data = self.db_manager.get_report_data(period_type, start_date, end_date)
             if not data:
                 logger.error("No data available for report generation")
@@ -543,6 +432,7 @@ class ReportGenerator:
             
             if phase_count == 0:
                 logger.warning("No phase data found, generating empty report")
+            self.report_progress(40, 'Calculating summary')
             
             # Setup PDF - create in reports directory
             if not output_file:
@@ -665,7 +555,7 @@ class ReportGenerator:
                     "No Data Available", "-", "-", "-", "-", "-", "0"
                 ])
             
-            phase_table = Table(phase_detail_data)
+            phase_table = Table(phase_detail_data, repeatRows=1)  # tabel panjang (banyak device) terpotong per halaman
             phase_table.setStyle(TableStyle([
                 ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
                 ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
@@ -678,7 +568,19 @@ class ReportGenerator:
             ]))
             
             story.append(phase_table)
-            story.append(Spacer(1, 20))
+            story.append(Spacer(1, 10))
+            
+            # Catatan kualitas data: reset counter / data hilang memengaruhi akurasi energi
+            quality_notes = []
+            for phase in data.get('phase_data', []):
+                if phase.get('counter_resets') or phase.get('data_gaps'):
+                    quality_notes.append(
+                        f"Phase {phase['device_address']}: {phase.get('counter_resets', 0)} counter reset(s), "
+                        f"{phase.get('data_gaps', 0)} data gap(s), "
+                        f"coverage {float(phase.get('data_coverage', 1)):.1%}")
+            if quality_notes:
+                story.append(Paragraph("<b>Data Quality:</b><br/>" + "<br/>".join(quality_notes), self.normal_style))
+            story.append(Spacer(1, 10))
             
             # PLN Billing Breakdown (jika ada data energi)
             if phase_dict and total_energy > 0:
@@ -746,12 +648,14 @@ class ReportGenerator:
                 logger.info("Creating charts for report")
                 story.append(Paragraph("POWER CONSUMPTION TRENDS", self.heading_style))
                 
-                # Create power trend chart
-                logger.info("Generating power trend chart")
-                chart_file = self.create_chart_image(data, 'power_trend')
-                if chart_file and os.path.exists(chart_file):
-                    chart_files.append(chart_file)  # Track for cleanup
-                    img = RLImage(chart_file, width=500, height=300)
+                # Kedua chart dirender ke PNG di memori (berurutan di worker report)
+                logger.info("Generating power trend and phase distribution charts")
+                self.report_progress(60, 'Rendering charts')
+                charts = render_charts(['power_trend', 'phase_distribution'], data)
+                
+                # Power trend chart
+                if charts['power_trend']:
+                    img = RLImage(io.BytesIO(charts['power_trend']), width=500, height=300)
                     story.append(img)
                     story.append(Spacer(1, 20))
                     logger.info("Power trend chart added to report")
@@ -762,13 +666,10 @@ class ReportGenerator:
                 # Page break before next chart
                 story.append(PageBreak())
                 
-                # Create phase distribution chart
+                # Phase distribution chart
                 story.append(Paragraph("POWER DISTRIBUTION BY PHASE", self.heading_style))
-                logger.info("Generating phase distribution chart")
-                dist_chart_file = self.create_chart_image(data, 'phase_distribution')
-                if dist_chart_file and os.path.exists(dist_chart_file):
-                    chart_files.append(dist_chart_file)  # Track for cleanup
-                    img2 = RLImage(dist_chart_file, width=400, height=300)
+                if charts['phase_distribution']:
+                    img2 = RLImage(io.BytesIO(charts['phase_distribution']), width=400, height=300)
                     story.append(img2)
                     story.append(Spacer(1, 20))
                     logger.info("Phase distribution chart added to report")
@@ -805,7 +706,14 @@ class ReportGenerator:
             
             # Build PDF document
             logger.info("Building PDF document...")
+            self.report_progress(90, 'Building PDF document')
             doc.build(story)
+            if cache_entry:
+                key, filename, watermark = cache_entry
+                output_file = self.report_cache.publish(output_file, filename, key, period_type,
+                                                        start_date, end_date, watermark)
+                cache_entry = None
+                self.report_cache.evict()
             logger.info(f"Report generated successfully: {output_file}")
             return output_file
             
@@ -816,14 +724,12 @@ class ReportGenerator:
             return None
         
         finally:
-            # Cleanup temporary chart files
-            for chart_file in chart_files:
+            # PDF setengah jadi (gagal sebelum publish) tidak boleh tertinggal di cache
+            if cache_entry and output_file and os.path.exists(output_file):
                 try:
-                    if chart_file and os.path.exists(chart_file):
-                        os.unlink(chart_file)
-                        logger.debug(f"Cleaned up temporary file: {chart_file}")
-                except Exception as cleanup_error:
-                    logger.warning(f"Failed to cleanup file {chart_file}: {cleanup_error}")
+                    os.unlink(output_file)
+                except OSError:
+                    pass
     
     def generate_recommendations(self, power_data, imbalance_data, phase_data):
         """Generate recommendations based on data analysis"""
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Asynchronous PDF report jobs
+Reports are rendered in a bounded process pool so the single eventlet worker keeps
+serving the live dashboard; progress comes back over a multiprocessing queue
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', '2'))
+REPORT_QUEUE_MAX = int(os.getenv('REPORT_QUEUE_MAX', '10'))  # job queued + running maksimum
+REPORT_JOB_TTL = int(os.getenv('REPORT_JOB_TTL', '3600'))  # detik job selesai disimpan di memori
+REPORT_PROGRESS_INTERVAL = float(os.getenv('REPORT_PROGRESS_INTERVAL', '0.5'))
+
+ACTIVE_STATES = ('queued', 'running')
+
+# Di dalam worker process: queue progress dari initializer
+_progress_queue = None
+
+
+class JobQueueFull(Exception):
+    """Terlalu banyak report job yang sedang antre/berjalan"""
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _run_report_job(job_id, period_type, start_date, end_date):
+    """Dijalankan di worker process: generate PDF dan kembalikan nama file"""
+    from report_generator import DatabaseManager, ReportGenerator
+
+    def progress(percent, stage):
+        _progress_queue.put((job_id, percent, stage))
+
+    progress(1, 'Started')
+    report_gen = ReportGenerator(DatabaseManager(), progress_callback=progress)
+    output_file = report_gen.generate_report(
+        period_type=period_type,
+        start_date=start_date,
+        end_date=end_date
+    )
+    if not output_file or not os.path.exists(output_file):
+        raise RuntimeError('Failed to generate report - no data available or database error')
+    return os.path.basename(output_file)
+
+
+class ReportJobManager:
+    """Registry job + process pool; listener dipanggil untuk event report_progress/report_complete"""
+
+    def __init__(self, workers=REPORT_WORKERS, max_active=REPORT_QUEUE_MAX, job_ttl=REPORT_JOB_TTL):
+        self.workers = max(1, workers)
+        self.max_active = max(1, max_active)
+        self.job_ttl = job_ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._executor = None
+        self._progress_queue = None
+        self._pump_started = False
+        # Di dashboard diganti dengan socketio.start_background_task / socketio.sleep
+        self._start_background = lambda target: threading.Thread(target=target, daemon=True).start()
+        self._sleep = time.sleep
+
+    def configure(self, start_background=None, sleep=None):
+        if start_background is not None:
+            self._start_background = start_background
+        if sleep is not None:
+            self._sleep = sleep
+
+    def add_listener(self, listener):
+        """listener(event, job) untuk 'report_progress' dan 'report_complete'"""
+        self._listeners.append(listener)
+
+    def _notify(self, event, job):
+        for listener in self._listeners:
+            try:
+                listener(event, job)
+            except Exception as e:
+                logger.error(f"[REPORT] Job listener failed: {e}")
+
+    def _get_executor(self):
+        # Dibuat saat job pertama; spawn agar worker tidak mewarisi socket/koneksi dashboard
+        if self._executor is None:
+            context = multiprocessing.get_context('spawn')
+            self._progress_queue = context.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._progress_queue,)
+            )
+            logger.info(f"[REPORT] Report worker pool ready ({self.workers} processes)")
+        return self._executor
+
+    def _reset_executor(self, broken=None):
+        """Buang pool yang rusak (worker mati, mis. OOM); pool baru dibuat saat submit berikutnya"""
+        executor = self._executor
+        if executor is None or (broken is not None and executor is not broken):
+            return
+        self._executor = None
+        logger.warning("[REPORT] Report worker pool broken, recreating")
+        try:
+            executor.shutdown(wait=False, cancel_futures=True)
+        except Exception as e:
+            logger.debug(f"[REPORT] Error shutting down broken pool: {e}")
+
+    def _submit_to_pool(self, *args):
+        try:
+            executor = self._get_executor()
+            return executor, executor.submit(_run_report_job, *args)
+        except BrokenProcessPool:
+            self._reset_executor()
+            executor = self._get_executor()
+            return executor, executor.submit(_run_report_job, *args)
+
+    def submit(self, period_type='daily', start_date=None, end_date=None):
+        """Antrekan report; mengembalikan snapshot job (dict) dengan job_id"""
+        with self._lock:
+            self._prune_locked()
+            active = sum(1 for job in self._jobs.values() if job['status'] in ACTIVE_STATES)
+            if active >= self.max_active:
+                raise JobQueueFull(f"Too many report jobs in progress ({active}/{self.max_active})")
+
+            job_id = uuid.uuid4().hex
+            job = {
+                'job_id': job_id,
+                'status': 'queued',
+                'progress': 0,
+                'stage': 'Queued',
+                'period_type': period_type,
+                'start_date': start_date.isoformat() if start_date else None,
+                'end_date': end_date.isoformat() if end_date else None,
+                'filename': None,
+                'error': None,
+                'created_at': datetime.now().isoformat(),
+                'finished_at': None,
+            }
+            # Job baru didaftarkan setelah submit berhasil: submit yang gagal tidak meninggalkan
+            # job 'queued' yang ikut dihitung REPORT_QUEUE_MAX selamanya
+            executor, future = self._submit_to_pool(job_id, period_type, start_date, end_date)
+            self._jobs[job_id] = job
+            if not self._pump_started:
+                self._pump_started = True
+                self._start_background(self._progress_pump)
+
+        future.add_done_callback(lambda f: self._finish(job_id, f, executor))
+        logger.info(f"[REPORT] Queued {period_type} report job {job_id}")
+        return dict(job)
+
+    def _finish(self, job_id, future, executor=None):
+        try:
+            filename = future.result()
+            update = {'status': 'done', 'progress': 100, 'stage': 'Completed', 'filename': filename}
+            logger.info(f"[REPORT] Job {job_id} completed: {filename}")
+        except BrokenProcessPool as e:
+            update = {'status': 'failed', 'stage': 'Failed', 'error': f"Report worker crashed: {e}"}
+            logger.error(f"[REPORT] Job {job_id} failed, worker pool broken: {e}")
+            with self._lock:
+                self._reset_executor(broken=executor)
+        except Exception as e:
+            update = {'status': 'failed', 'stage': 'Failed', 'error': str(e)}
+            logger.error(f"[REPORT] Job {job_id} failed: {e}")
+        job = self._update(job_id, finished_at=datetime.now().isoformat(), **update)
+        if job:
+            self._notify('report_complete', job)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            return dict(job)
+
+    def _progress_pump(self):
+        """Baca progress dari worker (non-blocking) dan teruskan ke listener"""
+        while True:
+            try:
+                while True:
+                    job_id, percent, stage = self._progress_queue.get_nowait()
+                    with self._lock:
+                        job = self._jobs.get(job_id)
+                        # Progress yang datang terlambat tidak menimpa status akhir
+                        if job is None or job['status'] not in ACTIVE_STATES:
+                            continue
+                        job.update(status='running', progress=max(job['progress'], percent), stage=stage)
+                        snapshot = dict(job)
+                    self._notify('report_progress', snapshot)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                logger.error(f"[REPORT] Progress pump error: {e}")
+            self._sleep(REPORT_PROGRESS_INTERVAL)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list_jobs(self):
+        with self._lock:
+            self._prune_locked()
+            return sorted((dict(job) for job in self._jobs.values()),
+                          key=lambda job: job['created_at'], reverse=True)
+
+    def _prune_locked(self):
+        cutoff = time.time() - self.job_ttl
+        for job_id, job in list(self._jobs.items()):
+            if job['finished_at'] and datetime.fromisoformat(job['finished_at']).timestamp() < cutoff:
+                del self._jobs[job_id]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_manager = ReportJobManager()
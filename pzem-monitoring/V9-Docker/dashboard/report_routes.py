@@ -5,10 +5,11 @@ Provides web interface and API endpoints for report generation
 """
 
 from flask import Blueprint, request, jsonify, send_file, render_template_string
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
 import logging
 from report_generator import DatabaseManager, ReportGenerator
+from report_jobs import job_manager, JobQueueFull
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +29,7 @@ def report_dashboard():
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>PZEM Report Generator</title>
     <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css" rel="stylesheet">
+    <script src="https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.5.0/socket.io.js"></script>
     <style>
         * {
             margin: 0;
@@ -159,6 +161,20 @@ def report_dashboard():
             border: 1px solid #bee5eb;
         }
         
+        .progress-bar {
+            margin-top: 10px;
+            height: 8px;
+            background: rgba(12, 84, 96, 0.15);
+            border-radius: 4px;
+            overflow: hidden;
+        }
+        
+        .progress-bar div {
+            height: 100%;
+            background: #0c5460;
+            transition: width 0.3s ease;
+        }
+        
         .download-link {
             display: inline-block;
             margin-top: 10px;
@@ -292,6 +308,28 @@ def report_dashboard():
             const customDateRange = document.getElementById('customDateRange');
             const generateBtn = document.getElementById('generateBtn');
             const statusDiv = document.getElementById('status');
+            let currentJobId = null;
+            let pollTimer = null;
+            
+            // Progress & hasil report dikirim lewat Socket.IO; polling sebagai cadangan
+            const socket = typeof io !== 'undefined' ? io() : null;
+            if (socket) {
+                socket.on('connect', function() {
+                    if (currentJobId) {
+                        socket.emit('watch_report_job', { job_id: currentJobId });
+                    }
+                });
+                socket.on('report_progress', function(job) {
+                    if (job.job_id === currentJobId) {
+                        showProgress(job);
+                    }
+                });
+                socket.on('report_complete', function(job) {
+                    if (job.job_id === currentJobId) {
+                        finishJob(job);
+                    }
+                });
+            }
             
             periodSelect.addEventListener('change', function() {
                 if (this.value === 'custom') {
@@ -313,40 +351,85 @@ def report_dashboard():
                     }
                 }
                 
-                showStatus('Generating report... This may take a few minutes.', 'loading');
+                showStatus('Queueing report...', 'loading');
                 generateBtn.disabled = true;
                 generateBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Generating...';
                 
                 try {
                     const response = await fetch(`/reports/generate?${params.toString()}`);
+                    const result = await response.json().catch(() => ({}));
                     
-                    if (!response.ok) {
-                        const errorText = await response.text();
-                        throw new Error(`Server error: ${response.status} - ${errorText}`);
+                    if (!response.ok || !result.success) {
+                        throw new Error(result.error || `Server error: ${response.status}`);
                     }
-
-                    const result = await response.json();
                     
-                    if (result.success) {
-                        showStatus(
-                            `Report generated successfully! 
-                            <a href="/reports/download/${result.filename}" class="download-link" target="_blank">
-                                <i class="fas fa-download"></i> Download PDF
-                            </a>`, 
-                            'success'
-                        );
-                    } else {
-                        showStatus(`Error: ${result.error}`, 'error');
+                    currentJobId = result.job_id;
+                    showProgress({ progress: 0, stage: 'Queued' });
+                    if (socket && socket.connected) {
+                        socket.emit('watch_report_job', { job_id: currentJobId });
                     }
+                    pollTimer = setInterval(pollJob, 3000);
                 } catch (error) {
                     showStatus(`Failed to generate report. ${error.message}`, 'error');
                     console.error("Fetch error:", error);
-                } finally {
-                    generateBtn.disabled = false;
-                    generateBtn.innerHTML = '<i class="fas fa-file-pdf"></i> Generate Report';
+                    resetButton();
                 }
             });
             
+            async function pollJob() {
+                if (!currentJobId) {
+                    return;
+                }
+                try {
+                    const response = await fetch(`/reports/jobs/${currentJobId}`);
+                    if (!response.ok) {
+                        throw new Error(`Server error: ${response.status}`);
+                    }
+                    const job = await response.json();
+                    if (job.status === 'done' || job.status === 'failed') {
+                        finishJob(job);
+                    } else {
+                        showProgress(job);
+                    }
+                } catch (error) {
+                    console.error("Poll error:", error);
+                }
+            }
+            
+            function showProgress(job) {
+                const percent = Math.max(0, Math.min(100, job.progress || 0));
+                showStatus(
+                    `${job.stage || 'Generating report'}... ${percent}%
+                    <div class="progress-bar"><div style="width: ${percent}%"></div></div>`,
+                    'loading'
+                );
+            }
+            
+            function finishJob(job) {
+                if (!currentJobId || job.job_id !== currentJobId) {
+                    return;
+                }
+                currentJobId = null;
+                clearInterval(pollTimer);
+                if (job.status === 'done') {
+                    showStatus(
+                        `Report generated successfully! 
+                        <a href="/reports/download/${job.filename}" class="download-link" target="_blank">
+                            <i class="fas fa-download"></i> Download PDF
+                        </a>`, 
+                        'success'
+                    );
+                } else {
+                    showStatus(`Error: ${job.error}`, 'error');
+                }
+                resetButton();
+            }
+            
+            function resetButton() {
+                generateBtn.disabled = false;
+                generateBtn.innerHTML = '<i class="fas fa-file-pdf"></i> Generate Report';
+            }
+            
             function showStatus(message, type) {
                 statusDiv.innerHTML = message;
                 statusDiv.className = `status ${type}`;
@@ -373,7 +456,7 @@ def report_dashboard():
 
 @report_bp.route('/generate')
 def generate_report():
-    """API endpoint for report generation with timeout handling"""
+    """Antrekan report job; PDF dibuat di worker process (status via /reports/jobs/<job_id>)"""
     try:
         period_type = request.args.get('period_type', 'daily')
         start_date = request.args.get('start_date')
@@ -394,41 +477,44 @@ def generate_report():
             except:
                 pass
         
-        logger.info(f"Generating {period_type} report from {start_dt} to {end_dt}")
-        
-        # Create a new database manager for this request to avoid connection conflicts
-        from report_generator import DatabaseManager, ReportGenerator
-        db_manager = DatabaseManager()
-        report_gen = ReportGenerator(db_manager)
-        
-        output_file = report_gen.generate_report(
-            period_type=period_type,
-            start_date=start_dt,
-            end_date=end_dt
-        )
+        logger.info(f"Queueing {period_type} report from {start_dt} to {end_dt}")
+        job = job_manager.submit(period_type=period_type, start_date=start_dt, end_date=end_dt)
         
-        if output_file and os.path.exists(output_file):
-            filename = os.path.basename(output_file)
-            logger.info(f"Report generated successfully: {filename}")
-            
-            return jsonify({
-                'success': True,
-                'filename': filename,
-                'message': 'Report generated successfully'
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to generate report - no data available or database error'
-            }), 500
-            
+        return jsonify({
+            'success': True,
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'status_url': f"/reports/jobs/{job['job_id']}",
+            'message': 'Report job queued'
+        }), 202
+        
+    except JobQueueFull as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 429
     except Exception as e:
-        logger.error(f"Error generating report: {e}")
+        logger.error(f"Error queueing report: {e}")
         return jsonify({
             'success': False,
             'error': f'Internal server error: {str(e)}'
         }), 500
 
+@report_bp.route('/jobs/<job_id>')
+def report_job_status(job_id):
+    """Status dan progress satu report job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['filename']:
+        job['download_url'] = f"/reports/download/{job['filename']}"
+    return jsonify(job)
+
+@report_bp.route('/jobs')
+def list_report_jobs():
+    """Daftar report job terbaru (queued, running, dan yang baru selesai)"""
+    return jsonify({'jobs': job_manager.list_jobs()})
+
 @report_bp.route('/download/<filename>')
 def download_report(filename):
     """Download generated report"""
@@ -534,22 +620,3 @@ def report_summary():
     except Exception as e:
         logger.error(f"Error getting report summary: {e}")
         return jsonify({'error': 'Error getting summary'}), 500
-
-def cleanup_old_reports(days_to_keep=30):
-    """Remove reports older than specified days"""
-    try:
-        reports_dir = os.path.join(os.getcwd(), 'reports')
-        if not os.path.exists(reports_dir):
-            return
-        
-        cutoff_time = datetime.now() - timedelta(days=days_to_keep)
-        
-        for filename in os.listdir(reports_dir):
-            if filename.endswith('.pdf'):
-                file_path = os.path.join(reports_dir, filename)
-                if os.path.getctime(file_path) < cutoff_time.timestamp():
-                    os.unlink(file_path)
-                    logger.info(f"Deleted old report: {filename}")
-                    
-    except Exception as e:
-        logger.error(f"Error cleaning up old reports: {e}")
\ No newline at end of file
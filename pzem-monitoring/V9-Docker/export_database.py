@@ -2,15 +2,22 @@
 """
 Script untuk Export Semua Data dari Database PostgreSQL PZEM Monitoring
 Support export format: SQL, CSV, JSON
+Mode --fast: COPY TO STDOUT (CSV/binary) paralel per tabel dan slice + restore script
 """
 
 import psycopg2
+from psycopg2 import sql
 from psycopg2.extras import RealDictCursor, Json
 import json
 import csv
+import gzip
+import multiprocessing
 import os
 import sys
-from datetime import datetime
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 import argparse
 
 # Konfigurasi Database (sama dengan project)
@@ -22,6 +29,158 @@ DB_CONFIG = {
     'port': os.getenv('DB_PORT', '5432')
 }
 
+# Konfigurasi mode --fast
+FAST_EXPORT_WORKERS = int(os.getenv('FAST_EXPORT_WORKERS', str(min(4, os.cpu_count() or 1))))
+FAST_EXPORT_SLICE_ROWS = int(os.getenv('FAST_EXPORT_SLICE_ROWS', '1000000'))  # target baris per file slice
+FAST_EXPORT_GZIP_LEVEL = int(os.getenv('FAST_EXPORT_GZIP_LEVEL', '3'))  # level rendah = lebih cepat
+COPY_BUFFER_SIZE = 1024 * 1024
+JSON_EXPORT_BATCH_ROWS = int(os.getenv('JSON_EXPORT_BATCH_ROWS', '5000'))  # baris per fetch named cursor
+
+SLICEABLE_TYPES = ('smallint', 'integer', 'bigint', 'date',
+                   'timestamp without time zone', 'timestamp with time zone')
+COPY_OPTIONS = {
+    'csv': 'FORMAT csv, HEADER true',
+    'binary': 'FORMAT binary',
+}
+FILE_EXTENSIONS = {'csv': 'csv', 'binary': 'bin'}
+MANIFEST_FILE = 'manifest.json'
+
+# Mode --incremental: tabel append-only yang diekspor di atas high-water mark (id/created_at);
+# tabel lain (di-update in place) selalu di-snapshot penuh
+INCREMENTAL_TABLES = {t.strip() for t in os.getenv('INCREMENTAL_TABLES', 'pzem_data').split(',') if t.strip()}
+INCREMENTAL_CHUNK_HOURS = int(os.getenv('INCREMENTAL_CHUNK_HOURS', '24'))  # ukuran chunk untuk high-water timestamp
+
+
+def _copy_slice(task):
+    """Worker process: COPY satu slice tabel ke file (dalam snapshot yang sama dengan koordinator)"""
+    started = time.time()
+    part_path = task['path'] + '.part'
+    conn = psycopg2.connect(**task['db_config'])
+    try:
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with conn.cursor() as cursor:
+            if task['snapshot']:
+                cursor.execute("SET TRANSACTION SNAPSHOT %s", (task['snapshot'],))
+            copy_sql = cursor.mogrify(task['query'], task['params']).decode('utf-8')
+            if task['compress']:
+                f = gzip.open(part_path, 'wb', compresslevel=FAST_EXPORT_GZIP_LEVEL)
+            else:
+                f = open(part_path, 'wb')
+            with f:
+                cursor.copy_expert(copy_sql, f, size=COPY_BUFFER_SIZE)
+            rows = cursor.rowcount
+        conn.rollback()
+    finally:
+        conn.close()
+    os.replace(part_path, task['path'])
+    return {
+        'table': task['table'],
+        'file': os.path.basename(task['path']),
+        'rows': rows if rows is not None and rows >= 0 else None,
+        'bytes': os.path.getsize(task['path']),
+        'seconds': round(time.time() - started, 2)
+    }
+
+
+def _json_row(row):
+    """Satu baris sebagai JSON; datetime -> ISO, tipe lain (Decimal, dll) -> str seperti export lama"""
+    return json.dumps({key: value.isoformat() if isinstance(value, datetime) else value
+                       for key, value in row.items()},
+                      ensure_ascii=False, default=str)
+
+
+def _with_gzip_suffix(path, compress):
+    return path + '.gz' if compress and not path.endswith('.gz') else path
+
+
+def _open_text_output(path, compress):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', compresslevel=FAST_EXPORT_GZIP_LEVEL)
+    return open(path, 'w', encoding='utf-8')
+
+
+def _process_pool(workers):
+    # spawn: proses anak tidak mewarisi socket koneksi koordinator
+    return ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context('spawn'))
+
+
+def _print_copy_result(result):
+    rows = f"{result['rows']:,}" if result['rows'] is not None else '?'
+    print(f"    ✓ {result['file']}: {rows} rows, "
+          f"{result['bytes'] / 1024 / 1024:.1f} MB in {result['seconds']}s")
+
+
+def _load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_manifest(output_dir, manifest):
+    """Tulis manifest secara atomik (file sementara + fsync + rename)"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _remove_orphan_files(output_dir, manifest, tables):
+    """Hapus file data tabel yang tidak tercatat di manifest (sisa run yang terputus)"""
+    referenced = {entry['file'] for info in manifest['tables'].values() for entry in info['files']}
+    prefixes = tuple(f"{table}." for table in set(tables) | set(manifest['tables']))
+    extensions = tuple('.' + ext for ext in FILE_EXTENSIONS.values())
+    removed = 0
+    for name in os.listdir(output_dir):
+        if name in referenced:
+            continue
+        stem = name[:-len('.gz')] if name.endswith('.gz') else name
+        # Hanya file milik tabel export (termasuk .part dari worker), bukan file lain di direktori
+        if prefixes and name.startswith(prefixes) and (name.endswith('.part') or stem.endswith(extensions)):
+            _remove_file(os.path.join(output_dir, name))
+            removed += 1
+    return removed
+
+
+def _encode_high_water(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _decode_high_water(value, column_type):
+    if value is None:
+        return None
+    if column_type == 'date':
+        return date.fromisoformat(value)
+    if column_type.startswith('timestamp'):
+        return datetime.fromisoformat(value)
+    return int(value)
+
+
+def _split_range(low, high, parts):
+    """Batas dalam (parts - 1 titik) yang membagi [low, high] rata; bekerja untuk int dan datetime"""
+    bounds = []
+    for i in range(1, parts):
+        if isinstance(low, int):
+            bound = low + (high - low) * i // parts
+        else:
+            bound = low + (high - low) * i / parts
+        if bound > low and (not bounds or bound > bounds[-1]):
+            bounds.append(bound)
+    return bounds
+
 class DatabaseExporter:
     def __init__(self, db_config):
         self.db_config = db_config
@@ -38,14 +197,21 @@ class DatabaseExporter:
             sys.exit(1)
     
     def get_table_names(self):
-        """Mendapatkan daftar semua tabel"""
+        """Mendapatkan daftar semua tabel: tabel biasa dan parent partisi
+        
+        Partisi anak (pzem_data_pYYYYMM, pzem_data_default) tidak diulang karena datanya
+        sudah ikut terbaca lewat parent; information_schema menampilkan keduanya sebagai
+        BASE TABLE sehingga setiap baris akan ter-export dua kali.
+        """
         cursor = self.connection.cursor()
         cursor.execute("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_type = 'BASE TABLE'
-            ORDER BY table_name;
+            SELECT c.relname
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public'
+            AND c.relkind IN ('r', 'p')
+            AND NOT c.relispartition
+            ORDER BY c.relname;
         """)
         tables = [row[0] for row in cursor.fetchall()]
         cursor.close()
@@ -218,68 +384,414 @@ class DatabaseExporter:
         
         print(f"\n✓ CSV export completed: {output_dir}")
     
-    def export_to_json(self, output_file):
-        """Export ke format JSON"""
-        print(f"\n📋 Exporting ke JSON: {output_file}")
-        
-        tables = self.get_table_names()
-        export_data = {
-            'database': self.db_config['database'],
-            'export_date': datetime.now().isoformat(),
-            'tables': {}
-        }
+    def iter_table_rows(self, table_name, batch_size=JSON_EXPORT_BATCH_ROWS):
+        """Yield baris (dict) tabel lewat named cursor: hanya satu batch di memori"""
+        order_by_col = self.get_order_by_column(table_name)
+        query = sql.SQL("SELECT * FROM {table}").format(table=sql.Identifier(table_name))
+        if order_by_col:
+            query = sql.SQL("{query} ORDER BY {col} ASC").format(query=query, col=sql.Identifier(order_by_col))
         
-        for table in tables:
-            print(f"  → Exporting table: {table}")
-            row_count = self.get_row_count(table)
-            print(f"    Rows: {row_count:,}")
-            
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            order_by_col = self.get_order_by_column(table)
-            if order_by_col:
-                query = f"SELECT * FROM {table} ORDER BY {order_by_col} ASC;"
-            else:
-                query = f"SELECT * FROM {table};"
+        cursor = self.connection.cursor(name=f"export_{table_name}", cursor_factory=RealDictCursor)
+        try:
+            cursor.itersize = batch_size
             cursor.execute(query)
-            
-            rows = []
-            batch_size = 1000
-            rows_exported = 0
-            
             while True:
-                batch = cursor.fetchmany(batch_size)
-                if not batch:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
                     break
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+            self.connection.rollback()
+    
+    def export_to_json(self, output_file, compress=False):
+        """Export ke format JSON (streaming, envelope sama: {database, export_date, tables})
+        
+        Setiap baris ditulis begitu di-fetch; row_count ditulis setelah data tiap tabel.
+        """
+        output_file = _with_gzip_suffix(output_file, compress)
+        print(f"\n📋 Exporting ke JSON: {output_file}")
+        
+        tables = self.get_table_names()
+        with _open_text_output(output_file, compress) as f:
+            f.write('{\n')
+            f.write(f'  "database": {json.dumps(self.db_config["database"])},\n')
+            f.write(f'  "export_date": {json.dumps(datetime.now().isoformat())},\n')
+            f.write('  "tables": {')
+            
+            for table_index, table in enumerate(tables):
+                print(f"  → Exporting table: {table}")
+                f.write(f'{"," if table_index else ""}\n    {json.dumps(table)}: {{\n      "data": [')
                 
-                for row in batch:
-                    # Convert to dict and handle datetime objects
-                    row_dict = {}
-                    for key, value in row.items():
-                        if isinstance(value, datetime):
-                            row_dict[key] = value.isoformat()
-                        elif isinstance(value, (int, float)):
-                            row_dict[key] = value
-                        else:
-                            row_dict[key] = value
-                    rows.append(row_dict)
+                rows_exported = 0
+                for row in self.iter_table_rows(table):
+                    f.write(',\n        ' if rows_exported else '\n        ')
+                    f.write(_json_row(row))
                     rows_exported += 1
+                    if rows_exported % 10000 == 0:
+                        print(f"    Exported {rows_exported:,} rows...")
                 
-                if rows_exported % 10000 == 0:
-                    print(f"    Exported {rows_exported:,} rows...")
+                f.write('\n      ]' if rows_exported else ']')
+                f.write(f',\n      "row_count": {rows_exported}\n    }}')
+                print(f"    ✓ Completed: {rows_exported:,} rows exported")
             
-            export_data['tables'][table] = {
-                'row_count': rows_exported,
-                'data': rows
+            f.write('\n  }\n}\n')
+        
+        print(f"\n✓ JSON export completed: {output_file}")
+    
+    def export_to_ndjson(self, output_file, compress=False):
+        """Export ke NDJSON: satu baris JSON per record ({"table": ..., "data": {...}})"""
+        output_file = _with_gzip_suffix(output_file, compress)
+        print(f"\n📋 Exporting ke NDJSON: {output_file}")
+        
+        with _open_text_output(output_file, compress) as f:
+            for table in self.get_table_names():
+                print(f"  → Exporting table: {table}")
+                prefix = f'{{"table": {json.dumps(table)}, "data": '
+                rows_exported = 0
+                for row in self.iter_table_rows(table):
+                    f.write(prefix + _json_row(row) + '}\n')
+                    rows_exported += 1
+                    if rows_exported % 10000 == 0:
+                        print(f"    Exported {rows_exported:,} rows...")
+                print(f"    ✓ Completed: {rows_exported:,} rows exported")
+        
+        print(f"\n✓ NDJSON export completed: {output_file}")
+    
+    def get_estimated_rows(self, table_name):
+        """Estimasi jumlah baris dari statistik planner (termasuk partisi), tanpa COUNT(*)"""
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint
+            FROM pg_class c
+            WHERE c.oid = %s::regclass
+            OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass);
+        """, (table_name, table_name))
+        estimate = cursor.fetchone()[0]
+        cursor.close()
+        return estimate
+    
+    def plan_table_slices(self, table_name, slice_rows):
+        """Bagi tabel besar menjadi slice range pada kolom id/created_at
+        
+        Returns: (slice_column, [(where_sql, params), ...]); satu slice tanpa WHERE
+        untuk tabel kecil atau tanpa kolom yang bisa di-slice
+        """
+        column_types = {col[0]: col[1] for col in self.get_table_info(table_name)}
+        slice_column = self.get_order_by_column(table_name)
+        estimate = self.get_estimated_rows(table_name)
+        parts = -(-estimate // max(1, slice_rows))
+        if parts <= 1 or column_types.get(slice_column) not in SLICEABLE_TYPES:
+            return None, [('', ())]
+        
+        cursor = self.connection.cursor()
+        cursor.execute(sql.SQL("SELECT MIN({col}), MAX({col}) FROM {table}").format(
+            col=sql.Identifier(slice_column), table=sql.Identifier(table_name)))
+        low, high = cursor.fetchone()
+        cursor.close()
+        if low is None:
+            return None, [('', ())]
+        
+        bounds = _split_range(low, high, parts)
+        if not bounds:
+            return None, [('', ())]
+        col = sql.Identifier(slice_column).as_string(self.connection)
+        # Baris dengan NULL di kolom slice ikut slice pertama agar tidak ada yang hilang
+        slices = [(f"WHERE {col} < %s OR {col} IS NULL", (bounds[0],))]
+        for lower, upper in zip(bounds, bounds[1:]):
+            slices.append((f"WHERE {col} >= %s AND {col} < %s", (lower, upper)))
+        slices.append((f"WHERE {col} >= %s", (bounds[-1],)))
+        return slice_column, slices
+    
+    @contextmanager
+    def exported_snapshot(self):
+        """Transaksi REPEATABLE READ koordinator + pg_export_snapshot() untuk dipakai worker
+        
+        Snapshot hanya valid selama transaksi ini terbuka, jadi semua worker harus selesai
+        sebelum keluar dari blok with.
+        """
+        self.connection.rollback()
+        self.connection.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT pg_export_snapshot();")
+            snapshot = cursor.fetchone()[0]
+            cursor.close()
+            yield snapshot
+        finally:
+            self.connection.rollback()
+            self.connection.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
+    
+    def build_copy_task(self, snapshot, table, column_names, where_sql, params, path, fmt, compress):
+        """Task untuk _copy_slice (harus bisa di-pickle: hanya dict/str/tuple)"""
+        columns_sql = ', '.join(sql.Identifier(c).as_string(self.connection) for c in column_names)
+        table_sql = sql.Identifier(table).as_string(self.connection)
+        return {
+            'db_config': self.db_config,
+            'snapshot': snapshot,
+            'table': table,
+            'query': f"COPY (SELECT {columns_sql} FROM {table_sql} {where_sql}) "
+                     f"TO STDOUT WITH ({COPY_OPTIONS[fmt]})",
+            'params': params,
+            'path': path,
+            'compress': compress,
+        }
+    
+    def export_fast(self, output_dir, fmt='csv', compress=False,
+                    workers=FAST_EXPORT_WORKERS, slice_rows=FAST_EXPORT_SLICE_ROWS):
+        """Export cepat dengan COPY TO STDOUT, paralel antar tabel/slice di beberapa proses
+        
+        Semua worker memakai snapshot yang sama (pg_export_snapshot) sehingga hasilnya
+        konsisten seperti satu transaksi. Menghasilkan manifest.json dan restore.sql.
+        """
+        print(f"\n⚡ Fast export ({fmt}{', gzip' if compress else ''}, {workers} workers): {output_dir}")
+        os.makedirs(output_dir, exist_ok=True)
+        started = time.time()
+        
+        with self.exported_snapshot() as snapshot:
+            extension = FILE_EXTENSIONS[fmt] + ('.gz' if compress else '')
+            manifest = {
+                'database': self.db_config['database'],
+                'export_date': datetime.now().isoformat(),
+                'format': fmt,
+                'compress': 'gzip' if compress else None,
+                'tables': {}
             }
+            tasks = []
+            for table in self.get_table_names():
+                column_names = [col[0] for col in self.get_table_info(table)]
+                slice_column, slices = self.plan_table_slices(table, slice_rows)
+                manifest['tables'][table] = {
+                    'columns': column_names,
+                    'slice_column': slice_column,
+                    'files': []
+                }
+                print(f"  → Planned table: {table} ({len(slices)} slice{'s' if len(slices) > 1 else ''})")
+                for index, (where_sql, params) in enumerate(slices):
+                    path = os.path.join(output_dir, f"{table}.{index:04d}.{extension}")
+                    tasks.append(self.build_copy_task(snapshot, table, column_names, where_sql, params,
+                                                      path, fmt, compress))
             
-            cursor.close()
-            print(f"    ✓ Completed: {rows_exported:,} rows exported")
+            results = []
+            with _process_pool(workers) as executor:
+                futures = [executor.submit(_copy_slice, task) for task in tasks]
+                for future in as_completed(futures):
+                    result = future.result()
+                    results.append(result)
+                    _print_copy_result(result)
         
-        # Write to JSON file
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, indent=2, ensure_ascii=False, default=str)
+        for result in sorted(results, key=lambda r: r['file']):
+            manifest['tables'][result['table']]['files'].append({
+                'file': result['file'], 'rows': result['rows'], 'bytes': result['bytes']
+            })
+        _write_manifest(output_dir, manifest)
+        self.write_restore_script(output_dir, manifest)
         
-        print(f"\n✓ JSON export completed: {output_file}")
+        total_rows = sum(r['rows'] or 0 for r in results)
+        total_mb = sum(r['bytes'] for r in results) / 1024 / 1024
+        print(f"\n✓ Fast export completed: {total_rows:,} rows, {total_mb:.1f} MB, "
+              f"{len(results)} files in {time.time() - started:.1f}s")
+        return manifest
+    
+    def plan_increment(self, table_name, hwm_column, column_type, high_water, slice_rows):
+        """Chunk (lower, upper] baru di atas high-water mark, dalam snapshot koordinator
+        
+        Returns: list of (where_sql, params, upper); kosong jika tidak ada baris baru
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(sql.SQL("SELECT MIN({col}), MAX({col}) FROM {table}").format(
+            col=sql.Identifier(hwm_column), table=sql.Identifier(table_name)))
+        low, high = cursor.fetchone()
+        cursor.close()
+        if high is None or (high_water is not None and high <= high_water):
+            return []
+        
+        if column_type in ('smallint', 'integer', 'bigint'):
+            step, epsilon = max(1, slice_rows), 1
+        elif column_type == 'date':
+            step, epsilon = timedelta(days=max(1, INCREMENTAL_CHUNK_HOURS // 24)), timedelta(days=1)
+        else:
+            step, epsilon = timedelta(hours=INCREMENTAL_CHUNK_HOURS), timedelta(microseconds=1)
+        
+        col = sql.Identifier(hwm_column).as_string(self.connection)
+        lower = high_water if high_water is not None else low - epsilon
+        chunks = []
+        while lower < high:
+            upper = min(lower + step, high)
+            chunks.append((f"WHERE {col} > %s AND {col} <= %s", (lower, upper), upper))
+            lower = upper
+        if high_water is None:
+            # Run pertama: baris dengan NULL di kolom high-water ikut chunk pertama
+            where_sql, params, upper = chunks[0]
+            chunks[0] = (f"WHERE ({col} > %s AND {col} <= %s) OR {col} IS NULL", params, upper)
+        return chunks
+    
+    def export_incremental(self, output_dir, fmt='csv', compress=False,
+                           workers=FAST_EXPORT_WORKERS, slice_rows=FAST_EXPORT_SLICE_ROWS):
+        """Backup incremental ke direktori tetap (lanjutan dari manifest.json sebelumnya)
+        
+        Tabel append-only (INCREMENTAL_TABLES) hanya mengekspor baris di atas high-water
+        mark ke segment baru; tabel lain di-snapshot penuh setiap run. Manifest ditulis
+        atomik setelah setiap chunk selesai berurutan, sehingga run yang terputus
+        dilanjutkan dari chunk terakhir yang sudah tercatat.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = _load_manifest(output_dir)
+        if manifest:
+            if (fmt, 'gzip' if compress else None) != (manifest['format'], manifest['compress']):
+                print(f"  ! Memakai format manifest yang ada: {manifest['format']}"
+                      f"{', gzip' if manifest['compress'] else ''}")
+            fmt, compress = manifest['format'], bool(manifest['compress'])
+        else:
+            manifest = {
+                'database': self.db_config['database'],
+                'export_date': None,
+                'format': fmt,
+                'compress': 'gzip' if compress else None,
+                'tables': {}
+            }
+        print(f"\n🔁 Incremental export ({fmt}{', gzip' if compress else ''}, {workers} workers): {output_dir}")
+        started = time.time()
+        tables = self.get_table_names()
+        # Tabel yang sudah di-drop tidak boleh ikut restore.sql (\copy ke tabel yang tidak ada gagal)
+        dropped_files = []
+        for table in [t for t in manifest['tables'] if t not in tables]:
+            dropped_files.extend(entry['file'] for entry in manifest['tables'].pop(table)['files'])
+            print(f"  → {table}: no longer in database, removed from manifest")
+        if dropped_files:
+            # Manifest dulu, baru file: manifest tidak pernah menunjuk file yang sudah dihapus
+            _write_manifest(output_dir, manifest)
+            for name in dropped_files:
+                _remove_file(os.path.join(output_dir, name))
+        removed = _remove_orphan_files(output_dir, manifest, tables)
+        if removed:
+            print(f"  → Removed {removed} unfinished file(s) from an interrupted run")
+        
+        extension = FILE_EXTENSIONS[fmt] + ('.gz' if compress else '')
+        run_id = datetime.now().strftime('%Y%m%d%H%M%S')
+        results = []
+        pending = {}  # table -> {chunk index: (entry, upper)} yang selesai tapi belum di-commit
+        next_chunk = {}  # table -> index chunk berikutnya yang boleh di-commit
+        with self.exported_snapshot() as snapshot:
+            futures = {}
+            with _process_pool(workers) as executor:
+                for table in tables:
+                    column_types = {col[0]: col[1] for col in self.get_table_info(table)}
+                    column_names = list(column_types)
+                    info = manifest['tables'].setdefault(table, {'columns': column_names, 'files': []})
+                    hwm_column = self.get_order_by_column(table) if table in INCREMENTAL_TABLES else None
+                    
+                    if hwm_column and column_types.get(hwm_column) in SLICEABLE_TYPES:
+                        if info.get('mode') != 'incremental':
+                            info.update({'mode': 'incremental', 'high_water_column': hwm_column,
+                                         'high_water': None, 'files': []})
+                        high_water = _decode_high_water(info['high_water'], column_types[hwm_column])
+                        chunks = self.plan_increment(table, hwm_column, column_types[hwm_column],
+                                                     high_water, slice_rows)
+                        print(f"  → {table}: {len(chunks)} new chunk(s) after {hwm_column} = {info['high_water']}")
+                        pending[table], next_chunk[table] = {}, 0
+                        for index, (where_sql, params, upper) in enumerate(chunks):
+                            sequence = len(info['files']) + index
+                            path = os.path.join(output_dir, f"{table}.{sequence:06d}.{extension}")
+                            task = self.build_copy_task(snapshot, table, column_names, where_sql, params,
+                                                        path, fmt, compress)
+                            futures[executor.submit(_copy_slice, task)] = (table, index, upper, column_names)
+                    else:
+                        info.update({'mode': 'snapshot', 'columns': column_names})
+                        info.pop('high_water', None)
+                        info.pop('high_water_column', None)
+                        path = os.path.join(output_dir, f"{table}.snapshot-{run_id}.{extension}")
+                        task = self.build_copy_task(snapshot, table, column_names, '', (),
+                                                    path, fmt, compress)
+                        futures[executor.submit(_copy_slice, task)] = (table, None, None, column_names)
+                        print(f"  → {table}: full snapshot")
+                
+                failed = None
+                for future in as_completed(futures):
+                    table, index, upper, column_names = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # Chunk lain tetap di-commit; run berikutnya melanjutkan dari chunk yang gagal
+                        print(f"    ✗ {table} chunk {index if index is not None else 'snapshot'} failed: {e}")
+                        failed = failed or e
+                        continue
+                    results.append(result)
+                    _print_copy_result(result)
+                    info = manifest['tables'][table]
+                    entry = {'file': result['file'], 'rows': result['rows'], 'bytes': result['bytes']}
+                    if column_names != info['columns']:
+                        entry['columns'] = column_names
+                    
+                    if index is None:
+                        previous = [f['file'] for f in info['files'] if f['file'] != entry['file']]
+                        info['files'] = [entry]
+                        _write_manifest(output_dir, manifest)
+                        for name in previous:
+                            _remove_file(os.path.join(output_dir, name))
+                        continue
+                    
+                    # Commit hanya prefix berurutan agar high-water mark tidak melompati chunk yang belum selesai
+                    pending[table][index] = (entry, upper)
+                    committed = len(info['files'])
+                    while next_chunk[table] in pending[table]:
+                        entry, upper = pending[table].pop(next_chunk[table])
+                        info['files'].append(entry)
+                        info['high_water'] = _encode_high_water(upper)
+                        next_chunk[table] += 1
+                    if len(info['files']) != committed:
+                        _write_manifest(output_dir, manifest)
+        
+        if failed is not None:
+            self.write_restore_script(output_dir, manifest)
+            raise failed
+        
+        manifest['export_date'] = datetime.now().isoformat()
+        _write_manifest(output_dir, manifest)
+        self.write_restore_script(output_dir, manifest)
+        
+        total_rows = sum(r['rows'] or 0 for r in results)
+        total_mb = sum(r['bytes'] for r in results) / 1024 / 1024
+        print(f"\n✓ Incremental export completed: {total_rows:,} rows, {total_mb:.1f} MB, "
+              f"{len(results)} files in {time.time() - started:.1f}s")
+        return manifest
+    
+    def write_restore_script(self, output_dir, manifest):
+        """Tulis restore.sql (psql) yang memuat ulang file export dengan \\copy ... FROM"""
+        options = COPY_OPTIONS[manifest['format']]
+        tables = [t for t, info in manifest['tables'].items() if info['files']]
+        lines = [
+            "-- PZEM fast export restore (COPY FROM)",
+            f"-- Database: {manifest['database']}",
+            f"-- Export Date: {manifest['export_date']}",
+            "-- Tabel harus sudah ada (dibuat oleh service mqtt). Jalankan dari direktori ini:",
+            "--   psql -U postgres -d pzem_monitoring -f restore.sql",
+            "\\set ON_ERROR_STOP on",
+            "BEGIN;",
+        ]
+        if tables:
+            lines.append("TRUNCATE TABLE " + ', '.join(f'"{t}"' for t in tables) + " CASCADE;")
+        for table in tables:
+            info = manifest['tables'][table]
+            columns = ', '.join(f'"{c}"' for c in info['columns'])
+            for entry in info['files']:
+                if manifest['compress']:
+                    source = f"PROGRAM 'gzip -dc {entry['file']}'"
+                else:
+                    source = f"'{entry['file']}'"
+                # Segment lama bisa punya kolom berbeda jika skema berubah di antara run incremental
+                file_columns = ', '.join(f'"{c}"' for c in entry['columns']) if 'columns' in entry else columns
+                lines.append(f'\\copy "{table}" ({file_columns}) FROM {source} WITH ({options})')
+            if 'id' in info['columns']:
+                lines.append(f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                             f"COALESCE(MAX(\"id\"), 0) + 1, false) FROM \"{table}\";")
+        lines.append("COMMIT;")
+        
+        restore_file = os.path.join(output_dir, 'restore.sql')
+        with open(restore_file, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        print(f"  → Restore script: {restore_file}")
     
     def show_summary(self):
         """Menampilkan ringkasan database"""
@@ -333,6 +845,9 @@ Contoh penggunaan:
   # Export ke JSON
   python export_database.py --format json --output backup.json
   
+  # Export ke NDJSON terkompresi (satu record per baris, memori konstan)
+  python export_database.py --format ndjson --gzip --output backup.ndjson
+  
   # Export semua format
   python export_database.py --format all
   
@@ -341,13 +856,22 @@ Contoh penggunaan:
   
   # Hanya lihat summary
   python export_database.py --summary
+  
+  # Fast mode: COPY paralel ke CSV terkompresi + restore.sql
+  python export_database.py --fast --format csv --gzip --workers 4 --output backup_fast/
+  
+  # Fast mode binary (restore paling cepat, hanya untuk PostgreSQL)
+  python export_database.py --fast --format binary --output backup_bin/
+  
+  # Backup incremental harian ke direktori tetap (hanya baris baru pzem_data)
+  python export_database.py --incremental --gzip --output backups/pzem/
         """
     )
     
     parser.add_argument('--format', '-f', 
-                       choices=['sql', 'csv', 'json', 'all'],
+                       choices=['sql', 'csv', 'json', 'ndjson', 'binary', 'all'],
                        default='all',
-                       help='Format export (default: all)')
+                       help='Format export (default: all; --fast: csv atau binary)')
     
     parser.add_argument('--output', '-o',
                        help='Output file atau directory (default: auto-generated)')
@@ -373,8 +897,38 @@ Contoh penggunaan:
                        action='store_true',
                        help='Hanya tampilkan summary database, tidak export')
     
+    parser.add_argument('--fast',
+                       action='store_true',
+                       help='Export cepat dengan COPY TO STDOUT paralel + restore.sql')
+    
+    parser.add_argument('--incremental',
+                       action='store_true',
+                       help='Seperti --fast, tapi melanjutkan backup di --output (hanya data baru)')
+    
+    parser.add_argument('--gzip', '-z',
+                       action='store_true',
+                       help='Kompres file hasil --fast/json/ndjson dengan gzip')
+    
+    parser.add_argument('--workers', '-j',
+                       type=int,
+                       default=FAST_EXPORT_WORKERS,
+                       help=f'Jumlah worker process untuk --fast (default: {FAST_EXPORT_WORKERS})')
+    
+    parser.add_argument('--slice-rows',
+                       type=int,
+                       default=FAST_EXPORT_SLICE_ROWS,
+                       help=f'Target baris per file slice untuk --fast (default: {FAST_EXPORT_SLICE_ROWS:,})')
+    
     args = parser.parse_args()
     
+    if args.incremental and not args.output:
+        parser.error('--incremental membutuhkan --output (direktori backup yang tetap)')
+    args.fast = args.fast or args.incremental
+    if args.fast and args.format in ('sql', 'json', 'ndjson'):
+        parser.error('--fast/--incremental hanya mendukung --format csv atau binary')
+    if args.format == 'binary' and not args.fast:
+        parser.error('--format binary membutuhkan --fast')
+    
     # Override config dengan command line arguments
     config = DB_CONFIG.copy()
     if args.host:
@@ -391,8 +945,9 @@ Contoh penggunaan:
     # Create exporter
     exporter = DatabaseExporter(config)
     
-    # Show summary
-    exporter.show_summary()
+    # Show summary (dilewati pada --fast: COUNT(*) per tabel bisa lebih lama dari export-nya)
+    if not args.fast or args.summary:
+        exporter.show_summary()
     
     if args.summary:
         exporter.close()
@@ -401,6 +956,20 @@ Contoh penggunaan:
     # Generate output filename/directory
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
+    if args.fast:
+        fmt = 'binary' if args.format == 'binary' else 'csv'
+        fast_dir = args.output or f'pzem_fast_{fmt}_{timestamp}'
+        if args.incremental:
+            exporter.export_incremental(fast_dir, fmt=fmt, compress=args.gzip,
+                                        workers=args.workers, slice_rows=args.slice_rows)
+        else:
+            exporter.export_fast(fast_dir, fmt=fmt, compress=args.gzip,
+                                 workers=args.workers, slice_rows=args.slice_rows)
+        exporter.close()
+        print("\n✅ Export selesai!")
+        print(f"\nRestore dengan: cd {fast_dir} && psql -U postgres -d pzem_monitoring -f restore.sql")
+        return
+    
     if args.format == 'sql' or args.format == 'all':
         sql_file = args.output or f'pzem_backup_{timestamp}.sql'
         exporter.export_to_sql(sql_file)
@@ -411,7 +980,11 @@ Contoh penggunaan:
     
     if args.format == 'json' or args.format == 'all':
         json_file = args.output or f'pzem_backup_{timestamp}.json'
-        exporter.export_to_json(json_file)
+        exporter.export_to_json(json_file, compress=args.gzip)
+    
+    if args.format == 'ndjson':
+        ndjson_file = args.output or f'pzem_backup_{timestamp}.ndjson'
+        exporter.export_to_ndjson(ndjson_file, compress=args.gzip)
     
     exporter.close()
     
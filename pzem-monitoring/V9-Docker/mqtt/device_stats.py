@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Running per-device statistics (pzem_device_stats)
+Maintained by the ingest writer so /api/devices does not scan pzem_data
+"""
+
+import logging
+
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+DEVICE_STATS_COLUMNS = (
+    'device_address', 'sample_count',
+    'sum_voltage', 'sum_current', 'sum_power', 'sum_power_factor',
+    'min_voltage', 'max_voltage', 'min_power', 'max_power', 'max_energy',
+    'last_energy', 'first_seen', 'last_seen'
+)
+
+DEVICE_STATS_DDL = """
+CREATE TABLE IF NOT EXISTS pzem_device_stats (
+    device_address VARCHAR(20) PRIMARY KEY,
+    sample_count BIGINT NOT NULL DEFAULT 0,
+    sum_voltage DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_current DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_power DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_power_factor DOUBLE PRECISION NOT NULL DEFAULT 0,
+    min_voltage DOUBLE PRECISION,
+    max_voltage DOUBLE PRECISION,
+    min_power DOUBLE PRECISION,
+    max_power DOUBLE PRECISION,
+    max_energy DOUBLE PRECISION,
+    last_energy DOUBLE PRECISION,
+    first_seen TIMESTAMP,
+    last_seen TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+DEVICE_STATS_UPSERT = """
+INSERT INTO pzem_device_stats AS s ({columns})
+VALUES %s
+ON CONFLICT (device_address) DO UPDATE SET
+    sample_count = s.sample_count + EXCLUDED.sample_count,
+    sum_voltage = s.sum_voltage + EXCLUDED.sum_voltage,
+    sum_current = s.sum_current + EXCLUDED.sum_current,
+    sum_power = s.sum_power + EXCLUDED.sum_power,
+    sum_power_factor = s.sum_power_factor + EXCLUDED.sum_power_factor,
+    min_voltage = LEAST(s.min_voltage, EXCLUDED.min_voltage),
+    max_voltage = GREATEST(s.max_voltage, EXCLUDED.max_voltage),
+    min_power = LEAST(s.min_power, EXCLUDED.min_power),
+    max_power = GREATEST(s.max_power, EXCLUDED.max_power),
+    max_energy = GREATEST(s.max_energy, EXCLUDED.max_energy),
+    last_energy = CASE WHEN EXCLUDED.last_seen >= s.last_seen THEN EXCLUDED.last_energy ELSE s.last_energy END,
+    first_seen = LEAST(s.first_seen, EXCLUDED.first_seen),
+    last_seen = GREATEST(s.last_seen, EXCLUDED.last_seen),
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+DEVICE_STATS_BACKFILL = """
+INSERT INTO pzem_device_stats ({columns})
+SELECT
+    device_address,
+    COUNT(*),
+    COALESCE(SUM(voltage), 0), COALESCE(SUM(current), 0), COALESCE(SUM(power), 0),
+    COALESCE(SUM(power_factor), 0),
+    MIN(voltage), MAX(voltage), MIN(power), MAX(power), MAX(energy),
+    (array_agg(energy ORDER BY created_at DESC))[1],
+    MIN(created_at), MAX(created_at)
+FROM pzem_data
+WHERE created_at IS NOT NULL
+GROUP BY device_address
+ON CONFLICT (device_address) DO NOTHING
+"""
+
+SUM_FIELDS = (
+    ('sum_voltage', 'voltage'), ('sum_current', 'current'),
+    ('sum_power', 'power'), ('sum_power_factor', 'power_factor')
+)
+
+
+def _num(value):
+    return float(value) if value is not None else None
+
+
+def _least(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _greatest(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+def create_device_stats_table(cursor):
+    """Buat pzem_device_stats; jika baru dibuat, isi dari pzem_data (sekali)"""
+    cursor.execute("SELECT to_regclass('pzem_device_stats')")
+    exists = cursor.fetchone()[0] is not None
+    cursor.execute(DEVICE_STATS_DDL)
+    if not exists:
+        logger.info("[STATS] Backfilling pzem_device_stats from pzem_data...")
+        cursor.execute(DEVICE_STATS_BACKFILL.format(columns=', '.join(DEVICE_STATS_COLUMNS)))
+        logger.info(f"[STATS] Backfilled statistics for {cursor.rowcount} devices")
+
+
+def aggregate_device_stats(rows):
+    """Agregat batch per device di memori"""
+    stats = {}
+    for row in rows:
+        device_address = row['device_address']
+        ts = row['created_at']
+        agg = stats.get(device_address)
+        if agg is None:
+            agg = stats[device_address] = {
+                'device_address': device_address, 'sample_count': 0,
+                'sum_voltage': 0.0, 'sum_current': 0.0, 'sum_power': 0.0, 'sum_power_factor': 0.0,
+                'min_voltage': None, 'max_voltage': None, 'min_power': None, 'max_power': None,
+                'max_energy': None, 'last_energy': _num(row['energy']),
+                'first_seen': ts, 'last_seen': ts
+            }
+        agg['sample_count'] += 1
+        for sum_field, field in SUM_FIELDS:
+            if row[field] is not None:
+                agg[sum_field] += float(row[field])
+        voltage, power, energy = _num(row['voltage']), _num(row['power']), _num(row['energy'])
+        agg['min_voltage'] = _least(agg['min_voltage'], voltage)
+        agg['max_voltage'] = _greatest(agg['max_voltage'], voltage)
+        agg['min_power'] = _least(agg['min_power'], power)
+        agg['max_power'] = _greatest(agg['max_power'], power)
+        agg['max_energy'] = _greatest(agg['max_energy'], energy)
+        if ts < agg['first_seen']:
+            agg['first_seen'] = ts
+        if ts >= agg['last_seen']:
+            agg['last_seen'] = ts
+            agg['last_energy'] = energy
+    return stats
+
+
+def update_device_stats(cursor, rows):
+    """Upsert statistik device untuk satu batch (dalam transaksi batch yang sama)"""
+    stats = aggregate_device_stats(rows)
+    # Urutkan agar row lock selalu diambil dengan urutan yang sama
+    values = [
+        tuple(agg[col] for col in DEVICE_STATS_COLUMNS)
+        for _, agg in sorted(stats.items())
+    ]
+    execute_values(
+        cursor,
+        DEVICE_STATS_UPSERT.format(columns=', '.join(DEVICE_STATS_COLUMNS)),
+        values,
+        page_size=len(values)
+    )
+    return len(values)
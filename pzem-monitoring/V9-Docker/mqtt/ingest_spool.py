@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Durable on-disk spool for the PZEM MQTT listener
+Segmented append-only (write-ahead) files used while PostgreSQL is down or behind
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Spool configuration (override via environment)
+INGEST_SPOOL_ENABLED = os.getenv('INGEST_SPOOL_ENABLED', '1') not in ('0', 'false', 'False')
+INGEST_SPOOL_DIR = os.getenv('INGEST_SPOOL_DIR', 'spool')
+INGEST_SPOOL_SEGMENT_BYTES = int(os.getenv('INGEST_SPOOL_SEGMENT_BYTES', str(8 * 1024 * 1024)))
+INGEST_SPOOL_FSYNC = os.getenv('INGEST_SPOOL_FSYNC', '0') in ('1', 'true', 'True')
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+OFFSET_SUFFIX = '.offset'
+
+# Kolom datetime yang disimpan sebagai ISO string di spool
+DATETIME_FIELDS = ('timestamp_utc', 'created_at')
+
+
+class IngestSpool:
+    """Append-only spool tersegmentasi; setiap segmen menyimpan offset yang sudah di-commit"""
+
+    def __init__(self, directory=INGEST_SPOOL_DIR, segment_bytes=INGEST_SPOOL_SEGMENT_BYTES,
+                 fsync=INGEST_SPOOL_FSYNC):
+        self.directory = directory
+        self.segment_bytes = max(1024, segment_bytes)
+        self.fsync = fsync
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Segmen yang sudah ditutup (urut dari yang tertua) menunggu di-replay
+        existing = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        self._sealed = deque(os.path.join(self.directory, name) for name in existing)
+        self._next_seq = self._segment_seq(existing[-1]) + 1 if existing else 1
+
+        self._active_path = None
+        self._active_file = None
+        self._active_bytes = 0
+
+        self.appended_rows = 0
+        self.replayed_rows = 0
+
+        if self._sealed:
+            logger.warning(f"[SPOOL] Found {len(self._sealed)} unreplayed segment(s) in {self.directory}")
+
+    @staticmethod
+    def _segment_seq(name):
+        return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    @staticmethod
+    def _encode(row):
+        record = dict(row)
+        for field in DATETIME_FIELDS:
+            if isinstance(record.get(field), datetime):
+                record[field] = record[field].isoformat()
+        return json.dumps(record, separators=(',', ':')) + '\n'
+
+    @staticmethod
+    def _decode(line):
+        record = json.loads(line)
+        for field in DATETIME_FIELDS:
+            if record.get(field):
+                record[field] = datetime.fromisoformat(record[field])
+        return record
+
+    def _open_active(self):
+        self._active_path = os.path.join(
+            self.directory, f"{SEGMENT_PREFIX}{self._next_seq:012d}{SEGMENT_SUFFIX}")
+        self._next_seq += 1
+        self._active_file = open(self._active_path, 'a', encoding='utf-8')
+        self._active_bytes = 0
+
+    def _seal_active(self):
+        """Tutup segmen aktif dan masukkan ke antrian replay"""
+        if self._active_file is None:
+            return
+        self._active_file.flush()
+        os.fsync(self._active_file.fileno())
+        self._active_file.close()
+        if self._active_bytes > 0:
+            self._sealed.append(self._active_path)
+        else:
+            os.unlink(self._active_path)
+        self._active_file = None
+        self._active_path = None
+        self._active_bytes = 0
+
+    def append_many(self, rows):
+        """Tulis baris ke segmen aktif (rotasi otomatis berdasarkan ukuran)"""
+        if not rows:
+            return 0
+        with self._lock:
+            if self._active_file is None:
+                self._open_active()
+            for row in rows:
+                line = self._encode(row)
+                self._active_file.write(line)
+                self._active_bytes += len(line)
+            self._active_file.flush()
+            if self.fsync:
+                os.fsync(self._active_file.fileno())
+            self.appended_rows += len(rows)
+            if self._active_bytes >= self.segment_bytes:
+                self._seal_active()
+        return len(rows)
+
+    def append(self, row):
+        return self.append_many([row])
+
+    def has_backlog(self):
+        with self._lock:
+            return bool(self._sealed) or self._active_bytes > 0
+
+    def next_segment(self):
+        """Segmen tertua untuk di-replay; segmen aktif ditutup jika hanya itu yang tersisa"""
+        with self._lock:
+            if not self._sealed and self._active_bytes > 0:
+                self._seal_active()
+            return self._sealed[0] if self._sealed else None
+
+    def _read_offset(self, path):
+        try:
+            with open(path + OFFSET_SUFFIX, 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def commit_offset(self, path, offset, rows):
+        """Catat posisi yang sudah berhasil ditulis ke database (atomic rename)"""
+        tmp_path = path + OFFSET_SUFFIX + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path + OFFSET_SUFFIX)
+        with self._lock:
+            self.replayed_rows += rows
+
+    def read_chunks(self, path, chunk_rows):
+        """Yield (rows, offsets) mulai dari offset terakhir yang di-commit
+
+        offsets[i] adalah posisi file setelah rows[i], sehingga offset bisa di-commit
+        untuk sebagian chunk.
+        """
+        with open(path, 'rb') as f:
+            f.seek(self._read_offset(path))
+            rows = []
+            offsets = []
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                if not line.endswith(b'\n'):
+                    # Baris terpotong (crash saat menulis) - tidak bisa dipulihkan
+                    logger.warning(f"[SPOOL] Skipping truncated record at end of {path}")
+                    break
+                try:
+                    rows.append(self._decode(line))
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"[SPOOL] Skipping corrupt record in {path}: {e}")
+                    continue
+                offsets.append(f.tell())
+                if len(rows) >= chunk_rows:
+                    yield rows, offsets
+                    rows = []
+                    offsets = []
+            if rows:
+                yield rows, offsets
+
+    def remove_segment(self, path):
+        """Hapus segmen yang sudah selesai di-replay"""
+        with self._lock:
+            if self._sealed and self._sealed[0] == path:
+                self._sealed.popleft()
+        for target in (path, path + OFFSET_SUFFIX):
+            try:
+                os.unlink(target)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        with self._lock:
+            self._seal_active()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'spool_segments': len(self._sealed) + (1 if self._active_bytes > 0 else 0),
+                'spool_active_bytes': self._active_bytes,
+                'spool_appended_rows': self.appended_rows,
+                'spool_replayed_rows': self.replayed_rows
+            }
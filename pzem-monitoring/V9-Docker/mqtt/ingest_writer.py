@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Buffered ingest writer for the PZEM MQTT listener
+Moves database writes off the paho network thread and commits in batches
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Batching configuration (override via environment)
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '10000'))
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '500'))
+INGEST_FLUSH_INTERVAL = float(os.getenv('INGEST_FLUSH_INTERVAL', '1.0'))  # seconds
+DB_RECONNECT_DELAY = float(os.getenv('DB_RECONNECT_DELAY', '1.0'))  # backoff awal (detik)
+DB_RECONNECT_MAX_DELAY = float(os.getenv('DB_RECONNECT_MAX_DELAY', '30.0'))
+INGEST_REPLAY_BATCH_SIZE = int(os.getenv('INGEST_REPLAY_BATCH_SIZE', '5000'))
+
+
+class IngestWriter:
+    """Bounded queue + writer thread yang flush berdasarkan ukuran atau umur batch"""
+
+    def __init__(self, data_handler, batch_size=INGEST_BATCH_SIZE,
+                 flush_interval=INGEST_FLUSH_INTERVAL, queue_size=INGEST_QUEUE_SIZE,
+                 spool=None, replay_batch_size=INGEST_REPLAY_BATCH_SIZE):
+        self.data_handler = data_handler
+        self.spool = spool
+        self.replay_batch_size = max(1, replay_batch_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.01, flush_interval)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.running = False
+        self.thread = None
+        self._stop_event = threading.Event()
+
+        # Connection health: kegagalan dideteksi dari error write, bukan SELECT 1
+        self.db_healthy = data_handler.db_connection is not None
+        self.reconnect_delay = DB_RECONNECT_DELAY
+        self.reconnect_max_delay = DB_RECONNECT_MAX_DELAY
+
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.reconnects = 0
+        self.reconnect_failures = 0
+        self.replays = 0
+        self.replayed_rows = 0
+        self.lost_rows = 0
+        self.spooled = 0
+
+    def start(self):
+        """Mulai writer thread"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.running = True
+        self._stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+        self.thread.start()
+        logger.info(f"[INGEST] Writer started (batch_size={self.batch_size}, "
+                    f"flush_interval={self.flush_interval}s, queue_size={self.queue.maxsize})")
+
+    def stop(self, timeout=10):
+        """Hentikan writer dan flush sisa antrian"""
+        self.running = False
+        self._stop_event.set()
+        if self.thread:
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                # Writer masih di tengah batch/replay dari spool: jangan drain antrian atau tutup
+                # spool di bawahnya (baris bisa hilang); thread daemon berhenti bersama proses
+                logger.warning(f"[INGEST] Writer did not stop within {timeout}s; "
+                               f"leaving spool open ({self.queue.qsize()} rows left in queue)")
+                return
+        if self.spool:
+            # Sisa antrian yang belum tertulis disimpan ke spool agar tidak hilang
+            leftover = self._drain_all()
+            if leftover:
+                self.spool.append_many(leftover)
+            self.spool.close()
+        logger.info(f"[INGEST] Writer stopped ({self.queue.qsize()} rows left in queue)")
+
+    def submit(self, row):
+        """Masukkan satu baris ke antrian tanpa memblokir thread MQTT.
+        
+        Jika database sedang down, writer tertinggal (antrian penuh), atau
+        spool masih punya backlog, baris ditulis ke spool di disk.
+        """
+        if self.spool and (not self.db_healthy or self.spool.has_backlog()):
+            return self._spool_rows([row])
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            if self.spool:
+                return self._spool_rows([row])
+            with self._stats_lock:
+                self.dropped += 1
+            logger.warning(f"[INGEST] Queue full ({self.queue.maxsize}), dropping row for "
+                           f"device {row.get('device_address')}")
+            return False
+        with self._stats_lock:
+            self.enqueued += 1
+        return True
+
+    def _spool_rows(self, rows):
+        try:
+            self.spool.append_many(rows)
+        except Exception as e:
+            with self._stats_lock:
+                self.dropped += len(rows)
+            logger.error(f"[SPOOL] Failed to spool {len(rows)} rows: {e}")
+            return False
+        with self._stats_lock:
+            self.spooled += len(rows)
+        return True
+
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def get_stats(self):
+        """Snapshot metrik writer (queue depth dan flush latency)"""
+        with self._stats_lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'queue_capacity': self.queue.maxsize,
+                'enqueued': self.enqueued,
+                'dropped': self.dropped,
+                'written': self.written,
+                'batches': self.batches,
+                'failed_batches': self.failed_batches,
+                'last_batch_size': self.last_batch_size,
+                'last_flush_ms': round(self.last_flush_ms, 2),
+                'avg_flush_ms': round(self.total_flush_ms / self.batches, 2) if self.batches else 0.0,
+                'max_flush_ms': round(self.max_flush_ms, 2),
+                'db_healthy': self.db_healthy,
+                'reconnects': self.reconnects,
+                'reconnect_failures': self.reconnect_failures,
+                'replays': self.replays,
+                'replayed_rows': self.replayed_rows,
+                'lost_rows': self.lost_rows,
+                'spooled': self.spooled,
+                **(self.spool.get_stats() if self.spool else {})
+            }
+
+    def _collect_batch(self):
+        """Ambil baris dari antrian sampai batch penuh atau flush_interval habis"""
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain_all(self):
+        rows = []
+        while True:
+            try:
+                rows.append(self.queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def _drain_nowait(self):
+        """Ambil semua sisa antrian (dipakai saat shutdown)"""
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _save_isolating(self, rows, tag):
+        """save_batch; jika gagal karena data (bukan koneksi), batch dibelah dua sampai baris
+        yang salah ketemu sehingga hanya baris itu yang ditolak.
+
+        Potongan ditulis berurutan, jadi baris yang belum ditulis selalu sufiks dari rows.
+        Return (written, pending, error): pending berisi baris yang belum tertulis saat
+        koneksi putus (error = exception koneksi), kosong jika selesai.
+        """
+        written = 0
+        isolating = False
+        stack = [rows]  # potongan berikutnya di akhir list
+        while stack:
+            part = stack.pop()
+            try:
+                self.data_handler.save_batch(part)
+            except Exception as e:
+                if self.data_handler.is_connection_error(e):
+                    return written, part + [row for chunk in reversed(stack) for row in chunk], e
+                if not isolating:
+                    isolating = True
+                    logger.error(f"{tag} Failed to write batch of {len(rows)} rows ({e}), "
+                                 f"isolating bad rows")
+                    with self._stats_lock:
+                        self.failed_batches += 1
+                if len(part) == 1:
+                    logger.error(f"{tag} Rejecting unwritable row for device "
+                                 f"{part[0].get('device_address')}: {e}")
+                    with self._stats_lock:
+                        self.lost_rows += 1
+                    continue
+                mid = len(part) // 2
+                stack.append(part[mid:])
+                stack.append(part[:mid])
+                continue
+            written += len(part)
+        return written, [], None
+
+    def _flush(self, batch):
+        """Tulis satu batch ke database dengan satu commit.
+        
+        Jika koneksi putus, batch disimpan, koneksi dibuka ulang dengan
+        backoff, lalu batch yang sama di-replay. Baris dengan data yang
+        tidak bisa ditulis ditolak satu per satu (lihat _save_isolating).
+        """
+        while True:
+            start = time.perf_counter()
+            written, pending, e = self._save_isolating(batch, '[INGEST]')
+            if written:
+                with self._stats_lock:
+                    self.written += written
+            if e is not None:
+                batch = pending
+                self.db_healthy = False
+                if self.spool:
+                    # Batch + isi antrian dipindah ke spool; replay dilakukan dari disk
+                    spilled = batch + self._drain_all()
+                    logger.warning(f"[INGEST] Database write failed ({e}), "
+                                   f"spooling {len(spilled)} rows to disk")
+                    self._spool_rows(spilled)
+                    self._reconnect_with_backoff()
+                    return False
+
+                logger.warning(f"[INGEST] Database write failed ({e}), "
+                               f"retaining batch of {len(batch)} rows for replay")
+                if not self._reconnect_with_backoff():
+                    logger.error(f"[INGEST] Shutting down while database is unavailable, "
+                                 f"{len(batch)} rows not written")
+                    with self._stats_lock:
+                        self.failed_batches += 1
+                        self.lost_rows += len(batch)
+                    return False
+                with self._stats_lock:
+                    self.replays += 1
+                    self.replayed_rows += len(batch)
+                continue
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._stats_lock:
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                self.last_batch_size = len(batch)
+                self.batches += 1
+                self.total_flush_ms += elapsed_ms
+
+            logger.debug(f"[INGEST] Flushed {written}/{len(batch)} rows in {elapsed_ms:.1f} ms "
+                         f"(queue depth: {self.queue.qsize()})")
+            return written == len(batch)
+
+    def _reconnect_with_backoff(self):
+        """Coba reconnect dengan exponential backoff sampai berhasil atau writer dihentikan"""
+        delay = self.reconnect_delay
+        while self.running:
+            if self._stop_event.wait(delay):
+                break
+            try:
+                self.data_handler.reconnect()
+            except Exception as e:
+                with self._stats_lock:
+                    self.reconnect_failures += 1
+                logger.warning(f"[INGEST] Reconnect failed ({e}), retrying in "
+                               f"{min(delay * 2, self.reconnect_max_delay):.0f}s")
+                delay = min(delay * 2, self.reconnect_max_delay)
+                continue
+
+            with self._stats_lock:
+                self.reconnects += 1
+            self.db_healthy = True
+            logger.info("[INGEST] Database connection restored, replaying retained batch")
+            return True
+        return False
+
+    def _replay_spool(self):
+        """Replay satu segmen spool ke database dalam batch besar"""
+        path = self.spool.next_segment()
+        if path is None:
+            return
+        logger.info(f"[REPLAY] Replaying spool segment {os.path.basename(path)}")
+        for rows, offsets in self.spool.read_chunks(path, self.replay_batch_size):
+            if not self.running:
+                return
+            start = time.perf_counter()
+            written, pending, e = self._save_isolating(rows, '[REPLAY]')
+            handled = len(rows) - len(pending)
+            if handled:
+                # Offset hanya maju sampai baris terakhir yang sudah ditulis/ditolak
+                self.spool.commit_offset(path, offsets[handled - 1], written)
+                with self._stats_lock:
+                    self.written += written
+            if e is not None:
+                # Sisa chunk diulang dari offset yang di-commit setelah reconnect
+                logger.warning(f"[REPLAY] Database unavailable during replay ({e})")
+                self.db_healthy = False
+                self._reconnect_with_backoff()
+                return
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            logger.info(f"[REPLAY] Wrote {written}/{len(rows)} spooled rows in {elapsed_ms:.1f} ms")
+        self.spool.remove_segment(path)
+
+    def _run(self):
+        if not self.db_healthy:
+            self._reconnect_with_backoff()
+
+        while self.running:
+            if self.spool and self.db_healthy and self.queue.empty() and self.spool.has_backlog():
+                self._replay_spool()
+                continue
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+
+        # Flush sisa antrian sebelum keluar
+        while self.db_healthy:
+            batch = self._drain_nowait()
+            if not batch:
+                break
+            self._flush(batch)
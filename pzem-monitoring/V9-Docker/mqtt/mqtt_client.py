@@ -7,7 +7,7 @@ Enhanced Windows-compatible version with improved error handling
 import json
 import paho.mqtt.client as mqtt
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import logging
 from datetime import datetime
 import time
@@ -15,6 +15,12 @@ import sys
 import signal
 import os
 import pytz
+from ingest_writer import IngestWriter
+from ingest_spool import IngestSpool, INGEST_SPOOL_ENABLED
+import partition_manager
+from partition_manager import PartitionMaintenance
+from rollups import create_rollup_tables, update_rollups
+from device_stats import create_device_stats_table, update_device_stats
 
 # Jakarta timezone for local time handling
 JAKARTA_TZ = pytz.timezone('Asia/Jakarta')
@@ -44,16 +50,39 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Kolom pzem_data yang diisi oleh ingest (urutan = urutan VALUES)
+PZEM_DATA_COLUMNS = (
+    'device_address', 'voltage', 'current', 'power', 'energy', 'frequency',
+    'power_factor', 'wifi_rssi', 'device_timestamp', 'sample_interval',
+    'sample_count', 'device_status', 'data_quality', 'timestamp_utc', 'created_at'
+)
+
+# Channel LISTEN/NOTIFY untuk memberi tahu dashboard ada data baru
+INGEST_NOTIFY_CHANNEL = os.getenv('INGEST_NOTIFY_CHANNEL', 'pzem_ingest')
+NOTIFY_PAYLOAD_LIMIT = 7900  # batas payload NOTIFY PostgreSQL 8000 bytes
+
+# Kolom pzem_latest (satu baris per device)
+PZEM_LATEST_COLUMNS = (
+    'device_address', 'voltage', 'current', 'power', 'energy', 'frequency',
+    'power_factor', 'wifi_rssi', 'device_timestamp', 'device_status',
+    'data_quality', 'timestamp_utc', 'created_at'
+)
+
 class PZEMDataHandler:
-    def __init__(self):
+    def __init__(self, exit_on_failure=True):
         self.db_connection = None
         self.reconnect_attempts = 0
         self.max_reconnect_attempts = 5
+        self.tables_verified = False
         self.jakarta_tz = pytz.timezone('Asia/Jakarta')
-        self.connect_db()
+        self.connect_db(exit_on_failure)
         
-    def connect_db(self):
-        """Koneksi ke PostgreSQL dengan retry logic"""
+    def connect_db(self, exit_on_failure=True):
+        """Koneksi ke PostgreSQL dengan retry logic.
+        
+        Jika exit_on_failure=False (spool aktif), listener tetap jalan tanpa
+        database; data ditampung di spool sampai koneksi pulih.
+        """
         while self.reconnect_attempts < self.max_reconnect_attempts:
             try:
                 self.db_connection = psycopg2.connect(**DB_CONFIG)
@@ -65,24 +94,44 @@ class PZEMDataHandler:
                 logger.error(f"Database connection attempt {self.reconnect_attempts} failed: {e}")
                 if self.reconnect_attempts < self.max_reconnect_attempts:
                     time.sleep(5)  # Wait 5 seconds before retry
-                else:
+                elif exit_on_failure:
                     logger.error("Max reconnection attempts reached. Exiting.")
                     sys.exit(1)
+                else:
+                    logger.error("Max reconnection attempts reached. Continuing with on-disk spool.")
+                    self.reconnect_attempts = 0
+                    return
     
     def ensure_db_connection(self):
-        """Pastikan koneksi database aktif"""
+        """Pastikan objek koneksi ada (tanpa round trip ke server).
+        
+        Kegagalan koneksi dideteksi dari error saat write sebenarnya,
+        lalu ditangani IngestWriter dengan reconnect + replay batch.
+        """
+        if self.db_connection is None or self.db_connection.closed:
+            logger.warning("Database connection lost, reconnecting...")
+            self.reconnect()
+    
+    def reconnect(self):
+        """Buka ulang koneksi database (satu percobaan, error diteruskan ke pemanggil)"""
         try:
-            if self.db_connection is None or self.db_connection.closed:
-                logger.warning("Database connection lost, reconnecting...")
-                self.connect_db()
-            else:
-                # Test connection
-                cursor = self.db_connection.cursor()
-                cursor.execute("SELECT 1")
-                cursor.close()
-        except Exception as e:
-            logger.error(f"Database connection test failed: {e}")
-            self.connect_db()
+            if self.db_connection is not None and not self.db_connection.closed:
+                self.db_connection.close()
+        except Exception:
+            pass
+        self.db_connection = None
+        self.db_connection = psycopg2.connect(**DB_CONFIG)
+        logger.info("Reconnected to PostgreSQL database")
+        
+        # Listener bisa start saat database masih down
+        if not self.tables_verified:
+            self.create_tables()
+    
+    def is_connection_error(self, error):
+        """True jika error berasal dari koneksi yang putus/bermasalah (bukan data yang salah)"""
+        if isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+            return True
+        return self.db_connection is None or bool(self.db_connection.closed)
     
     def create_tables(self):
         """Pastikan tabel ada dengan struktur yang benar"""
@@ -90,6 +139,16 @@ class PZEMDataHandler:
             self.ensure_db_connection()
             cursor = self.db_connection.cursor()
             
+            # Instalasi baru: pzem_data dibuat sebagai tabel partisi (RANGE created_at)
+            table_kind = partition_manager.get_table_kind(cursor)
+            if partition_manager.partitioning_enabled():
+                if table_kind is None:
+                    partition_manager.create_partitioned_table(cursor)
+                    partition_manager.ensure_partitions(cursor)
+                elif table_kind != 'p':
+                    logger.warning("pzem_data is a regular (non-partitioned) table; "
+                                   "partition maintenance is disabled for this database")
+            
             # Create table jika belum ada (struktur sudah dibuat di fresh_setup)
             create_table_query = """
             CREATE TABLE IF NOT EXISTS pzem_data (
@@ -131,94 +190,211 @@ class PZEMDataHandler:
             """
             
             cursor.execute(create_table_query)
+            
+            # Satu baris data terbaru per device (backfill sekali saat pertama dibuat)
+            cursor.execute("SELECT to_regclass('pzem_latest')")
+            latest_exists = cursor.fetchone()[0] is not None
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS pzem_latest (
+                device_address VARCHAR(20) PRIMARY KEY,
+                voltage DECIMAL(8,2),
+                current DECIMAL(8,3),
+                power DECIMAL(10,2),
+                energy DECIMAL(12,3),
+                frequency DECIMAL(6,2),
+                power_factor DECIMAL(5,3),
+                wifi_rssi INTEGER,
+                device_timestamp BIGINT,
+                device_status VARCHAR(20),
+                data_quality VARCHAR(20),
+                timestamp_utc TIMESTAMP,
+                created_at TIMESTAMP NOT NULL
+            );
+            """)
+            if not latest_exists:
+                cursor.execute(f"""
+                INSERT INTO pzem_latest ({', '.join(PZEM_LATEST_COLUMNS)})
+                SELECT DISTINCT ON (device_address) {', '.join(PZEM_LATEST_COLUMNS)}
+                FROM pzem_data
+                WHERE created_at IS NOT NULL
+                ORDER BY device_address, created_at DESC
+                """)
+                logger.info(f"Backfilled pzem_latest with {cursor.rowcount} devices")
+            
+            # Tabel rollup 1m/15m/1h/1d (backfill sekali saat pertama dibuat)
+            create_rollup_tables(cursor)
+            
+            # Statistik berjalan per device (backfill sekali saat pertama dibuat)
+            create_device_stats_table(cursor)
+            
             self.db_connection.commit()
             cursor.close()
+            self.tables_verified = True
             logger.info("Database tables verified/created")
             
         except Exception as e:
             logger.error(f"Error creating tables: {e}")
-            self.db_connection.rollback()
+            if self.db_connection and not self.db_connection.closed:
+                self.db_connection.rollback()
     
-    def save_sensor_data(self, data):
-        """Simpan data sensor dengan timestamp Jakarta"""
+    def parse_sensor_data(self, data, received_at=None):
+        """Ubah payload MQTT menjadi satu baris pzem_data (dict)"""
+        # Validasi data yang diperlukan
+        if not data.get('device_address'):
+            logger.error("Missing device_address in data")
+            return None
+        
+        # Waktu terima (UTC) dicatat di sini karena commit dilakukan per batch
+        received_at = received_at or datetime.utcnow()
+        
+        return {
+            'device_address': str(data.get('device_address')).strip(),
+            'voltage': self.safe_float(data.get('voltage') or data.get('avg_voltage')),
+            'current': self.safe_float(data.get('current') or data.get('avg_current')),
+            'power': self.safe_float(data.get('power') or data.get('avg_power')),
+            'energy': self.safe_float(data.get('energy') or data.get('total_energy')),
+            'frequency': self.safe_float(data.get('frequency', 50.0)),
+            'power_factor': self.safe_float(data.get('power_factor', 1.0)),
+            'wifi_rssi': self.safe_int(data.get('wifi_rssi')),
+            'device_timestamp': self.safe_int(data.get('timestamp') or data.get('device_timestamp')),
+            'sample_interval': self.safe_int(data.get('interval_minutes', 60)),
+            'sample_count': self.safe_int(data.get('sample_count', 1)),
+            'device_status': 'online',
+            'data_quality': 'live',
+            'timestamp_utc': received_at,
+            'created_at': received_at
+        }
+    
+    def save_batch(self, rows):
+        """Simpan banyak baris sekaligus: satu multi-row INSERT dan satu commit"""
+        if not rows:
+            return 0
+        
+        self.ensure_db_connection()
+        cursor = self.db_connection.cursor()
         try:
-            self.ensure_db_connection()
-            cursor = self.db_connection.cursor()
+            insert_query = f"""
+            INSERT INTO pzem_data ({', '.join(PZEM_DATA_COLUMNS)})
+            VALUES %s
+            """
+            values = [tuple(row[col] for col in PZEM_DATA_COLUMNS) for row in rows]
+            execute_values(cursor, insert_query, values, page_size=len(values))
             
-            # Get Jakarta time for logging
-            jakarta_now = datetime.now(self.jakarta_tz)
+            # Update device metadata (coalesced per device)
+            self.update_device_metadata(rows, cursor)
             
-            # Validasi data yang diperlukan
-            if not data.get('device_address'):
-                logger.error("Missing device_address in data")
-                return False
+            # Snapshot data terbaru per device (pzem_latest)
+            self.update_latest(rows, cursor)
             
-            # Extract dan bersihkan data (sama seperti sebelumnya)
-            device_address = str(data.get('device_address')).strip()
-            voltage = self.safe_float(data.get('voltage') or data.get('avg_voltage'))
-            current = self.safe_float(data.get('current') or data.get('avg_current'))
-            power = self.safe_float(data.get('power') or data.get('avg_power'))
-            energy = self.safe_float(data.get('energy') or data.get('total_energy'))
-            frequency = self.safe_float(data.get('frequency', 50.0))
-            power_factor = self.safe_float(data.get('power_factor', 1.0))
-            
-            # Data tambahan
-            wifi_rssi = self.safe_int(data.get('wifi_rssi'))
-            device_timestamp = self.safe_int(data.get('timestamp') or data.get('device_timestamp'))
-            sample_interval = self.safe_int(data.get('interval_minutes', 60))
-            sample_count = self.safe_int(data.get('sample_count', 1))
-            
-            # Insert data dengan timestamp UTC (database tetap menggunakan UTC)
-            insert_query = """
-            INSERT INTO pzem_data (
-                device_address, voltage, current, power, energy, frequency, 
-                power_factor, wifi_rssi, device_timestamp, sample_interval, 
-                sample_count, device_status, data_quality
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-            )
-            """
+            # Rollup per bucket ikut di-commit bersama batch
+            update_rollups(cursor, rows)
             
-            values = (
-                device_address, voltage, current, power, energy, frequency,
-                power_factor, wifi_rssi, device_timestamp, sample_interval,
-                sample_count, 'online', 'live'
-            )
+            # Statistik berjalan per device (untuk /api/devices)
+            update_device_stats(cursor, rows)
             
-            cursor.execute(insert_query, values)
-            
-            # Update device metadata
-            self.update_device_metadata(device_address, cursor)
+            # Notifikasi dikirim PostgreSQL saat commit
+            self.notify_ingest(rows, cursor)
             
             self.db_connection.commit()
-            cursor.close()
+            return len(rows)
+        except Exception:
+            try:
+                if self.db_connection and not self.db_connection.closed:
+                    self.db_connection.rollback()
+            except psycopg2.Error:
+                pass
+            raise
+        finally:
+            try:
+                cursor.close()
+            except psycopg2.Error:
+                pass
+    
+    def save_sensor_data(self, data):
+        """Simpan satu data sensor secara langsung (tanpa antrian)"""
+        try:
+            row = self.parse_sensor_data(data)
+            if row is None:
+                return False
+            
+            self.save_batch([row])
             
-            logger.info(f"[OK] Data saved for device {device_address} at {jakarta_now.strftime('%H:%M:%S')} WIB - Power: {power}W, Voltage: {voltage}V")
+            jakarta_now = datetime.now(self.jakarta_tz)
+            logger.info(f"[OK] Data saved for device {row['device_address']} at {jakarta_now.strftime('%H:%M:%S')} WIB - Power: {row['power']}W, Voltage: {row['voltage']}V")
             return True
             
         except Exception as e:
             logger.error(f"Error saving data: {e}")
-            if self.db_connection:
-                self.db_connection.rollback()
             return False
     
-    def update_device_metadata(self, device_address, cursor):
-        """Update metadata device"""
+    def update_device_metadata(self, rows, cursor):
+        """Update metadata device: satu upsert per device untuk seluruh batch"""
         try:
+            # Hitung jumlah pesan dan last_seen terbaru per device dalam batch
+            per_device = {}
+            for row in rows:
+                device_address = row['device_address']
+                count, last_seen = per_device.get(device_address, (0, None))
+                seen_at = row['created_at']
+                if last_seen is None or seen_at > last_seen:
+                    last_seen = seen_at
+                per_device[device_address] = (count + 1, last_seen)
+            
+            # Urutkan agar row lock selalu diambil dengan urutan yang sama
+            values = [
+                (device_address, last_seen, count)
+                for device_address, (count, last_seen) in sorted(per_device.items())
+            ]
+            
             upsert_query = """
             INSERT INTO pzem_devices (device_address, last_seen, total_records)
-            VALUES (%s, CURRENT_TIMESTAMP, 1)
+            VALUES %s
             ON CONFLICT (device_address) 
             DO UPDATE SET 
-                last_seen = CURRENT_TIMESTAMP,
-                total_records = pzem_devices.total_records + 1,
+                last_seen = GREATEST(pzem_devices.last_seen, EXCLUDED.last_seen),
+                total_records = pzem_devices.total_records + EXCLUDED.total_records,
                 updated_at = CURRENT_TIMESTAMP;
             """
             
-            cursor.execute(upsert_query, (device_address,))
+            execute_values(cursor, upsert_query, values, page_size=len(values))
+            return len(values)
             
         except Exception as e:
             logger.error(f"Error updating device metadata: {e}")
+            raise
+    
+    def update_latest(self, rows, cursor):
+        """Upsert baris terbaru tiap device ke pzem_latest (satu upsert per batch)"""
+        latest = {}
+        for row in rows:
+            existing = latest.get(row['device_address'])
+            if existing is None or row['created_at'] >= existing['created_at']:
+                latest[row['device_address']] = row
+        
+        values = [
+            tuple(row[col] for col in PZEM_LATEST_COLUMNS)
+            for _, row in sorted(latest.items())
+        ]
+        update_columns = ', '.join(
+            f"{col} = EXCLUDED.{col}" for col in PZEM_LATEST_COLUMNS if col != 'device_address'
+        )
+        upsert_query = f"""
+        INSERT INTO pzem_latest ({', '.join(PZEM_LATEST_COLUMNS)})
+        VALUES %s
+        ON CONFLICT (device_address) DO UPDATE SET {update_columns}
+        WHERE pzem_latest.created_at <= EXCLUDED.created_at;
+        """
+        execute_values(cursor, upsert_query, values, page_size=len(values))
+        return len(values)
+    
+    def notify_ingest(self, rows, cursor):
+        """NOTIFY dashboard tentang device yang datanya berubah di batch ini"""
+        devices = sorted({row['device_address'] for row in rows})
+        payload = json.dumps({'devices': devices, 'rows': len(rows)}, separators=(',', ':'))
+        if len(payload) > NOTIFY_PAYLOAD_LIMIT:
+            # Terlalu banyak device: dashboard akan refresh semua device
+            payload = json.dumps({'devices': None, 'rows': len(rows)})
+        cursor.execute("SELECT pg_notify(%s, %s)", (INGEST_NOTIFY_CHANNEL, payload))
     
     def safe_float(self, value):
         """Safely convert value to float"""
@@ -239,8 +415,9 @@ class PZEMDataHandler:
             return None
 
 class MQTTClient:
-    def __init__(self, data_handler):
+    def __init__(self, data_handler, ingest_writer):
         self.data_handler = data_handler
+        self.ingest_writer = ingest_writer
         self.client = None
         self.connected = False
         self.message_count = 0
@@ -323,11 +500,14 @@ class MQTTClient:
             
             logger.info(f"[DATA] Device {device}: {power}W, {voltage}V")
             
-            # Simpan ke database
-            if userdata.save_sensor_data(data):
-                logger.debug("[DATABASE] Data successfully saved")
+            # Masukkan ke antrian ingest; penulisan ke database dilakukan writer thread
+            row = userdata.parse_sensor_data(data)
+            if row is None:
+                return
+            if self.ingest_writer.submit(row):
+                logger.debug(f"[QUEUE] Row queued (depth: {self.ingest_writer.queue_depth()})")
             else:
-                logger.warning("[DATABASE] Data save failed")
+                logger.warning("[QUEUE] Row dropped, ingest queue is full")
             
         except Exception as e:
             logger.error(f"[ERROR] Error processing message: {e}")
@@ -396,6 +576,19 @@ class MQTTClient:
                         time_since_last = datetime.now() - self.last_message_time
                         logger.info(f"[STATUS] Last message: {time_since_last.total_seconds():.0f} seconds ago")
                     
+                    stats = self.ingest_writer.get_stats()
+                    logger.info(f"[STATUS] Ingest queue: {stats['queue_depth']}/{stats['queue_capacity']} | "
+                                f"Written: {stats['written']} in {stats['batches']} batches | "
+                                f"Flush: last {stats['last_flush_ms']} ms, avg {stats['avg_flush_ms']} ms, "
+                                f"max {stats['max_flush_ms']} ms | Dropped: {stats['dropped']}")
+                    logger.info(f"[STATUS] DB {'healthy' if stats['db_healthy'] else 'DOWN'} | "
+                                f"Reconnects: {stats['reconnects']} | Replays: {stats['replays']} "
+                                f"({stats['replayed_rows']} rows)")
+                    if 'spool_segments' in stats:
+                        logger.info(f"[STATUS] Spool: {stats['spool_segments']} segment(s) pending | "
+                                    f"Spooled: {stats['spool_appended_rows']} | "
+                                    f"Replayed: {stats['spool_replayed_rows']}")
+                    
                     last_status_time = current_time
                 
                 # Reconnect jika terputus
@@ -442,20 +635,39 @@ def main():
     
     # Inisialisasi handler database
     try:
-        data_handler = PZEMDataHandler()
-        data_handler.create_tables()
-        logger.info("[SUCCESS] Database initialized successfully")
+        data_handler = PZEMDataHandler(exit_on_failure=not INGEST_SPOOL_ENABLED)
+        if data_handler.db_connection is not None:
+            data_handler.create_tables()
+            logger.info("[SUCCESS] Database initialized successfully")
+        else:
+            logger.warning("[WARNING] Database unavailable, buffering data to on-disk spool")
     except Exception as e:
         logger.error(f"[ERROR] Database initialization failed: {e}")
         return
     
+    # Maintenance partisi pzem_data (pre-create ke depan + retention)
+    partition_maintenance = PartitionMaintenance(DB_CONFIG)
+    partition_maintenance.start()
+    
+    # Spool di disk untuk data yang diterima saat database down/tertinggal
+    spool = IngestSpool() if INGEST_SPOOL_ENABLED else None
+    
+    # Writer thread untuk batch insert
+    ingest_writer = IngestWriter(data_handler, spool=spool)
+    ingest_writer.start()
+    
     # Setup MQTT client
     global mqtt_client_instance
-    mqtt_client_instance = MQTTClient(data_handler)
+    mqtt_client_instance = MQTTClient(data_handler, ingest_writer)
     mqtt_client_instance.setup_client()
     
     # Connect and start processing
-    mqtt_client_instance.connect_and_loop()
+    try:
+        mqtt_client_instance.connect_and_loop()
+    finally:
+        # Flush sisa antrian sebelum keluar
+        partition_maintenance.stop()
+        ingest_writer.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Time-partition management for pzem_data
+Creates native RANGE partitions on created_at and expires old ones by retention
+"""
+
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+import psycopg2
+
+from rollups import prune_rollups
+
+logger = logging.getLogger(__name__)
+
+# Partitioning configuration (override via environment)
+PARTITION_INTERVAL = os.getenv('PARTITION_INTERVAL', 'month').lower()  # day | month | none
+PARTITION_PREMAKE = int(os.getenv('PARTITION_PREMAKE', '3'))  # jumlah partisi ke depan
+PARTITION_RETENTION_ACTION = os.getenv('PARTITION_RETENTION_ACTION', 'drop').lower()  # drop | detach
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv('PARTITION_MAINTENANCE_INTERVAL', '3600'))  # detik
+DATA_RETENTION_DAYS = int(os.getenv('DATA_RETENTION_DAYS', '90'))  # 0 = simpan selamanya
+
+PARENT_TABLE = 'pzem_data'
+DEFAULT_PARTITION = 'pzem_data_default'
+PARTITION_NAME_RE = re.compile(r'^pzem_data_p(\d{8}|\d{6})$')
+
+# Struktur sama dengan tabel heap lama; PK wajib menyertakan kolom partisi
+PARTITIONED_TABLE_DDL = """
+CREATE TABLE pzem_data (
+    id BIGSERIAL,
+    device_address VARCHAR(20) NOT NULL,
+    voltage DECIMAL(8,2),
+    current DECIMAL(8,3),
+    power DECIMAL(10,2),
+    energy DECIMAL(12,3),
+    frequency DECIMAL(6,2) DEFAULT 50.0,
+    power_factor DECIMAL(5,3) DEFAULT 1.0,
+    wifi_rssi INTEGER,
+    device_timestamp BIGINT,
+    sample_interval INTEGER DEFAULT 60,
+    sample_count INTEGER DEFAULT 1,
+    device_status VARCHAR(20) DEFAULT 'online',
+    data_quality VARCHAR(20) DEFAULT 'good',
+    timestamp_utc TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS pzem_data_default PARTITION OF pzem_data DEFAULT;
+"""
+
+
+def partitioning_enabled():
+    return PARTITION_INTERVAL in ('day', 'month')
+
+
+def period_start(dt, interval=PARTITION_INTERVAL):
+    """Awal periode partisi yang memuat dt (UTC)"""
+    if interval == 'day':
+        return datetime(dt.year, dt.month, dt.day)
+    return datetime(dt.year, dt.month, 1)
+
+
+def next_period_start(start, interval=PARTITION_INTERVAL):
+    if interval == 'day':
+        return start + timedelta(days=1)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(start, interval=PARTITION_INTERVAL):
+    suffix = start.strftime('%Y%m%d') if interval == 'day' else start.strftime('%Y%m')
+    return f"{PARENT_TABLE}_p{suffix}"
+
+
+def parse_partition_name(name):
+    """Kembalikan (start, interval) dari nama partisi, atau None untuk partisi lain"""
+    match = PARTITION_NAME_RE.match(name)
+    if not match:
+        return None
+    suffix = match.group(1)
+    if len(suffix) == 8:
+        return datetime.strptime(suffix, '%Y%m%d'), 'day'
+    return datetime.strptime(suffix, '%Y%m'), 'month'
+
+
+def get_table_kind(cursor, table=PARENT_TABLE):
+    """'p' = partitioned, 'r' = tabel biasa, None = belum ada"""
+    cursor.execute("""
+        SELECT c.relkind
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = %s
+    """, (table,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def create_partitioned_table(cursor):
+    cursor.execute(PARTITIONED_TABLE_DDL)
+    logger.info(f"[PARTITION] Created {PARENT_TABLE} partitioned by {PARTITION_INTERVAL} on created_at")
+
+
+def list_partitions(cursor):
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s
+        ORDER BY c.relname
+    """, (PARENT_TABLE,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def ensure_partitions(cursor, now=None, premake=PARTITION_PREMAKE):
+    """Buat partisi untuk periode sekarang dan `premake` periode ke depan"""
+    now = now or datetime.utcnow()
+    existing = set(list_partitions(cursor))
+    start = period_start(now)
+    created = []
+    for _ in range(premake + 1):
+        end = next_period_start(start)
+        name = partition_name(start)
+        if name not in existing:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                (start, end)
+            )
+            created.append(name)
+        start = end
+    if created:
+        logger.info(f"[PARTITION] Created partitions: {', '.join(created)}")
+    return created
+
+
+def expire_partitions(cursor, now=None, retention_days=DATA_RETENTION_DAYS,
+                      action=PARTITION_RETENTION_ACTION):
+    """Detach/drop partisi yang seluruh isinya lebih tua dari retention"""
+    if retention_days <= 0:
+        return []
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=retention_days)
+    expired = []
+    for name in list_partitions(cursor):
+        parsed = parse_partition_name(name)
+        if parsed is None:
+            continue
+        start, interval = parsed
+        if next_period_start(start, interval) > cutoff:
+            continue
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}")
+        if action == 'drop':
+            cursor.execute(f"DROP TABLE {name}")
+        expired.append(name)
+    if expired:
+        verb = 'Dropped' if action == 'drop' else 'Detached'
+        logger.info(f"[PARTITION] {verb} expired partitions (retention {retention_days} days): "
+                    f"{', '.join(expired)}")
+    return expired
+
+
+class PartitionMaintenance:
+    """Job berkala: pre-create partisi ke depan, expire partisi lama, prune rollup"""
+
+    def __init__(self, db_config, interval_seconds=PARTITION_MAINTENANCE_INTERVAL):
+        self.db_config = db_config
+        self.interval_seconds = max(60, interval_seconds)
+        self.thread = None
+        self._stop_event = threading.Event()
+
+    def run_once(self):
+        """Satu putaran maintenance dengan koneksi sendiri (terpisah dari writer)"""
+        conn = None
+        try:
+            conn = psycopg2.connect(**self.db_config)
+            cursor = conn.cursor()
+            if partitioning_enabled() and get_table_kind(cursor) == 'p':
+                ensure_partitions(cursor)
+                expire_partitions(cursor)
+            prune_rollups(cursor)
+            conn.commit()
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.error(f"[PARTITION] Maintenance failed: {e}")
+            if conn and not conn.closed:
+                conn.rollback()
+            return False
+        finally:
+            if conn and not conn.closed:
+                conn.close()
+
+    def start(self):
+        self._stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='partition-maintenance', daemon=True)
+        self.thread.start()
+        logger.info(f"[PARTITION] Maintenance scheduled every {self.interval_seconds}s "
+                    f"(interval={PARTITION_INTERVAL}, retention={DATA_RETENTION_DAYS} days)")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.run_once()
+            self._stop_event.wait(self.interval_seconds)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Continuous rollup tables for pzem_data (1 minute / 15 minutes / hourly / daily)
+Maintained incrementally by the ingest writer, one upsert per bucket per batch
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# Offset Asia/Jakarta (UTC+7, tanpa DST) untuk bucket harian
+JAKARTA_OFFSET_SECONDS = 7 * 3600
+EPOCH = datetime(1970, 1, 1)
+
+# name -> (tabel, lebar bucket dalam detik, offset bucket dalam detik)
+ROLLUPS = {
+    '1m': ('pzem_rollup_1m', 60, 0),
+    '15m': ('pzem_rollup_15m', 900, 0),
+    '1h': ('pzem_rollup_1h', 3600, 0),
+    '1d': ('pzem_rollup_1d', 86400, JAKARTA_OFFSET_SECONDS),  # hari kalender WIB
+}
+
+# Retention rollup (hari, 0 = simpan selamanya)
+ROLLUP_RETENTION_DAYS = {
+    '1m': int(os.getenv('ROLLUP_1M_RETENTION_DAYS', '35')),
+    '15m': int(os.getenv('ROLLUP_15M_RETENTION_DAYS', '400')),
+    '1h': int(os.getenv('ROLLUP_1H_RETENTION_DAYS', '0')),
+    '1d': int(os.getenv('ROLLUP_1D_RETENTION_DAYS', '0')),
+}
+
+# Rata-rata = sum_x / count_x; count_x hanya menghitung sampel yang nilai x-nya tidak NULL
+MEAN_FIELDS = ('voltage', 'current', 'power', 'apparent_power', 'frequency', 'power_factor')
+COUNT_COLUMNS = tuple(f'count_{field}' for field in MEAN_FIELDS)
+
+ROLLUP_COLUMNS = (
+    'device_address', 'bucket', 'sample_count',
+    'sum_voltage', 'sum_current', 'sum_power', 'sum_apparent_power',
+    'sum_frequency', 'sum_power_factor',
+    *COUNT_COLUMNS,
+    'min_voltage', 'max_voltage', 'min_current', 'max_current', 'min_power', 'max_power',
+    'min_energy', 'max_energy',
+    'first_at', 'last_at', 'first_energy', 'last_energy', 'first_power', 'last_power'
+)
+
+SUM_FIELDS = ('voltage', 'current', 'power', 'frequency', 'power_factor')
+MIN_MAX_FIELDS = ('voltage', 'current', 'power', 'energy')
+
+ROLLUP_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    device_address VARCHAR(20) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    sample_count INTEGER NOT NULL DEFAULT 0,
+    sum_voltage DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_current DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_power DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_apparent_power DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_frequency DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_power_factor DOUBLE PRECISION NOT NULL DEFAULT 0,
+    count_voltage INTEGER NOT NULL DEFAULT 0,
+    count_current INTEGER NOT NULL DEFAULT 0,
+    count_power INTEGER NOT NULL DEFAULT 0,
+    count_apparent_power INTEGER NOT NULL DEFAULT 0,
+    count_frequency INTEGER NOT NULL DEFAULT 0,
+    count_power_factor INTEGER NOT NULL DEFAULT 0,
+    min_voltage DOUBLE PRECISION,
+    max_voltage DOUBLE PRECISION,
+    min_current DOUBLE PRECISION,
+    max_current DOUBLE PRECISION,
+    min_power DOUBLE PRECISION,
+    max_power DOUBLE PRECISION,
+    min_energy DOUBLE PRECISION,
+    max_energy DOUBLE PRECISION,
+    first_at TIMESTAMP,
+    last_at TIMESTAMP,
+    first_energy DOUBLE PRECISION,
+    last_energy DOUBLE PRECISION,
+    first_power DOUBLE PRECISION,
+    last_power DOUBLE PRECISION,
+    PRIMARY KEY (device_address, bucket)
+);
+CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table}(bucket);
+"""
+
+# Tabel rollup lama (tanpa count_*): bucket yang sudah ada memakai sample_count seperti sebelumnya
+ROLLUP_COUNT_MIGRATION = """
+ALTER TABLE {table}
+    {add_columns};
+UPDATE {table} SET {set_columns};
+"""
+
+# Merge bucket yang sudah ada dengan agregat batch baru
+ROLLUP_UPSERT = """
+INSERT INTO {table} AS t ({columns})
+VALUES %s
+ON CONFLICT (device_address, bucket) DO UPDATE SET
+    sample_count = t.sample_count + EXCLUDED.sample_count,
+    sum_voltage = t.sum_voltage + EXCLUDED.sum_voltage,
+    sum_current = t.sum_current + EXCLUDED.sum_current,
+    sum_power = t.sum_power + EXCLUDED.sum_power,
+    sum_apparent_power = t.sum_apparent_power + EXCLUDED.sum_apparent_power,
+    sum_frequency = t.sum_frequency + EXCLUDED.sum_frequency,
+    sum_power_factor = t.sum_power_factor + EXCLUDED.sum_power_factor,
+    count_voltage = t.count_voltage + EXCLUDED.count_voltage,
+    count_current = t.count_current + EXCLUDED.count_current,
+    count_power = t.count_power + EXCLUDED.count_power,
+    count_apparent_power = t.count_apparent_power + EXCLUDED.count_apparent_power,
+    count_frequency = t.count_frequency + EXCLUDED.count_frequency,
+    count_power_factor = t.count_power_factor + EXCLUDED.count_power_factor,
+    min_voltage = LEAST(t.min_voltage, EXCLUDED.min_voltage),
+    max_voltage = GREATEST(t.max_voltage, EXCLUDED.max_voltage),
+    min_current = LEAST(t.min_current, EXCLUDED.min_current),
+    max_current = GREATEST(t.max_current, EXCLUDED.max_current),
+    min_power = LEAST(t.min_power, EXCLUDED.min_power),
+    max_power = GREATEST(t.max_power, EXCLUDED.max_power),
+    min_energy = LEAST(t.min_energy, EXCLUDED.min_energy),
+    max_energy = GREATEST(t.max_energy, EXCLUDED.max_energy),
+    first_energy = CASE WHEN EXCLUDED.first_at < t.first_at THEN EXCLUDED.first_energy ELSE t.first_energy END,
+    first_power = CASE WHEN EXCLUDED.first_at < t.first_at THEN EXCLUDED.first_power ELSE t.first_power END,
+    first_at = LEAST(t.first_at, EXCLUDED.first_at),
+    last_energy = CASE WHEN EXCLUDED.last_at >= t.last_at THEN EXCLUDED.last_energy ELSE t.last_energy END,
+    last_power = CASE WHEN EXCLUDED.last_at >= t.last_at THEN EXCLUDED.last_power ELSE t.last_power END,
+    last_at = GREATEST(t.last_at, EXCLUDED.last_at)
+"""
+
+# Bucket dalam SQL (dipakai untuk backfill dari pzem_data)
+BUCKET_SQL = {
+    '1m': "date_trunc('minute', created_at)",
+    '15m': "date_trunc('hour', created_at) + floor(extract(minute FROM created_at) / 15) * INTERVAL '15 minutes'",
+    '1h': "date_trunc('hour', created_at)",
+    '1d': "date_trunc('day', created_at + INTERVAL '7 hours') - INTERVAL '7 hours'",
+}
+
+ROLLUP_BACKFILL = """
+INSERT INTO {table} ({columns})
+SELECT
+    device_address,
+    {bucket} AS bucket,
+    COUNT(*),
+    COALESCE(SUM(voltage), 0), COALESCE(SUM(current), 0), COALESCE(SUM(power), 0),
+    COALESCE(SUM(voltage * current), 0),
+    COALESCE(SUM(frequency), 0), COALESCE(SUM(power_factor), 0),
+    COUNT(voltage), COUNT(current), COUNT(power), COUNT(voltage * current),
+    COUNT(frequency), COUNT(power_factor),
+    MIN(voltage), MAX(voltage), MIN(current), MAX(current), MIN(power), MAX(power),
+    MIN(energy), MAX(energy),
+    MIN(created_at), MAX(created_at),
+    (array_agg(energy ORDER BY created_at))[1],
+    (array_agg(energy ORDER BY created_at DESC))[1],
+    (array_agg(power ORDER BY created_at))[1],
+    (array_agg(power ORDER BY created_at DESC))[1]
+FROM pzem_data
+WHERE created_at IS NOT NULL
+GROUP BY device_address, 2
+ON CONFLICT (device_address, bucket) DO NOTHING
+"""
+
+
+def bucket_start(ts, width_seconds, offset_seconds=0):
+    """Awal bucket (UTC naive) yang memuat ts"""
+    seconds = int((ts - EPOCH).total_seconds()) + offset_seconds
+    return EPOCH + timedelta(seconds=seconds - seconds % width_seconds - offset_seconds)
+
+
+def _num(value):
+    return float(value) if value is not None else None
+
+
+def aggregate_rows(rows, width_seconds, offset_seconds=0):
+    """Agregasi baris batch per (device, bucket) di memori"""
+    buckets = {}
+    for row in rows:
+        ts = row['created_at']
+        key = (row['device_address'], bucket_start(ts, width_seconds, offset_seconds))
+        agg = buckets.get(key)
+        if agg is None:
+            agg = buckets[key] = {
+                'device_address': key[0], 'bucket': key[1], 'sample_count': 0,
+                'sum_voltage': 0.0, 'sum_current': 0.0, 'sum_power': 0.0,
+                'sum_apparent_power': 0.0, 'sum_frequency': 0.0, 'sum_power_factor': 0.0,
+                **{column: 0 for column in COUNT_COLUMNS},
+                'min_voltage': None, 'max_voltage': None, 'min_current': None,
+                'max_current': None, 'min_power': None, 'max_power': None,
+                'min_energy': None, 'max_energy': None,
+                'first_at': ts, 'last_at': ts,
+                'first_energy': _num(row['energy']), 'last_energy': _num(row['energy']),
+                'first_power': _num(row['power']), 'last_power': _num(row['power'])
+            }
+
+        agg['sample_count'] += 1
+        for field in SUM_FIELDS:
+            if row[field] is not None:
+                agg[f'sum_{field}'] += float(row[field])
+                agg[f'count_{field}'] += 1
+        if row['voltage'] is not None and row['current'] is not None:
+            agg['sum_apparent_power'] += float(row['voltage']) * float(row['current'])
+            agg['count_apparent_power'] += 1
+        for field in MIN_MAX_FIELDS:
+            value = _num(row[field])
+            if value is None:
+                continue
+            if agg[f'min_{field}'] is None or value < agg[f'min_{field}']:
+                agg[f'min_{field}'] = value
+            if agg[f'max_{field}'] is None or value > agg[f'max_{field}']:
+                agg[f'max_{field}'] = value
+        if ts < agg['first_at']:
+            agg['first_at'] = ts
+            agg['first_energy'] = _num(row['energy'])
+            agg['first_power'] = _num(row['power'])
+        if ts >= agg['last_at']:
+            agg['last_at'] = ts
+            agg['last_energy'] = _num(row['energy'])
+            agg['last_power'] = _num(row['power'])
+    return buckets
+
+
+def _add_count_columns(cursor, table):
+    """Tambah kolom count_* ke tabel rollup yang dibuat sebelum kolom itu ada"""
+    cursor.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+        (table, COUNT_COLUMNS[0]))
+    if cursor.fetchone() is not None:
+        return
+    logger.info(f"[ROLLUP] Adding per-field sample counts to {table}")
+    cursor.execute(ROLLUP_COUNT_MIGRATION.format(
+        table=table,
+        add_columns=',\n    '.join(f"ADD COLUMN IF NOT EXISTS {column} INTEGER NOT NULL DEFAULT 0"
+                                     for column in COUNT_COLUMNS),
+        set_columns=', '.join(f"{column} = sample_count" for column in COUNT_COLUMNS)))
+
+
+def create_rollup_tables(cursor):
+    """Buat tabel rollup; tabel yang baru dibuat langsung di-backfill dari pzem_data"""
+    for name, (table, _, _) in ROLLUPS.items():
+        cursor.execute("SELECT to_regclass(%s)", (table,))
+        exists = cursor.fetchone()[0] is not None
+        cursor.execute(ROLLUP_TABLE_DDL.format(table=table))
+        if exists:
+            _add_count_columns(cursor, table)
+        else:
+            logger.info(f"[ROLLUP] Backfilling {table} from pzem_data...")
+            cursor.execute(ROLLUP_BACKFILL.format(
+                table=table, columns=', '.join(ROLLUP_COLUMNS), bucket=BUCKET_SQL[name]))
+            logger.info(f"[ROLLUP] Backfilled {cursor.rowcount} buckets into {table}")
+
+
+def update_rollups(cursor, rows):
+    """Upsert agregat batch ke semua tabel rollup (dalam transaksi batch yang sama)"""
+    touched = 0
+    for table, width, offset in ROLLUPS.values():
+        buckets = aggregate_rows(rows, width, offset)
+        values = [
+            tuple(agg[col] for col in ROLLUP_COLUMNS)
+            for _, agg in sorted(buckets.items())
+        ]
+        execute_values(
+            cursor,
+            ROLLUP_UPSERT.format(table=table, columns=', '.join(ROLLUP_COLUMNS)),
+            values,
+            page_size=len(values)
+        )
+        touched += len(values)
+    return touched
+
+
+def prune_rollups(cursor, now=None):
+    """Hapus bucket rollup yang lebih tua dari retention masing-masing"""
+    now = now or datetime.utcnow()
+    for name, (table, _, _) in ROLLUPS.items():
+        days = ROLLUP_RETENTION_DAYS.get(name, 0)
+        if days <= 0:
+            continue
+        cursor.execute(f"DELETE FROM {table} WHERE bucket < %s", (now - timedelta(days=days),))
+        if cursor.rowcount:
+            logger.info(f"[ROLLUP] Pruned {cursor.rowcount} buckets older than {days} days from {table}")
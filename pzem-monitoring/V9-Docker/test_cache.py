@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Test cache query dashboard (dashboard/cache.py)
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard'))
+
+from cache import TTLCache  # noqa: E402
+
+
+def device_keys(*devices):
+    return [('latest', device) for device in devices]
+
+
+class BatchLoader:
+    """loader(missing_keys) yang mencatat key yang diminta di setiap panggilan"""
+
+    def __init__(self, values=None):
+        self.calls = []
+        self.values = values or {}
+
+    def __call__(self, keys):
+        self.calls.append(list(keys))
+        return {key: self.values.get(key[-1], f'value-{key[-1]}') for key in keys}
+
+
+class BlockingLoader:
+    """Loader yang berhenti sampai release() dipanggil; mencatat jumlah panggilan"""
+
+    def __init__(self, value='value'):
+        self.value = value
+        self.calls = 0
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.released.wait(5)
+        return f'{self.value}-{self.calls}'
+
+    def release(self):
+        self.released.set()
+
+
+def call_in_thread(fn, *args, **kwargs):
+    result = {}
+
+    def run():
+        try:
+            result['value'] = fn(*args, **kwargs)
+        except Exception as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, result
+
+
+class GetOrLoadTest(unittest.TestCase):
+    def test_concurrent_callers_share_one_load(self):
+        cache = TTLCache()
+        loader = BlockingLoader()
+        first = call_in_thread(cache.get_or_load, 'devices', loader, ttl=60)
+        self.assertTrue(loader.started.wait(5))
+        others = [call_in_thread(cache.get_or_load, 'devices', loader, ttl=60) for _ in range(5)]
+        # Tunggu sampai semua pemanggil lain menempel ke load yang berjalan
+        deadline = time.monotonic() + 5
+        while cache.get_stats()['coalesced'] < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        loader.release()
+        for thread, _ in [first] + others:
+            thread.join(5)
+
+        self.assertEqual(loader.calls, 1)
+        self.assertEqual([result['value'] for _, result in [first] + others], ['value-1'] * 6)
+        stats = cache.get_stats()
+        self.assertEqual((stats['loads'], stats['coalesced'], stats['in_flight']), (1, 5, 0))
+        self.assertEqual(cache.get_or_load('devices', loader, ttl=60), 'value-1')
+
+    def test_loader_error_reaches_all_waiters_and_is_not_cached(self):
+        cache = TTLCache()
+        started, release = threading.Event(), threading.Event()
+
+        def failing():
+            started.set()
+            release.wait(5)
+            raise RuntimeError('database down')
+
+        first = call_in_thread(cache.get_or_load, 'devices', failing, ttl=60)
+        self.assertTrue(started.wait(5))
+        second = call_in_thread(cache.get_or_load, 'devices', failing, ttl=60)
+        deadline = time.monotonic() + 5
+        while cache.get_stats()['coalesced'] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread, _ in (first, second):
+            thread.join(5)
+
+        self.assertIsInstance(first[1]['error'], RuntimeError)
+        self.assertIsInstance(second[1]['error'], RuntimeError)
+        self.assertEqual(cache.get_or_load('devices', lambda: 'ok', ttl=60), 'ok')
+
+    def test_stale_while_revalidate(self):
+        cache = TTLCache()
+        cache.set('devices', 'old', ttl=0, stale_ttl=60)
+        loader = BlockingLoader('new')
+
+        # Entry kedaluwarsa tapi masih dalam stale_ttl: nilai lama langsung dikembalikan
+        self.assertEqual(cache.get_or_load('devices', loader, ttl=60, stale_ttl=60), 'old')
+        self.assertTrue(loader.started.wait(5))
+        # Revalidate yang sedang berjalan tidak dijalankan dua kali
+        self.assertEqual(cache.get_or_load('devices', loader, ttl=60, stale_ttl=60), 'old')
+        loader.release()
+        deadline = time.monotonic() + 5
+        while cache.get_stats()['in_flight'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(loader.calls, 1)
+        self.assertEqual(cache.get_or_load('devices', loader, ttl=60, stale_ttl=60), 'new-1')
+        self.assertEqual(cache.get_stats()['stale_hits'], 2)
+
+    def test_invalidation_during_load_discards_result(self):
+        cache = TTLCache()
+        loader = BlockingLoader('before-ingest')
+        first = call_in_thread(cache.get_or_load, 'all_latest', loader, ttl=60)
+        self.assertTrue(loader.started.wait(5))
+
+        # NOTIFY ingest masuk saat query masih berjalan: hasilnya mungkin sudah basi
+        cache.invalidate('all_latest')
+        loader.release()
+        first[0].join(5)
+
+        # Pemanggil yang sedang menunggu tetap dijawab, tetapi hasilnya tidak di-cache
+        self.assertEqual(first[1]['value'], 'before-ingest-1')
+        self.assertIsNone(cache.get('all_latest'))
+        self.assertEqual(cache.get_or_load('all_latest', lambda: 'after-ingest', ttl=60), 'after-ingest')
+        self.assertEqual(cache.get_or_load('all_latest', loader, ttl=60), 'after-ingest')
+
+    def test_request_after_invalidation_starts_new_load(self):
+        cache = TTLCache()
+        loader = BlockingLoader()
+        first = call_in_thread(cache.get_or_load, 'all_latest', loader, ttl=60)
+        self.assertTrue(loader.started.wait(5))
+        cache.invalidate_where(lambda key: key == 'all_latest')
+
+        # Tidak menempel ke load lama yang dimulai sebelum invalidate
+        self.assertEqual(cache.get_or_load('all_latest', lambda: 'fresh', ttl=60), 'fresh')
+        loader.release()
+        first[0].join(5)
+
+        self.assertEqual(cache.get_stats()['coalesced'], 0)
+        self.assertEqual(cache.get('all_latest'), 'fresh')
+
+    def test_expired_past_stale_window_loads_synchronously(self):
+        cache = TTLCache()
+        cache.set('devices', 'old', ttl=0, stale_ttl=0)
+
+        self.assertEqual(cache.get_or_load('devices', lambda: 'new', ttl=60, stale_ttl=60), 'new')
+
+
+class GetManyOrLoadTest(unittest.TestCase):
+    def test_missing_keys_loaded_in_one_call(self):
+        cache = TTLCache()
+        loader = BatchLoader()
+
+        values = cache.get_many_or_load(device_keys('01', '02', '03'), loader, ttl=60)
+
+        self.assertEqual(loader.calls, [device_keys('01', '02', '03')])
+        self.assertEqual(values[('latest', '02')], 'value-02')
+        self.assertEqual(cache.get_stats()['loads'], 1)
+
+    def test_only_invalidated_device_reloaded(self):
+        cache = TTLCache()
+        loader = BatchLoader()
+        cache.get_many_or_load(device_keys('01', '02', '03'), loader, ttl=60)
+
+        cache.invalidate_where(lambda key: key[-1] in {'02'})
+        cache.get_many_or_load(device_keys('01', '02', '03'), loader, ttl=60)
+
+        self.assertEqual(loader.calls[1:], [device_keys('02')])
+
+    def test_key_without_value_is_none(self):
+        cache = TTLCache()
+        values = cache.get_many_or_load(device_keys('01', '02'), lambda keys: {keys[0]: 'only-first'}, ttl=60)
+
+        self.assertEqual(values, {('latest', '01'): 'only-first', ('latest', '02'): None})
+
+    def test_loader_error_not_cached(self):
+        cache = TTLCache()
+
+        def failing(keys):
+            raise RuntimeError('database down')
+
+        with self.assertRaises(RuntimeError):
+            cache.get_many_or_load(device_keys('01'), failing, ttl=60)
+        loader = BatchLoader()
+        cache.get_many_or_load(device_keys('01'), loader, ttl=60)
+
+        self.assertEqual(loader.calls, [device_keys('01')])
+        self.assertEqual(cache.get_stats()['in_flight'], 0)
+
+    def test_invalidation_during_load_not_stored(self):
+        cache = TTLCache()
+        started, release = threading.Event(), threading.Event()
+
+        def slow(keys):
+            started.set()
+            release.wait(5)
+            return {key: 'old' for key in keys}
+
+        result = {}
+        thread = threading.Thread(
+            target=lambda: result.update(cache.get_many_or_load(device_keys('01', '02'), slow, ttl=60)))
+        thread.start()
+        self.assertTrue(started.wait(5))
+        cache.invalidate_where(lambda key: key[-1] == '01')
+        release.set()
+        thread.join(5)
+
+        # Pemanggil tetap mendapat hasil load, tetapi hanya device yang tidak diinvalidasi di-cache
+        self.assertEqual(result[('latest', '01')], 'old')
+        loader = BatchLoader()
+        values = cache.get_many_or_load(device_keys('01', '02'), loader, ttl=60)
+        self.assertEqual(loader.calls, [device_keys('01')])
+        self.assertEqual(values[('latest', '02')], 'old')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test export (dashboard/data_export.py) lewat jalur yang dipakai /api/export:
+iter_export_rows dengan baris seperti dari psycopg2 (kolom DECIMAL pzem_data
+datang sebagai decimal.Decimal), lalu encoder CSV/NDJSON/JSON/Parquet
+"""
+
+import io
+import json
+import os
+import sys
+import unittest
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard'))
+
+from data_export import (EXPORT_COLUMNS, encode_csv, encode_json, encode_ndjson,  # noqa: E402
+                         encode_parquet, iter_export_rows, parquet_available)
+
+CREATED_AT = datetime(2025, 1, 1, 8, 0, 0)
+
+
+def decimal_rows():
+    return [
+        ('01', Decimal('220.1'), Decimal('1.234'), Decimal('271.6'), Decimal('12.345'),
+         Decimal('50.0'), Decimal('0.980'), -60, 123456, 10, 'ok', 'good', CREATED_AT, CREATED_AT),
+        ('01', None, Decimal('0'), Decimal('0.0'), None,
+         Decimal('49.9'), None, None, None, None, None, None, None, CREATED_AT),
+    ]
+
+
+class FakeCursor:
+    """Named cursor psycopg2: fetchmany mengembalikan baris sampai habis"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.itersize = None
+        self.executed = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        self.executed = (query, params)
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FakePool:
+    def __init__(self, rows):
+        self.named_cursor = FakeCursor(rows)
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def cursor(self, name=None):
+        return self.named_cursor
+
+
+def export_chunks(rows, chunk_rows=2):
+    pool = FakePool(rows)
+    return iter_export_rows(pool, '01', CREATED_AT, CREATED_AT, chunk_rows=chunk_rows)
+
+
+class ExportRowsTest(unittest.TestCase):
+    def test_decimal_becomes_float(self):
+        chunks = list(export_chunks(decimal_rows() * 2))
+
+        self.assertEqual([len(rows) for rows in chunks], [2, 2])
+        first = chunks[0][0]
+        self.assertIsInstance(first[1], float)
+        self.assertEqual(first[1], 220.1)
+        self.assertIsNone(chunks[0][1][1])
+        self.assertFalse(any(isinstance(value, Decimal) for rows in chunks for row in rows for value in row))
+
+    def test_ndjson(self):
+        data = b''.join(encode_ndjson(export_chunks(decimal_rows()))).decode('utf-8')
+        records = [json.loads(line) for line in data.splitlines()]
+
+        self.assertEqual(records[0]['voltage'], 220.1)
+        self.assertEqual(records[0]['created_at'], CREATED_AT.isoformat())
+        self.assertIsNone(records[1]['voltage'])
+
+    def test_csv(self):
+        data = b''.join(encode_csv(export_chunks(decimal_rows()))).decode('utf-8')
+        lines = data.splitlines()
+
+        self.assertEqual(lines[0], ','.join(EXPORT_COLUMNS))
+        self.assertTrue(lines[1].startswith('01,220.1,1.234,271.6,12.345,50.0,0.98,'))
+        self.assertEqual(len(lines), 3)
+
+    def test_json_envelope(self):
+        data = b''.join(encode_json(export_chunks(decimal_rows() * 2), {'device_address': '01'}))
+        payload = json.loads(data)
+
+        self.assertEqual(payload['device_address'], '01')
+        self.assertEqual(payload['total_records'], 4)
+        self.assertEqual(payload['data'][0]['power_factor'], 0.98)
+
+
+@unittest.skipUnless(parquet_available(), 'pyarrow not installed')
+class ParquetExportTest(unittest.TestCase):
+    def test_decimal_rows(self):
+        import pyarrow.parquet as pq
+
+        data = b''.join(encode_parquet(export_chunks(decimal_rows() * 2)))
+        table = pq.read_table(io.BytesIO(data))
+
+        self.assertEqual(table.num_rows, 4)
+        self.assertEqual(table.column_names, list(EXPORT_COLUMNS))
+        self.assertEqual(table.column('voltage').to_pylist(), [220.1, None, 220.1, None])
+        self.assertEqual(table.column('power_factor').to_pylist(), [0.98, None, 0.98, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
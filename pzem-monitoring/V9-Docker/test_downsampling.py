@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test downsampling chart (dashboard/downsampling.py): jumlah titik tepat n_out, indeks naik
+tegas, titik pertama dan terakhir selalu ikut, dan n_out < 2 ditolak
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard'))
+
+from downsampling import (DOWNSAMPLE_MODES, downsample, downsample_indices,  # noqa: E402
+                          lttb_indices, minmax_indices)
+
+T0 = datetime(2025, 1, 1, 8, 0, 0)
+
+
+def series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.arange(n, dtype=np.float64) * 60.0
+    y = 1000 + 200 * np.sin(np.arange(n) / 25.0) + rng.normal(0, 50, n)
+    return x, y
+
+
+class IndicesContractTest(unittest.TestCase):
+    def assert_contract(self, indices, n, n_out):
+        self.assertEqual(len(indices), min(n, n_out))
+        self.assertTrue((np.diff(indices) > 0).all(), indices)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], n - 1)
+
+    def test_contract_all_modes(self):
+        for n in (2, 3, 5, 10, 101, 1000):
+            x, y = series(n)
+            for n_out in (2, 3, 4, 5, 7, 9, 50, 999, 1000, 2000):
+                for mode in DOWNSAMPLE_MODES:
+                    with self.subTest(n=n, n_out=n_out, mode=mode):
+                        self.assert_contract(downsample_indices(x, y, n_out, mode), n, n_out)
+
+    def test_flat_series(self):
+        x, _ = series(100)
+        y = np.full(100, 5.0)
+        for n_out in (2, 5, 10, 99):
+            for mode in DOWNSAMPLE_MODES:
+                with self.subTest(n_out=n_out, mode=mode):
+                    self.assert_contract(downsample_indices(x, y, n_out, mode), 100, n_out)
+
+    def test_nan_values(self):
+        x, y = series(200)
+        y[::7] = np.nan
+        for mode in DOWNSAMPLE_MODES:
+            self.assert_contract(downsample_indices(x, y, 20, mode), 200, 20)
+
+    def test_n_out_below_two_rejected(self):
+        x, y = series(10)
+        for n_out in (-1, 0, 1):
+            with self.subTest(n_out=n_out):
+                with self.assertRaises(ValueError):
+                    lttb_indices(x[:2], y[:2], n_out)
+                with self.assertRaises(ValueError):
+                    minmax_indices(y, n_out)
+                with self.assertRaises(ValueError):
+                    downsample([{'t': 0, 'v': 1}], n_out, 't', 'v')
+
+    def test_unknown_mode(self):
+        x, y = series(10)
+        with self.assertRaises(ValueError):
+            downsample_indices(x, y, 5, 'average')
+
+
+class ShapeTest(unittest.TestCase):
+    def test_minmax_keeps_spikes(self):
+        x, y = series(1000)
+        y[333], y[777] = 5000.0, -5000.0
+        selected = minmax_indices(y, 20)
+
+        self.assertIn(333, selected)
+        self.assertIn(777, selected)
+
+    def test_lttb_keeps_spike(self):
+        x, y = series(1000)
+        y[500] = 5000.0
+
+        self.assertIn(500, lttb_indices(x, y, 50))
+
+    def test_downsample_datetime_points(self):
+        points = [{'time_period': T0 + timedelta(minutes=i), 'power': float(i % 17)} for i in range(300)]
+        result = downsample(points, 30, 'time_period', 'power')
+
+        self.assertEqual(len(result), 30)
+        self.assertIs(result[0], points[0])
+        self.assertIs(result[-1], points[-1])
+        times = [p['time_period'] for p in result]
+        self.assertEqual(times, sorted(set(times)))
+
+    def test_short_series_unchanged(self):
+        points = [{'t': i, 'v': i} for i in range(5)]
+        self.assertEqual(downsample(points, 5, 't', 'v'), points)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,6 @@ Quick test script to verify report generation works without hanging
 
 import requests
 import time
-import json
 
 def test_report_generation():
     """Test the report generation endpoint"""
@@ -38,36 +37,43 @@ def test_report_generation():
     except Exception as e:
         print(f"❌ Report page error: {e}")
     
-    # Test 3: Try to generate a daily report
+    # Test 3: Queue a daily report and poll the job until it finishes
     print("\n📊 Testing report generation...")
     try:
         start_time = time.time()
         response = requests.get(
             f"{base_url}/reports/generate",
             params={'period_type': 'daily'},
-            timeout=60  # 60 second timeout
+            timeout=10
         )
-        end_time = time.time()
         
-        duration = end_time - start_time
-        print(f"   Generation took: {duration:.2f} seconds")
+        if response.status_code != 202:
+            print(f"❌ HTTP Error {response.status_code}: {response.text}")
+            return False
         
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('success'):
+        job_id = response.json().get('job_id')
+        print(f"   Job queued: {job_id}")
+        
+        # Report dibuat di worker process; tunggu sampai done/failed (maks 60 detik)
+        while time.time() - start_time < 60:
+            job = requests.get(f"{base_url}/reports/jobs/{job_id}", timeout=10).json()
+            status = job.get('status')
+            if status == 'done':
+                duration = time.time() - start_time
+                print(f"   Generation took: {duration:.2f} seconds")
                 print(f"✅ Report generated successfully!")
-                print(f"   Filename: {result.get('filename')}")
+                print(f"   Filename: {job.get('filename')}")
+                print(f"   Download: {base_url}{job.get('download_url')}")
                 return True
-            else:
-                print(f"❌ Report generation failed: {result.get('error')}")
+            if status == 'failed':
+                print(f"❌ Report generation failed: {job.get('error')}")
                 return False
-        else:
-            print(f"❌ HTTP Error {response.status_code}: {response.text}")
-            return False
-            
-    except requests.Timeout:
+            print(f"   {status}: {job.get('progress', 0)}% - {job.get('stage')}")
+            time.sleep(1)
+        
         print("❌ Report generation timed out (>60 seconds)")
         return False
+            
     except Exception as e:
         print(f"❌ Report generation error: {e}")
         return False
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Test cache PDF report (dashboard/report_cache.py): komposisi key, pembulatan range,
+klasifikasi periode tertutup/berjalan dan retensi evict()
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard'))
+
+import report_cache  # noqa: E402
+from report_cache import META_SUFFIX, PART_SUFFIX, ReportCache, align_end  # noqa: E402
+
+START = datetime(2025, 1, 1, 0, 0)
+END = datetime(2025, 1, 2, 0, 0)
+TARIFF = {'PLN_TARIFF_CLASS': 'R1/1300', 'PLN_PPN_PERCENT': '11'}
+HOUR = 3600
+
+
+class KeyTest(unittest.TestCase):
+    def key(self, **overrides):
+        args = {'period_type': 'daily', 'start_date': START, 'end_date': END,
+                'watermark': '2025-01-02T00:00:00|1234', 'tariff': TARIFF}
+        args.update(overrides)
+        return ReportCache.make_key(**args)
+
+    def test_same_request_same_key(self):
+        self.assertEqual(self.key(), self.key(tariff=dict(TARIFF)))
+        self.assertEqual(len(self.key()), 24)
+
+    def test_every_component_changes_key(self):
+        base = self.key()
+        variants = {
+            'period_type': self.key(period_type='weekly'),
+            'start_date': self.key(start_date=START + timedelta(minutes=5)),
+            'end_date': self.key(end_date=END + timedelta(minutes=5)),
+            'watermark': self.key(watermark='2025-01-02T00:00:00|1235'),
+            'tariff': self.key(tariff=dict(TARIFF, PLN_PPN_PERCENT='12')),
+        }
+        for component, key in variants.items():
+            with self.subTest(component=component):
+                self.assertNotEqual(key, base)
+        self.assertEqual(len(set(variants.values())), len(variants))
+
+    def test_cache_version_changes_key(self):
+        base = self.key()
+        with mock.patch.object(report_cache, 'REPORT_CACHE_VERSION', report_cache.REPORT_CACHE_VERSION + 1):
+            self.assertNotEqual(self.key(), base)
+
+    def test_default_tariff_from_environment(self):
+        with mock.patch.dict(os.environ, TARIFF):
+            from_env = ReportCache.make_key('daily', START, END, 'w')
+        self.assertEqual(from_env, ReportCache.make_key('daily', START, END, 'w', tariff=TARIFF))
+        with mock.patch.dict(os.environ, dict(TARIFF, PLN_TARIFF_CLASS='B2')):
+            self.assertNotEqual(ReportCache.make_key('daily', START, END, 'w'), from_env)
+
+
+class RangeTest(unittest.TestCase):
+    def test_align_end_rounds_down(self):
+        now = datetime(2025, 1, 1, 8, 7, 31, 500000)
+        self.assertEqual(align_end(now, 300), datetime(2025, 1, 1, 8, 5))
+        self.assertEqual(align_end(now, 3600), datetime(2025, 1, 1, 8, 0))
+        self.assertEqual(align_end(datetime(2025, 1, 1, 8, 5), 300), datetime(2025, 1, 1, 8, 5))
+
+    def test_align_end_disabled(self):
+        now = datetime(2025, 1, 1, 8, 7, 31, 500000)
+        self.assertEqual(align_end(now, 1), datetime(2025, 1, 1, 8, 7, 31))
+        self.assertEqual(align_end(now, 0), datetime(2025, 1, 1, 8, 7, 31))
+
+    def test_nearby_requests_share_range(self):
+        self.assertEqual(align_end(datetime(2025, 1, 1, 8, 5, 1), 300),
+                         align_end(datetime(2025, 1, 1, 8, 9, 59), 300))
+
+    def test_closed_after_grace(self):
+        now = datetime(2025, 1, 2, 12, 0)
+        grace = timedelta(seconds=report_cache.REPORT_CLOSED_GRACE_SECONDS)
+        self.assertTrue(ReportCache.is_closed(now - grace, now))
+        self.assertTrue(ReportCache.is_closed(now - grace - timedelta(days=1), now))
+        self.assertFalse(ReportCache.is_closed(now - grace + timedelta(seconds=1), now))
+        self.assertFalse(ReportCache.is_closed(now, now))
+
+
+class EvictTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ReportCache(self.tmp.name, enabled=True)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def report(self, key, age_seconds=0, closed=False, accessed_seconds_ago=None, end=END):
+        """PDF + metadata; age = umur versi (created_at), accessed = mtime metadata (last access)"""
+        filename = self.cache.filename_for(key, 'daily', START, end)
+        path = os.path.join(self.tmp.name, filename)
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.4')
+        meta = {'key': key, 'period_type': 'daily', 'start': START.isoformat(), 'end': end.isoformat(),
+                'watermark': 'w', 'closed': closed,
+                'created_at': datetime.fromtimestamp(time.time() - age_seconds).isoformat()}
+        meta_path = path + META_SUFFIX
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        accessed = time.time() - (age_seconds if accessed_seconds_ago is None else accessed_seconds_ago)
+        os.utime(meta_path, (accessed, accessed))
+        return filename
+
+    def exists(self, filename):
+        return os.path.exists(os.path.join(self.tmp.name, filename))
+
+    def test_closed_report_kept(self):
+        name = self.report('a' * 24, age_seconds=400 * 86400, closed=True)
+
+        self.assertEqual(self.cache.evict(), 0)
+        self.assertTrue(self.exists(name))
+
+    def test_open_report_expires_after_ttl(self):
+        fresh = self.report('a' * 24, age_seconds=23 * HOUR, end=END)
+        expired = self.report('b' * 24, age_seconds=25 * HOUR, end=END + timedelta(days=1))
+
+        self.assertEqual(self.cache.evict(open_ttl_hours=24), 1)
+        self.assertTrue(self.exists(fresh))
+        self.assertFalse(self.exists(expired))
+        self.assertFalse(self.exists(expired + META_SUFFIX))
+
+    def test_open_report_ttl_counts_from_last_access(self):
+        name = self.report('a' * 24, age_seconds=48 * HOUR, accessed_seconds_ago=HOUR)
+
+        self.assertEqual(self.cache.evict(open_ttl_hours=24), 0)
+        self.assertTrue(self.exists(name))
+
+    def test_superseded_version_removed_after_grace(self):
+        old = self.report('a' * 24, age_seconds=3 * HOUR, closed=True)
+        new = self.report('b' * 24, age_seconds=2 * HOUR, closed=True)
+
+        self.assertEqual(self.cache.evict(superseded_grace_seconds=3600), 1)
+        self.assertFalse(self.exists(old))
+        self.assertTrue(self.exists(new))
+
+    def test_superseded_version_kept_during_grace(self):
+        old = self.report('a' * 24, age_seconds=3 * HOUR, closed=True)
+        new = self.report('b' * 24, age_seconds=600, closed=True)
+
+        self.assertEqual(self.cache.evict(superseded_grace_seconds=3600), 0)
+        self.assertTrue(self.exists(old))
+        self.assertTrue(self.exists(new))
+
+    def test_legacy_pdf_without_metadata(self):
+        name = 'pzem_report_20240101_000000.pdf'
+        with open(os.path.join(self.tmp.name, name), 'wb') as f:
+            f.write(b'%PDF-1.4')
+
+        self.assertEqual(self.cache.evict(legacy_keep_days=30), 0)
+        self.assertTrue(self.exists(name))
+        self.assertEqual(self.cache.evict(legacy_keep_days=0), 1)
+        self.assertFalse(self.exists(name))
+
+    def test_stale_part_files_removed(self):
+        stale = os.path.join(self.tmp.name, 'PZEM_Report_x.pdf.123' + PART_SUFFIX)
+        fresh = os.path.join(self.tmp.name, 'PZEM_Report_y.pdf.456' + PART_SUFFIX)
+        for path in (stale, fresh):
+            with open(path, 'wb') as f:
+                f.write(b'partial')
+        os.utime(stale, (time.time() - 2 * HOUR, time.time() - 2 * HOUR))
+
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+
+    def test_publish_then_lookup(self):
+        key = 'c' * 24
+        filename = self.cache.filename_for(key, 'daily', START, END)
+        temp = self.cache.temp_path(filename)
+        with open(temp, 'wb') as f:
+            f.write(b'%PDF-1.4')
+
+        path = self.cache.publish(temp, filename, key, 'daily', START, END, 'w')
+
+        self.assertEqual(self.cache.lookup(filename), path)
+        with open(path + META_SUFFIX, encoding='utf-8') as f:
+            self.assertTrue(json.load(f)['closed'])
+        self.assertIsNone(ReportCache(self.tmp.name, enabled=False).lookup(filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
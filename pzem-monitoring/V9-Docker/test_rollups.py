@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Test agregasi rollup di memori (mqtt/rollups.py) dan pembacaan report dari rollup
+(dashboard/report_data.py), termasuk sampel dengan field NULL
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, 'mqtt'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'dashboard'))
+
+from report_data import build_report_data  # noqa: E402
+from rollups import ROLLUP_COLUMNS, aggregate_rows, bucket_start  # noqa: E402
+
+T0 = datetime(2025, 1, 1, 8, 0, 0)
+
+
+def sample(seconds, voltage=220.0, current=1.0, power=200.0, energy=10.0,
+           frequency=50.0, power_factor=0.9, device_address='01'):
+    return {
+        'device_address': device_address, 'created_at': T0 + timedelta(seconds=seconds),
+        'voltage': voltage, 'current': current, 'power': power, 'energy': energy,
+        'frequency': frequency, 'power_factor': power_factor,
+    }
+
+
+def report_row(agg):
+    """Baris rollup -> baris REPORT_STREAM_QUERY (bagian pzem_rollup_1h)"""
+    return (agg['device_address'], agg['bucket'], agg['sample_count'],
+            agg['sum_voltage'], agg['sum_current'], agg['sum_power'], agg['sum_frequency'],
+            agg['sum_power_factor'], agg['min_energy'], agg['max_energy'],
+            agg['first_at'], agg['last_at'], agg['first_power'], agg['last_power'],
+            agg['first_energy'], agg['last_energy'],
+            agg['count_voltage'], agg['count_current'], agg['count_power'],
+            agg['count_frequency'], agg['count_power_factor'])
+
+
+class AggregateRowsTest(unittest.TestCase):
+    def test_bucket_start(self):
+        self.assertEqual(bucket_start(datetime(2025, 1, 1, 8, 14, 59), 900), datetime(2025, 1, 1, 8, 0))
+        # Bucket harian mengikuti hari kalender WIB (UTC+7)
+        self.assertEqual(bucket_start(datetime(2025, 1, 1, 16, 59), 86400, 7 * 3600),
+                         datetime(2025, 1, 1, 17, 0) - timedelta(days=1))
+
+    def test_sums_and_first_last(self):
+        rows = [sample(30, power=300.0, energy=10.5), sample(0, power=100.0, energy=10.0),
+                sample(59, power=200.0, energy=10.9)]
+        buckets = aggregate_rows(rows, 60)
+
+        self.assertEqual(len(buckets), 1)
+        agg = buckets[('01', T0)]
+        self.assertEqual(set(agg), set(ROLLUP_COLUMNS))
+        self.assertEqual(agg['sample_count'], 3)
+        self.assertEqual(agg['sum_power'], 600.0)
+        self.assertEqual(agg['count_power'], 3)
+        self.assertEqual((agg['min_power'], agg['max_power']), (100.0, 300.0))
+        self.assertEqual((agg['first_at'], agg['first_energy'], agg['first_power']), (T0, 10.0, 100.0))
+        self.assertEqual((agg['last_energy'], agg['last_power']), (10.9, 200.0))
+
+    def test_null_fields_not_counted(self):
+        rows = [
+            sample(0, voltage=220.0, power=100.0, power_factor=None),
+            sample(10, voltage=None, current=None, power=300.0, frequency=None),
+            sample(20, voltage=230.0, power=None, power_factor=None),
+        ]
+        agg = aggregate_rows(rows, 60)[('01', T0)]
+
+        self.assertEqual(agg['sample_count'], 3)
+        self.assertEqual((agg['count_voltage'], agg['count_current'], agg['count_power']), (2, 2, 2))
+        self.assertEqual((agg['count_frequency'], agg['count_power_factor']), (2, 1))
+        self.assertEqual(agg['count_apparent_power'], 2)
+        # Rata-rata tidak bias ke bawah oleh sampel NULL
+        self.assertEqual(agg['sum_voltage'] / agg['count_voltage'], 225.0)
+        self.assertEqual(agg['sum_power'] / agg['count_power'], 200.0)
+        self.assertEqual(agg['sum_power_factor'] / agg['count_power_factor'], 0.9)
+        self.assertEqual((agg['min_voltage'], agg['max_voltage']), (220.0, 230.0))
+
+    def test_split_per_device_and_bucket(self):
+        rows = [sample(0), sample(61), sample(0, device_address='02')]
+        buckets = aggregate_rows(rows, 60)
+
+        self.assertEqual(sorted(buckets), [('01', T0), ('01', T0 + timedelta(minutes=1)), ('02', T0)])
+
+
+class ReportFromRollupTest(unittest.TestCase):
+    def test_report_averages_skip_null_readings(self):
+        rows = [sample(seconds, power=None if seconds % 1200 == 0 else 400.0, energy=10.0 + seconds / 3600)
+                for seconds in range(0, 3600, 60)]
+        agg = aggregate_rows(rows, 3600)[('01', T0)]
+
+        phase_data, time_series = build_report_data([report_row(agg)])
+
+        self.assertEqual(phase_data[0]['total_records'], 60)
+        self.assertEqual(phase_data[0]['avg_power'], 400.0)
+        self.assertEqual(phase_data[0]['avg_voltage'], 220.0)
+        self.assertEqual(time_series[0]['power'], 400.0)
+
+
+if __name__ == '__main__':
+    unittest.main()